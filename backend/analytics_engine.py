@@ -1,20 +1,27 @@
 # analytics_engine.py
 # SpyAds Pro — Validazione + Trend Analysis (YouTube)
-# Uso: python analytics_engine.py
+# Uso: python analytics_engine.py [--sql | --incremental [--rebuild]]
 
 import sqlite3
+import argparse
+import time
+import numpy as np
 import pandas as pd
-from pathlib import Path
-from datetime import datetime
+from storage import ensure_schema, HISTORY_SQL, ESTRAZIONE_FMT
+from report_store import write_run, apply_retention, STORE_DIR
+from analytics_sql import validation_summary_sql, trend_per_video_sql, trend_per_keyword_sql
+from analytics_incremental import reset_state, update_state, get_watermark, trends
 
 DB_PATH = "spyads.db"
-OUT_DIR = Path("reports")
-OUT_DIR.mkdir(exist_ok=True)
 
 def _load_df():
     con = sqlite3.connect(DB_PATH)
     try:
-        df = pd.read_sql_query("SELECT * FROM youtube_ads", con)
+        # storico completo (una riga per estrazione); youtube_ads ha solo l'ultimo stato
+        ensure_schema(con)
+        df = pd.read_sql_query(HISTORY_SQL, con)
+        if df.empty:
+            df = pd.read_sql_query("SELECT * FROM youtube_ads", con)
     finally:
         con.close()
     if df.empty:
@@ -32,7 +39,8 @@ def _coerce_types(df: pd.DataFrame) -> pd.DataFrame:
     df["likes"]    = pd.to_numeric(df["likes"], errors="coerce").fillna(0).astype(int)
     df["comments"] = pd.to_numeric(df["comments"], errors="coerce").fillna(0).astype(int)
     df["engagement_rate"] = pd.to_numeric(df["engagement_rate"], errors="coerce").fillna(0.0).astype(float)
-    df["estrazione_dt"] = pd.to_datetime(df["estrazione"], errors="coerce")
+    # formato unico garantito dallo storage: parsing a formato fisso, niente inferenza
+    df["estrazione_dt"] = pd.to_datetime(df["estrazione"], format=ESTRAZIONE_FMT, errors="coerce")
     df["data_pubblicazione_dt"] = pd.to_datetime(df["data_pubblicazione"], errors="coerce")
     df["keyword"] = df["keyword"].astype(str).str.strip().str.lower()
     df["region"]  = df["region"].astype(str).str.upper().str.strip()
@@ -42,7 +50,9 @@ def validate_df(df: pd.DataFrame) -> dict:
     rep = {}
     rep["rows_total"] = len(df)
     rep["null_video_id"] = int(df["video_id"].isna().sum())
-    rep["dup_video_id"]  = int(df.duplicated(subset=["video_id"], keep=False).sum())
+    # df è lo storico: lo stesso video_id ricorre a ogni estrazione, è duplicato solo
+    # se ripetuto nella stessa estrazione per la stessa keyword/region
+    rep["dup_video_id"]  = int(df.duplicated(subset=["video_id","estrazione","keyword","region"], keep=False).sum())
     rep["invalid_dates"] = int(df["estrazione_dt"].isna().sum())
     # sospetti: views == 0 ma likes > 0
     rep["suspicious"] = int(((df["views"] == 0) & (df["likes"] > 0)).sum())
@@ -54,6 +64,20 @@ def _pct(a, b):
         return 0.0
     return round((a - b) / b * 100.0, 2)
 
+def _pct_vec(a: pd.Series, b: pd.Series) -> pd.Series:
+    """Versione vettoriale di _pct: base mancante o zero -> 0.0."""
+    b = b.fillna(0).astype(float)
+    safe = b.where(b != 0, np.nan)
+    raw = (a - b) / safe * 100.0
+    out = raw.round(2)
+    # np.round passa per x*100 e sui casi "a metà" può differire da round() di
+    # Python: quei pochi valori vengono ricalcolati con round() per avere output identico
+    scaled = raw.to_numpy() * 100.0
+    near_half = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6
+    if near_half.any():
+        out[near_half] = [round(v, 2) for v in raw[near_half]]
+    return out.fillna(0.0)
+
 def trend_per_video(df: pd.DataFrame) -> pd.DataFrame:
     """
     Calcola trend (Δ%) per singolo video_id confrontando l'ultima estrazione
@@ -62,22 +86,32 @@ def trend_per_video(df: pd.DataFrame) -> pd.DataFrame:
     if df["estrazione_dt"].isna().all():
         return pd.DataFrame()
 
+    # lo stesso video può comparire per più keyword nella stessa estrazione:
+    # resta la riga con (keyword, region) maggiore, come in analytics_sql
+    df = df[df["video_id"].notna()].sort_values(["video_id","estrazione_dt","keyword","region"], kind="stable")
+    df = df.drop_duplicates(subset=["video_id","estrazione_dt"], keep="last")
     df = df.sort_values(["video_id","estrazione_dt"])
-    last = df.groupby("video_id").tail(1).rename(columns={
-        "views":"views_now", "likes":"likes_now", "comments":"comments_now", "engagement_rate":"er_now"
-    })
-    prev = df.groupby("video_id").nth(-2).reset_index().rename(columns={
-        "views":"views_prev", "likes":"likes_prev", "comments":"comments_prev", "engagement_rate":"er_prev"
-    })
 
-    merged = pd.merge(last[["video_id","titolo","canale","keyword","region","views_now","likes_now","comments_now","er_now","estrazione_dt"]],
-                      prev[["video_id","views_prev","likes_prev","comments_prev","er_prev"]],
-                      on="video_id", how="left")
+    # nel frame ordinato il valore precedente del gruppo è lo snapshot "prev"
+    metrics = ["views","likes","comments","engagement_rate"]
+    prev = df.groupby("video_id", sort=False)[metrics].shift(1)
+    is_last = ~df["video_id"].duplicated(keep="last").to_numpy()
+
+    merged = df.loc[is_last, ["video_id","titolo","canale","keyword","region",
+                              "views","likes","comments","engagement_rate","estrazione_dt"]]
+    merged = merged.rename(columns={
+        "views":"views_now", "likes":"likes_now", "comments":"comments_now", "engagement_rate":"er_now"
+    }).reset_index(drop=True)
+    prev = prev[is_last].reset_index(drop=True)
+    for src, dst in zip(metrics, ["views_prev","likes_prev","comments_prev","er_prev"]):
+        col = prev[src]
+        # senza NaN conserva il dtype originale (int), come faceva il merge
+        merged[dst] = col if col.isna().any() else col.astype(df[src].dtype)
 
     # calcola Δ%
-    merged["Δviews_%"] = merged.apply(lambda r: _pct(r["views_now"], r["views_prev"] if pd.notna(r["views_prev"]) else 0), axis=1)
-    merged["Δlikes_%"] = merged.apply(lambda r: _pct(r["likes_now"], r["likes_prev"] if pd.notna(r["likes_prev"]) else 0), axis=1)
-    merged["ΔER_%"]    = merged.apply(lambda r: _pct(r["er_now"],    r["er_prev"]    if pd.notna(r["er_prev"])    else 0), axis=1)
+    merged["Δviews_%"] = _pct_vec(merged["views_now"], merged["views_prev"])
+    merged["Δlikes_%"] = _pct_vec(merged["likes_now"], merged["likes_prev"])
+    merged["ΔER_%"]    = _pct_vec(merged["er_now"],    merged["er_prev"])
 
     # ordina per crescita ER
     merged = merged.sort_values("ΔER_%", ascending=False)
@@ -116,25 +150,24 @@ def trend_per_keyword(df: pd.DataFrame) -> pd.DataFrame:
     )
 
     m = pd.merge(g_now, g_prev, on="keyword", how="left")
-    m["Δviews_%"] = m.apply(lambda r: _pct(r["views_now"], r["views_prev"] if pd.notna(r["views_prev"]) else 0), axis=1)
-    m["Δlikes_%"] = m.apply(lambda r: _pct(r["likes_now"], r["likes_prev"] if pd.notna(r["likes_prev"]) else 0), axis=1)
-    m["ΔER_%"]    = m.apply(lambda r: _pct(r["er_now"],    r["er_prev"]    if pd.notna(r["er_prev"])    else 0), axis=1)
+    m["Δviews_%"] = _pct_vec(m["views_now"], m["views_prev"])
+    m["Δlikes_%"] = _pct_vec(m["likes_now"], m["likes_prev"])
+    m["ΔER_%"]    = _pct_vec(m["er_now"],    m["er_prev"])
 
     m = m.sort_values("ΔER_%", ascending=False)
     m["snap_prev"] = snap_prev
     m["snap_now"]  = snap_now
     return m
 
-def save_reports(df_valid: pd.DataFrame, per_video: pd.DataFrame, per_kw: pd.DataFrame):
-    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    p_base = OUT_DIR / f"analytics_{ts}"
-    p_base.mkdir(exist_ok=True)
-
-    df_valid.to_csv(p_base / "dataset_clean.csv", index=False)
-    per_video.to_csv(p_base / "trend_per_video.csv", index=False)
-    per_kw.to_csv(p_base / "trend_per_keyword.csv", index=False)
-
-    print(f"\n📁 Report salvati in: {p_base}")
+def save_reports(per_video: pd.DataFrame, per_kw: pd.DataFrame):
+    """
+    Aggiunge i trend del run allo store Parquet partizionato (run_date/keyword).
+    Il dataset pulito non viene più copiato a ogni run: è già interrogabile dal DB.
+    """
+    written = write_run({"trend_per_video": per_video, "trend_per_keyword": per_kw})
+    apply_retention()
+    print(f"\n📁 Report aggiunti allo store {STORE_DIR}: "
+          + ", ".join(f"{k}={n} righe" for k, n in written.items()))
 
 def print_console_summary(val_report: dict, per_video: pd.DataFrame, per_kw: pd.DataFrame):
     print("\n================ VALIDATION SUMMARY ================")
@@ -151,6 +184,42 @@ def print_console_summary(val_report: dict, per_video: pd.DataFrame, per_kw: pd.
         cols = ["video_id","titolo","canale","keyword","ΔER_%","views_now","likes_now"]
         print(per_video[cols].head(5).to_string(index=False))
 
+def main_incremental(rebuild: bool = False):
+    """Aggiorna lo stato materializzato con i soli snapshot nuovi e ne ricava i trend."""
+    t0 = time.perf_counter()
+    con = sqlite3.connect(DB_PATH)
+    try:
+        ensure_schema(con)
+        if rebuild:
+            reset_state(con)
+        n_new = update_state(con)
+        val = {"snapshot_nuovi": n_new, "watermark": get_watermark(con)}
+        per_vid, per_kw = trends(con)
+    finally:
+        con.close()
+
+    save_reports(per_vid, per_kw)
+    print_console_summary(val, per_vid, per_kw)
+    print(f"\n✅ Analytics incrementale completata in {time.perf_counter() - t0:.3f}s.")
+
+def main_sql():
+    """Validazione e trend calcolati in SQLite: la memoria non cresce con la tabella."""
+    t0 = time.perf_counter()
+    con = sqlite3.connect(DB_PATH)
+    try:
+        val = validation_summary_sql(con)
+        if val["rows_total"] == 0:
+            print("⚠️  Nessun dato in youtube_ads.")
+            return
+        per_vid = trend_per_video_sql(con)
+        per_kw = trend_per_keyword_sql(con)
+    finally:
+        con.close()
+
+    save_reports(per_vid, per_kw)
+    print_console_summary(val, per_vid, per_kw)
+    print(f"\n✅ Analytics (SQL) completata in {time.perf_counter() - t0:.3f}s.")
+
 def main():
     df = _load_df()
     if df.empty:
@@ -159,17 +228,25 @@ def main():
     df = _coerce_types(df)
     val = validate_df(df)
 
-    # versione “clean” per output (dedup per video_id, tieni ultima estrazione)
-    df_clean = (df.sort_values(["video_id","estrazione_dt"])
-                  .drop_duplicates(subset=["video_id"], keep="last")
-                  .reset_index(drop=True))
-
     per_vid = trend_per_video(df)
     per_kw  = trend_per_keyword(df)
 
-    save_reports(df_clean, per_vid, per_kw)
+    save_reports(per_vid, per_kw)
     print_console_summary(val, per_vid, per_kw)
     print("\n✅ Analytics completata.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    ap = argparse.ArgumentParser(description="SpyAds Pro — Validazione + Trend Analysis")
+    ap.add_argument("--sql", action="store_true",
+                    help="calcola validazione e trend in SQLite con window function")
+    ap.add_argument("--incremental", action="store_true",
+                    help="legge solo gli snapshot oltre il watermark e aggiorna lo stato materializzato")
+    ap.add_argument("--rebuild", action="store_true",
+                    help="con --incremental: azzera stato e watermark prima dell'aggiornamento")
+    args = ap.parse_args()
+    if args.sql:
+        main_sql()
+    elif args.incremental:
+        main_incremental(rebuild=args.rebuild)
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,161 @@
+# analytics_incremental.py
+# SpyAds Pro — Trend incrementali: legge solo gli snapshot oltre il watermark
+# e aggiorna lo stato materializzato (ultimo + precedente) per video e keyword.
+# Uso: python analytics_engine.py --incremental [--rebuild]
+
+import sqlite3
+import pandas as pd
+
+from storage import current_version, SNAPSHOT_SEQ
+from analytics_sql import pct_sql
+
+# tabelle di stato: storage.TREND_STATE_SCHEMA_SQL (migrazioni 9, 10 e 11)
+WATERMARK = "trend_state"
+
+# In UPDATE SET SQLite valuta ogni espressione sulla riga *vecchia*: "prev = now"
+# sposta lo stato corrente nel precedente prima di sovrascriverlo.
+# Uno snapshot più recente di now diventa now (e now passa in prev); uno
+# arrivato in ritardo, tra prev e now, prende il posto di prev.
+# Lo stesso video estratto per più keyword nello stesso istante vale una volta
+# sola: vince la riga con (keyword, region) maggiore, come dup_rank in
+# analytics_sql. Il risultato non dipende dall'ordine delle righe e riapplicare
+# una riga già vista non cambia nulla.
+_VIDEO_METRICS = ("estrazione", "views", "likes", "comments", "er")
+_VIDEO_KEY = "(excluded.estrazione_now, excluded.keyword, excluded.region)"
+_VIDEO_SHIFT = "excluded.estrazione_now > estrazione_now"
+_VIDEO_NOW = (f"{_VIDEO_SHIFT} OR (excluded.estrazione_now = estrazione_now"
+              " AND (excluded.keyword, excluded.region) > (keyword, region))")
+_VIDEO_PREV = (f"excluded.estrazione_now < estrazione_now AND (estrazione_prev IS NULL"
+               f" OR {_VIDEO_KEY} > (estrazione_prev, keyword_prev, region_prev))")
+
+VIDEO_UPSERT_SQL = """
+INSERT INTO video_trend_state (video_id, keyword, region, estrazione_now,
+                               views_now, likes_now, comments_now, er_now)
+VALUES (?,?,?,?,?,?,?,?)
+ON CONFLICT(video_id) DO UPDATE SET
+""" + ",\n".join(
+    f"    {m}_prev=CASE WHEN {_VIDEO_SHIFT} THEN {now} WHEN {_VIDEO_PREV} THEN excluded.{now} ELSE {m}_prev END,\n"
+    f"    {now}=CASE WHEN {_VIDEO_NOW} THEN excluded.{now} ELSE {now} END"
+    for m, now in [("keyword", "keyword"), ("region", "region")]
+                  + [(m, f"{m}_now") for m in _VIDEO_METRICS]) + f"""
+WHERE {_VIDEO_NOW}
+   OR ({_VIDEO_PREV});
+"""
+
+# Per keyword le medie sono per minuto e vengono ricalcolate sull'intero
+# minuto a ogni update che lo tocca: righe arrivate in ritardo per il minuto
+# corrente (o per quello precedente) si fondono invece di essere scartate.
+_KEYWORD_METRICS = ("snap", "views", "likes", "er", "n")
+
+KEYWORD_UPSERT_SQL = """
+INSERT INTO keyword_trend_state (keyword, snap_now, views_now, likes_now, er_now, n_now)
+VALUES (?,?,?,?,?,?)
+ON CONFLICT(keyword) DO UPDATE SET
+""" + ",\n".join(
+    f"    {m}_prev=CASE WHEN excluded.snap_now > snap_now THEN {m}_now\n"
+    f"                  WHEN excluded.snap_now < snap_now THEN excluded.{m}_now ELSE {m}_prev END,\n"
+    f"    {m}_now=CASE WHEN excluded.snap_now >= snap_now THEN excluded.{m}_now ELSE {m}_now END"
+    for m in _KEYWORD_METRICS) + """
+WHERE excluded.snap_now >= keyword_trend_state.snap_now
+   OR keyword_trend_state.snap_prev IS NULL
+   OR excluded.snap_now >= keyword_trend_state.snap_prev;
+"""
+
+# medie dei minuti (per keyword) toccati dai nuovi batch, su tutte le righe del
+# minuto: uno sweep toccato ha seq oltre il watermark (range scan su idx_sweeps_seq)
+KEYWORD_MINUTES_SQL = """
+WITH touched AS (
+    SELECT DISTINCT keyword, substr(estrazione, 1, 16) AS snap
+    FROM snapshot_sweeps WHERE seq > ? AND seq <= ?
+)
+SELECT t.keyword, t.snap, AVG(s.views), AVG(s.likes), AVG(s.engagement_rate), COUNT(s.video_id)
+FROM touched t
+JOIN video_observations s ON s.keyword = t.keyword
+ AND s.estrazione BETWEEN t.snap || ':00Z' AND t.snap || ':59Z'
+GROUP BY t.keyword, t.snap
+ORDER BY t.snap
+"""
+
+# osservazioni nuove dopo il watermark: righe scritte o allungate dopo il
+# watermark, ristrette agli sweep toccati dopo il watermark (quelle degli
+# sweep precedenti erano già state lette). Riletture e sweep in ritardo sono
+# innocui: gli upsert non dipendono dall'ordine e ignorano le righe già viste.
+OBSERVATIONS_SINCE_SQL = """
+SELECT video_id, keyword, region, estrazione, views, likes, comments, engagement_rate
+FROM video_observations WHERE seq > ? AND seq <= ? AND sweep_seq > ?
+"""
+
+
+TREND_PER_VIDEO_SQL = f"""
+SELECT t.video_id, v.titolo, v.canale, t.keyword, t.region,
+       t.views_now, t.likes_now, t.comments_now, t.er_now, t.estrazione_now AS estrazione_dt,
+       t.views_prev, t.likes_prev, t.comments_prev, t.er_prev,
+       {pct_sql("t.views_now", "t.views_prev")} AS "Δviews_%",
+       {pct_sql("t.likes_now", "t.likes_prev")} AS "Δlikes_%",
+       {pct_sql("t.er_now", "t.er_prev")} AS "ΔER_%"
+FROM video_trend_state t
+LEFT JOIN videos v ON v.video_id = t.video_id
+ORDER BY "ΔER_%" DESC
+"""
+
+TREND_PER_KEYWORD_SQL = f"""
+SELECT keyword, views_now, likes_now, er_now, n_now,
+       views_prev, likes_prev, er_prev, n_prev,
+       {pct_sql("views_now", "views_prev")} AS "Δviews_%",
+       {pct_sql("likes_now", "likes_prev")} AS "Δlikes_%",
+       {pct_sql("er_now", "er_prev")} AS "ΔER_%",
+       snap_prev, snap_now
+FROM keyword_trend_state
+WHERE snap_prev IS NOT NULL
+ORDER BY "ΔER_%" DESC
+"""
+
+
+def get_watermark(con: sqlite3.Connection) -> int:
+    row = con.execute("SELECT seq FROM analytics_watermark WHERE name=?", (WATERMARK,)).fetchone()
+    return row[0] if row else 0
+
+
+def reset_state(con: sqlite3.Connection):
+    """Azzera stato e watermark: il prossimo update rilegge tutto lo storico."""
+    with con:
+        con.execute("DELETE FROM video_trend_state")
+        con.execute("DELETE FROM keyword_trend_state")
+        con.execute("DELETE FROM analytics_watermark WHERE name=?", (WATERMARK,))
+
+
+def update_state(con: sqlite3.Connection) -> int:
+    """
+    Applica allo stato materializzato gli snapshot committati dopo il
+    watermark: le osservazioni di righe e sweep toccati dopo il watermark
+    (OBSERVATIONS_SINCE_SQL). Ritorna il numero di osservazioni lette.
+    """
+    wm = get_watermark(con)
+    # letture da un'unica istantanea (WAL): il limite superiore e le righe
+    # lette sono dello stesso commit; i batch successivi hanno seq più alto
+    con.execute("BEGIN")
+    try:
+        hi = current_version(con, SNAPSHOT_SEQ)
+        if hi <= wm:
+            return 0
+        new = con.execute(OBSERVATIONS_SINCE_SQL + " ORDER BY estrazione, keyword, region",
+                          (wm, hi, wm)).fetchall()
+        kw_groups = con.execute(KEYWORD_MINUTES_SQL, (wm, hi)).fetchall()
+    finally:
+        con.commit()
+
+    with con:
+        con.executemany(VIDEO_UPSERT_SQL, new)
+        con.executemany(KEYWORD_UPSERT_SQL, kw_groups)
+        con.execute("""
+            INSERT INTO analytics_watermark (name, seq) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET seq=excluded.seq
+        """, (WATERMARK, hi))
+    return len(new)
+
+
+def trends(con: sqlite3.Connection) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """(trend_per_video, trend_per_keyword) letti dallo stato materializzato."""
+    per_vid = pd.read_sql_query(TREND_PER_VIDEO_SQL, con)
+    per_kw = pd.read_sql_query(TREND_PER_KEYWORD_SQL, con)
+    return per_vid, per_kw
@@ -0,0 +1,134 @@
+# analytics_sql.py
+# SpyAds Pro — Analytics calcolate dentro SQLite (window function + GROUP BY):
+# in Python arrivano solo le righe risultato, non l'intera tabella.
+# Uso: python analytics_engine.py --sql
+
+import sqlite3
+import pandas as pd
+
+from storage import ensure_schema, duplicate_counts
+
+
+def pct_sql(now: str, prev: str) -> str:
+    # stessa semantica di analytics_engine._pct: 0.0 se manca la base o è zero
+    return (f"CASE WHEN {prev} IS NULL OR {prev} = 0 THEN 0.0 "
+            f"ELSE ROUND(({now} - {prev}) * 100.0 / {prev}, 2) END")
+
+
+# ultimo e penultimo snapshot per video; lo stesso video estratto per più
+# keyword nella stessa estrazione conta una volta sola (dup_rank = 1)
+TREND_PER_VIDEO_SQL = f"""
+WITH snaps AS (
+    SELECT video_id, estrazione, keyword, region, views, likes, comments, engagement_rate,
+           ROW_NUMBER() OVER (PARTITION BY video_id, estrazione
+                              ORDER BY keyword DESC, region DESC) AS dup_rank
+    FROM video_observations
+),
+ordered AS (
+    SELECT video_id, estrazione, keyword, region, views, likes, comments, engagement_rate,
+           LAG(views)           OVER w AS views_prev,
+           LAG(likes)           OVER w AS likes_prev,
+           LAG(comments)        OVER w AS comments_prev,
+           LAG(engagement_rate) OVER w AS er_prev,
+           ROW_NUMBER() OVER (PARTITION BY video_id ORDER BY estrazione DESC) AS rn
+    FROM snaps
+    WHERE dup_rank = 1
+    WINDOW w AS (PARTITION BY video_id ORDER BY estrazione)
+)
+SELECT o.video_id, v.titolo, v.canale, o.keyword, o.region,
+       o.views AS views_now, o.likes AS likes_now, o.comments AS comments_now,
+       o.engagement_rate AS er_now, o.estrazione AS estrazione_dt,
+       o.views_prev, o.likes_prev, o.comments_prev, o.er_prev,
+       {pct_sql("o.views", "o.views_prev")} AS "Δviews_%",
+       {pct_sql("o.likes", "o.likes_prev")} AS "Δlikes_%",
+       {pct_sql("o.engagement_rate", "o.er_prev")} AS "ΔER_%"
+FROM ordered o
+LEFT JOIN videos v ON v.video_id = o.video_id
+WHERE o.rn = 1
+ORDER BY "ΔER_%" DESC
+"""
+
+# medie per keyword nelle ultime due estrazioni globali (al minuto); i minuti
+# vengono dal registro degli sweep, le righe solo da quei due minuti in poi
+TREND_PER_KEYWORD_SQL = f"""
+WITH snaps AS (
+    SELECT DISTINCT substr(estrazione, 1, 16) AS snap
+    FROM snapshot_sweeps WHERE julianday(estrazione) IS NOT NULL
+    ORDER BY snap DESC LIMIT 2
+),
+bounds AS (
+    SELECT MAX(snap) AS snap_now, MIN(snap) AS snap_prev, COUNT(*) AS n FROM snaps
+),
+agg AS (
+    SELECT s.keyword, substr(s.estrazione, 1, 16) AS snap,
+           AVG(s.views) AS views, AVG(s.likes) AS likes,
+           AVG(s.engagement_rate) AS er, COUNT(s.video_id) AS n
+    FROM video_observations s, bounds b
+    WHERE b.n = 2 AND s.estrazione >= b.snap_prev || ':00Z'
+      AND substr(s.estrazione, 1, 16) IN (b.snap_now, b.snap_prev)
+    GROUP BY s.keyword, snap
+)
+SELECT c.keyword, c.views AS views_now, c.likes AS likes_now, c.er AS er_now, c.n AS n_now,
+       p.views AS views_prev, p.likes AS likes_prev, p.er AS er_prev, p.n AS n_prev,
+       {pct_sql("c.views", "p.views")} AS "Δviews_%",
+       {pct_sql("c.likes", "p.likes")} AS "Δlikes_%",
+       {pct_sql("c.er", "p.er")} AS "ΔER_%",
+       b.snap_prev, b.snap_now
+FROM agg c
+JOIN bounds b ON c.snap = b.snap_now
+LEFT JOIN agg p ON p.keyword = c.keyword AND p.snap = b.snap_prev
+ORDER BY "ΔER_%" DESC
+"""
+
+
+def _columns(con: sqlite3.Connection, table: str) -> list[str]:
+    return [r[1] for r in con.execute(f"PRAGMA table_info({table});")]
+
+
+def trend_per_video_sql(con: sqlite3.Connection) -> pd.DataFrame:
+    ensure_schema(con)
+    return pd.read_sql_query(TREND_PER_VIDEO_SQL, con)
+
+
+def trend_per_keyword_sql(con: sqlite3.Connection) -> pd.DataFrame:
+    ensure_schema(con)
+    return pd.read_sql_query(TREND_PER_KEYWORD_SQL, con)
+
+
+def null_counts(con: sqlite3.Connection, table: str = "youtube_ads") -> dict[str, int]:
+    """Valori NULL per colonna, in un solo passaggio sulla tabella."""
+    cols = _columns(con, table)
+    if not cols:
+        return {}
+    exprs = ", ".join(f'SUM("{c}" IS NULL)' for c in cols)
+    row = con.execute(f"SELECT {exprs} FROM {table}").fetchone()
+    return {c: int(n or 0) for c, n in zip(cols, row)}
+
+
+def negative_counts(con: sqlite3.Connection, table: str = "youtube_ads",
+                    cols: tuple[str, ...] = ("views", "likes", "comments")) -> dict[str, int]:
+    present = [c for c in cols if c in _columns(con, table)]
+    if not present:
+        return {}
+    exprs = ", ".join(f'SUM("{c}" < 0)' for c in present)
+    row = con.execute(f"SELECT {exprs} FROM {table}").fetchone()
+    return {c: int(n or 0) for c, n in zip(present, row)}
+
+
+def validation_summary_sql(con: sqlite3.Connection) -> dict:
+    """Stesse chiavi di analytics_engine.validate_df, calcolate sugli snapshot."""
+    ensure_schema(con)
+    row = con.execute("""
+        SELECT COUNT(*),
+               COALESCE(SUM(video_id IS NULL), 0),
+               COALESCE(SUM(julianday(estrazione) IS NULL), 0),
+               COALESCE(SUM(COALESCE(views, 0) = 0 AND likes > 0), 0)
+        FROM video_observations
+    """).fetchone()
+    return {
+        "rows_total": row[0],
+        "null_video_id": row[1],
+        "dup_video_id": duplicate_counts(con, "video_observations", ("video_id", "estrazione", "keyword", "region")),
+        "invalid_dates": row[2],
+        "suspicious": row[3],
+    }
@@ -0,0 +1,361 @@
+# api.py
+# SpyAds Pro — API FastAPI sopra lo storage SQLite
+# Uso: python -m uvicorn main:app --reload   (main.py riesporta `app`)
+#
+# Filtri, ordinamento e paginazione a cursore vengono eseguiti in SQL: la
+# dashboard riceve solo le colonne richieste di una pagina, compressa gzip e
+# con ETag per le richieste condizionali.
+
+import json
+import base64
+import hashlib
+import sqlite3
+import threading
+
+from fastapi import FastAPI, Query, Request, Response, HTTPException
+from fastapi.middleware.gzip import GZipMiddleware
+
+from storage import connect, ensure_schema, current_version, fts_query, FTS_RANK, ER_BUCKETS_PER_POINT
+from trending import open_engine
+
+DB_PATH = "spyads.db"
+MAX_PAGE_SIZE = 1000
+
+COLUMNS = ("video_id", "titolo", "canale", "data_pubblicazione", "views", "likes", "comments",
+           "region", "keyword", "estrazione", "engagement_rate")
+SORTABLE = {"views", "likes", "comments", "engagement_rate", "data_pubblicazione", "estrazione"}
+_TEXT_SORT = {"data_pubblicazione", "estrazione"}
+ROLLUP_DIMENSIONS = ("keyword", "canale", "region", "day")
+ROLLUP_PERCENTILES = (25, 50, 75, 90)
+
+app = FastAPI(title="SpyAds Pro API")
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+
+_schema_ready = False
+_trend_engine = None
+_trend_lock = threading.Lock()
+
+
+def _conn() -> sqlite3.Connection:
+    global _schema_ready
+    conn = connect(DB_PATH)
+    if not _schema_ready:
+        ensure_schema(conn)
+        _schema_ready = True
+    return conn
+
+
+def _encode_cursor(sort_value, video_id: str) -> str:
+    raw = json.dumps([sort_value, video_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        sort_value, video_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="cursor non valido")
+    return sort_value, video_id
+
+
+def _columns(fields: str | None) -> list[str]:
+    cols = [c for c in (fields.split(",") if fields else COLUMNS) if c in COLUMNS]
+    if "video_id" not in cols:
+        cols.insert(0, "video_id")
+    return cols
+
+
+# video_id che corrispondono alla query full-text (vedi storage.FTS_SCHEMA_SQL)
+_FTS_IDS_SQL = "SELECT v.video_id FROM videos_fts JOIN videos v ON v.rowid = videos_fts.rowid WHERE videos_fts MATCH ?"
+
+
+def _json_response(request: Request, payload: dict) -> Response:
+    """Risposta JSON con ETag; 304 se il client ha già questa versione."""
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode()
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get("/get_youtube_data")
+def get_youtube_data(
+    request: Request,
+    keyword: str | None = Query(None, description="keyword di estrazione (match esatto)"),
+    q: str | None = Query(None, description="parole cercate (come prefisso) in titolo o canale"),
+    canale: str | None = None,
+    region: str | None = None,
+    date_from: str | None = Query(None, description="pubblicati dal giorno (YYYY-MM-DD)"),
+    date_to: str | None = Query(None, description="pubblicati fino al giorno incluso (YYYY-MM-DD)"),
+    sort: str = "views",
+    order: str = "desc",
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    fields: str | None = Query(None, description="colonne separate da virgola"),
+):
+    if sort not in SORTABLE:
+        raise HTTPException(status_code=400, detail=f"sort ammessi: {sorted(SORTABLE)}")
+    desc = order.lower() != "asc"
+    cols = _columns(fields)
+
+    # NULL ordinati come valore neutro, così il cursore resta confrontabile
+    sort_expr = f"COALESCE({sort}, '')" if sort in _TEXT_SORT else f"COALESCE({sort}, 0)"
+    where, params = [], []
+    if keyword:
+        where.append("keyword = ?")
+        params.append(keyword)
+    if q and fts_query(q):
+        where.append(f"video_id IN ({_FTS_IDS_SQL})")
+        params.append(fts_query(q))
+    if canale:
+        where.append("canale = ?")
+        params.append(canale)
+    if region:
+        where.append("region = ?")
+        params.append(region.upper())
+    if date_from:
+        where.append("substr(data_pubblicazione, 1, 10) >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("substr(data_pubblicazione, 1, 10) <= ?")
+        params.append(date_to)
+    if cursor:
+        last_value, last_id = _decode_cursor(cursor)
+        op = "<" if desc else ">"
+        where.append(f"({sort_expr} {op} ? OR ({sort_expr} = ? AND video_id {op} ?))")
+        params += [last_value, last_value, last_id]
+
+    direction = "DESC" if desc else "ASC"
+    sql = (f"SELECT {', '.join(cols)}, {sort_expr} AS _sort FROM youtube_ads"
+           + (f" WHERE {' AND '.join(where)}" if where else "")
+           + f" ORDER BY _sort {direction}, video_id {direction} LIMIT ?")
+    params.append(limit + 1)
+
+    conn = _conn()
+    try:
+        # versione letta nella stessa transazione della query: è il "since" per /changes
+        conn.execute("BEGIN")
+        version = current_version(conn)
+        rows = conn.execute(sql, params).fetchall()
+        conn.rollback()
+    finally:
+        conn.close()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    data = [dict(zip(cols, r[:-1])) for r in rows]
+    vid_idx = cols.index("video_id")
+    next_cursor = _encode_cursor(rows[-1][-1], rows[-1][vid_idx]) if has_more else None
+    return _json_response(request, {"status": "ok", "data": data, "count": len(data),
+                                    "next_cursor": next_cursor, "version": version})
+
+
+@app.get("/changes")
+def changes(
+    request: Request,
+    since: int = Query(0, ge=0, description="ultima versione già ricevuta dal client"),
+    cursor: str | None = Query(None, description="pagina successiva della stessa sync"),
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    fields: str | None = Query(None, description="colonne separate da virgola"),
+):
+    """
+    Righe inserite o aggiornate dopo la versione `since` (range scan su
+    idx_youtube_ads_version). Il client ripete con `cursor` finché
+    `next_cursor` non è null, poi usa `version` come nuovo `since`.
+    """
+    cols = _columns(fields)
+
+    conn = _conn()
+    try:
+        conn.execute("BEGIN")
+        version = current_version(conn)
+        where, params = ["version > ?", "version <= ?"], [since, version]
+        if cursor:
+            last_version, last_id = _decode_cursor(cursor)
+            where.append("(version > ? OR (version = ? AND video_id > ?))")
+            params += [last_version, last_version, last_id]
+        rows = conn.execute(
+            f"SELECT {', '.join(cols)}, version FROM youtube_ads WHERE {' AND '.join(where)} "
+            f"ORDER BY version, video_id LIMIT ?", params + [limit + 1]).fetchall()
+        conn.rollback()
+    finally:
+        conn.close()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    vid_idx = cols.index("video_id")
+    next_cursor = _encode_cursor(rows[-1][-1], rows[-1][vid_idx]) if has_more else None
+    return _json_response(request, {"status": "ok", "data": [dict(zip(cols, r[:-1])) for r in rows],
+                                    "count": len(rows), "next_cursor": next_cursor, "version": version})
+
+
+@app.get("/search")
+def search(
+    request: Request,
+    q: str = Query(..., description="parole cercate (come prefisso) in titolo o canale"),
+    keyword: str | None = None,
+    canale: str | None = None,
+    region: str | None = None,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = Query(None, description="pagina successiva (restituito come next_cursor)"),
+    fields: str | None = Query(None, description="colonne separate da virgola"),
+):
+    """
+    Ricerca full-text su titolo e canale, risultati ordinati per rilevanza
+    (bm25, a parità per views). Ogni parola è un prefisso; tutte devono comparire.
+    """
+    match = fts_query(q)
+    if not match:
+        raise HTTPException(status_code=400, detail="q deve contenere almeno una parola")
+    cols = _columns(fields)
+    offset = 0
+    if cursor:
+        offset, _ = _decode_cursor(cursor)
+        if not isinstance(offset, int) or offset < 0:
+            raise HTTPException(status_code=400, detail="cursor non valido")
+
+    where, params = ["videos_fts MATCH ?"], [match]
+    for col, value in (("a.keyword", keyword), ("a.canale", canale),
+                       ("a.region", region.upper() if region else None)):
+        if value:
+            where.append(f"{col} = ?")
+            params.append(value)
+    sql = (f"SELECT {', '.join('a.' + c for c in cols)}, {FTS_RANK} AS _rank "
+           f"FROM videos_fts JOIN videos v ON v.rowid = videos_fts.rowid "
+           f"JOIN youtube_ads a ON a.video_id = v.video_id "
+           f"WHERE {' AND '.join(where)} ORDER BY _rank, a.views DESC, a.video_id LIMIT ? OFFSET ?")
+    params += [limit + 1, offset]
+
+    conn = _conn()
+    try:
+        conn.execute("BEGIN")
+        version = current_version(conn)
+        rows = conn.execute(sql, params).fetchall()
+        conn.rollback()
+    finally:
+        conn.close()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    data = [dict(zip(cols, r[:-1]), rank=round(r[-1], 4)) for r in rows]
+    next_cursor = _encode_cursor(offset + limit, "") if has_more else None
+    return _json_response(request, {"status": "ok", "data": data, "count": len(data),
+                                    "next_cursor": next_cursor, "version": version})
+
+
+@app.get("/channels")
+def channels(request: Request):
+    """Elenco canali distinti per il filtro della dashboard."""
+    conn = _conn()
+    try:
+        rows = conn.execute("SELECT DISTINCT canale FROM youtube_ads WHERE canale IS NOT NULL "
+                            "AND canale != '' ORDER BY canale").fetchall()
+    finally:
+        conn.close()
+    return _json_response(request, {"status": "ok", "data": [r[0] for r in rows]})
+
+
+@app.get("/trending")
+def trending(
+    request: Request,
+    keyword: str | None = None,
+    region: str | None = None,
+    limit: int = Query(20, ge=1, le=100),
+):
+    """
+    Video che salgono adesso (views/ora con EWMA e accelerazione). Il top-K è
+    in memoria: ogni richiesta applica solo gli snapshot arrivati dall'ultima
+    e, se non ne sono arrivati, non scrive sul db.
+    """
+    global _trend_engine
+    conn = _conn()
+    try:
+        with _trend_lock:
+            if _trend_engine is None:
+                _trend_engine = open_engine(conn)
+            else:
+                _trend_engine.refresh(conn)
+        hot = _trend_engine.hot(keyword, region.upper() if region else None, limit)
+        ids = [h["video_id"] for h in hot]
+        meta = {r[0]: r[1:] for r in conn.execute(
+            f"SELECT video_id, titolo, canale FROM videos WHERE video_id IN ({','.join('?' * len(ids))})",
+            ids).fetchall()} if ids else {}
+    finally:
+        conn.close()
+    data = [dict(h, titolo=meta.get(h["video_id"], (None, None))[0],
+                 canale=meta.get(h["video_id"], (None, None))[1]) for h in hot]
+    return _json_response(request, {"status": "ok", "data": data, "count": len(data)})
+
+
+def _hist_percentiles(hist: list[tuple[int, int]]) -> dict[str, float | None]:
+    """Percentili dell'engagement da un istogramma [(bucket, n)] ordinato: centro del bucket."""
+    total = sum(n for _, n in hist)
+    out = {}
+    for p in ROLLUP_PERCENTILES:
+        value, target, seen = None, p / 100 * total, 0
+        for bucket, n in hist:
+            seen += n
+            if seen >= target:
+                value = round((bucket + 0.5) / ER_BUCKETS_PER_POINT, 3)
+                break
+        out[f"er_p{p}"] = value
+    return out
+
+
+@app.get("/rollups")
+def rollups(
+    request: Request,
+    dimension: str = Query("keyword", description="keyword, canale, region o day"),
+    since: str | None = Query(None, description="primo giorno incluso (YYYY-MM-DD)"),
+    until: str | None = Query(None, description="ultimo giorno incluso (YYYY-MM-DD)"),
+    keyword: str | None = None,
+    canale: str | None = None,
+    region: str | None = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+):
+    """
+    Aggregati per dimensione letti da daily_rollups/daily_er_hist: video
+    osservati (per giorno), views totali e medie, percentili dell'engagement.
+    """
+    if dimension not in ROLLUP_DIMENSIONS:
+        raise HTTPException(status_code=400, detail=f"dimension deve essere una di {', '.join(ROLLUP_DIMENSIONS)}")
+    where, params = [], []
+    for cond, value in (("day >= ?", since), ("day <= ?", until), ("keyword = ?", keyword),
+                        ("canale = ?", canale), ("region = ?", region.upper() if region else None)):
+        if value:
+            where.append(cond)
+            params.append(value)
+    where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+    order = "day DESC" if dimension == "day" else "total_views DESC"
+
+    conn = _conn()
+    try:
+        groups = conn.execute(f"""
+            SELECT {dimension}, SUM(videos), SUM(views_sum) AS total_views, SUM(er_sum)
+            FROM daily_rollups {where_sql}
+            GROUP BY {dimension} ORDER BY {order}, {dimension} LIMIT ?
+        """, params + [limit]).fetchall()
+        keys = [g[0] for g in groups]
+        hist: dict[str, list] = {k: [] for k in keys}
+        if keys:
+            key_filter = f"{dimension} IN ({','.join('?' * len(keys))})"
+            rows = conn.execute(f"""
+                SELECT {dimension}, bucket, SUM(n) FROM daily_er_hist
+                WHERE {' AND '.join(where + [key_filter])}
+                GROUP BY {dimension}, bucket ORDER BY {dimension}, bucket
+            """, params + keys).fetchall()
+            for key, bucket, n in rows:
+                hist[key].append((bucket, n))
+    finally:
+        conn.close()
+
+    data = [{dimension: key, "videos": videos, "views_sum": views_sum,
+             "views_mean": round(views_sum / videos, 1) if videos else None,
+             "er_mean": round(er_sum / videos, 3) if videos else None,
+             **_hist_percentiles(hist[key])}
+            for key, videos, views_sum, er_sum in groups]
+    if dimension == "day":
+        data.reverse()     # in ordine cronologico per i grafici
+    return _json_response(request, {"status": "ok", "dimension": dimension, "data": data, "count": len(data)})
@@ -0,0 +1,169 @@
+# api_cache.py
+# SpyAds Pro — Cache su disco delle risposte YouTube Data API
+#
+# Chiave = endpoint + parametri normalizzati (senza API key). Ogni endpoint ha
+# il suo TTL; scaduta una voce, la richiesta parte con If-None-Match e un 304
+# la rinnova senza riscaricare il body. Oltre MAX_BYTES si eliminano le voci
+# usate meno di recente (LRU).
+#
+# Uso: python api_cache.py [--clear]   (mostra le statistiche della cache)
+
+import json
+import time
+import hashlib
+import argparse
+import threading
+from pathlib import Path
+from typing import Callable, TYPE_CHECKING
+
+from storage import connect
+
+if TYPE_CHECKING:
+    import requests
+
+CACHE_PATH = "api_cache.db"
+MAX_BYTES = 256 * 1024 * 1024
+
+# i risultati di ricerca cambiano lentamente, le statistiche dei video no
+ENDPOINT_TTL = {
+    "search.list": 6 * 3600,
+    "videos.list": 15 * 60,
+}
+
+# parametri che non cambiano la risposta
+_EXCLUDED_PARAMS = {"key"}
+
+CACHE_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS api_cache (
+    key TEXT PRIMARY KEY,
+    endpoint TEXT NOT NULL,
+    etag TEXT,
+    body TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_api_cache_last_access ON api_cache(last_access);
+"""
+
+
+def make_key(endpoint: str, params: dict) -> str:
+    """Chiave stabile: ordine dei parametri, spazi e maiuscole della query non contano."""
+    norm = {}
+    for k, v in params.items():
+        if k in _EXCLUDED_PARAMS or v is None:
+            continue
+        v = " ".join(str(v).split())
+        norm[k] = v.lower() if k == "q" else v
+    raw = json.dumps([endpoint, sorted(norm.items())], ensure_ascii=False)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache persistente (SQLite) condivisibile dai worker del collector.
+    Il file viene aperto alla prima richiesta, non alla costruzione.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, ttl: dict | None = None, max_bytes: int = MAX_BYTES):
+        self.path = Path(path)
+        self.ttl = {**ENDPOINT_TTL, **(ttl or {})}
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "revalidated": 0, "misses": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        self._conn = None
+        self._bytes = 0
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = connect(str(self.path))
+            self._conn.executescript(CACHE_SCHEMA_SQL)
+            self._bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM api_cache").fetchone()[0]
+        return self._conn
+
+    def _evict(self, conn):
+        """Elimina le voci meno usate finché la cache rientra in max_bytes."""
+        while self._bytes > self.max_bytes:
+            rows = conn.execute("SELECT key, size FROM api_cache ORDER BY last_access LIMIT 100").fetchall()
+            if not rows:
+                self._bytes = 0
+                return
+            for key, size in rows:
+                if self._bytes <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM api_cache WHERE key=?", (key,))
+                self._bytes -= size
+                self.stats["evicted"] += 1
+
+    def get(self, endpoint: str, params: dict, send: Callable[[dict], "requests.Response"]) -> dict:
+        """
+        JSON della richiesta, dalla cache se ancora valida. `send(headers)` esegue
+        la chiamata HTTP (quota ed errori inclusi) con gli header condizionali:
+        viene invocata solo per voci mancanti o scadute.
+        """
+        key = make_key(endpoint, params)
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            row = conn.execute("SELECT etag, body, fetched_at FROM api_cache WHERE key=?", (key,)).fetchone()
+            if row and now - row[2] < self.ttl.get(endpoint, 0):
+                with conn:
+                    conn.execute("UPDATE api_cache SET last_access=? WHERE key=?", (now, key))
+                self.stats["hits"] += 1
+                return json.loads(row[1])
+
+        headers = {"If-None-Match": row[0]} if row and row[0] else {}
+        r = send(headers)
+
+        with self._lock:
+            conn = self._db()
+            if r.status_code == 304 and row:
+                with conn:
+                    conn.execute("UPDATE api_cache SET fetched_at=?, last_access=? WHERE key=?", (now, now, key))
+                self.stats["revalidated"] += 1
+                return json.loads(row[1])
+            body = r.text
+            with conn:
+                old = conn.execute("SELECT size FROM api_cache WHERE key=?", (key,)).fetchone()
+                conn.execute("""
+                    INSERT OR REPLACE INTO api_cache (key, endpoint, etag, body, size, fetched_at, last_access)
+                    VALUES (?,?,?,?,?,?,?)
+                """, (key, endpoint, r.headers.get("ETag"), body, len(body), now, now))
+                self._bytes += len(body) - (old[0] if old else 0)
+                self._evict(conn)
+            self.stats["misses"] += 1
+        return json.loads(body)
+
+    def summary(self) -> dict:
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT endpoint, COUNT(*) FROM api_cache GROUP BY endpoint").fetchall()
+        return {"bytes": self._bytes, "max_bytes": self.max_bytes, "entries": dict(rows), **self.stats}
+
+    def clear(self):
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.execute("DELETE FROM api_cache")
+            self._bytes = 0
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Stato della cache risposte YouTube API")
+    ap.add_argument("--clear", action="store_true", help="svuota la cache")
+    args = ap.parse_args()
+    cache = ResponseCache()
+    if args.clear:
+        cache.clear()
+        print("🧹 Cache svuotata")
+    s = cache.summary()
+    print(f"💾 Cache: {s['bytes'] / 1e6:.1f} MB / {s['max_bytes'] / 1e6:.0f} MB")
+    for ep, n in s["entries"].items():
+        print(f"  · {ep}: {n} risposte (TTL {ENDPOINT_TTL.get(ep, 0)} s)")
+    cache.close()
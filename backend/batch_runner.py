@@ -0,0 +1,193 @@
+# batch_runner.py
+# SpyAds Pro — Raccolta batch non interattiva con checkpoint (per cron / scheduler)
+#
+# File job JSONL, un job per riga:
+#   {"keyword": "scarpe running", "region": "IT", "depth": 200, "priority": 2}
+# region (default US), depth (default 50), priority (default 0) e "id" sono opzionali.
+#
+# Ogni job completato viene aggiunto al file di checkpoint (JSONL, fsync):
+# rilanciando lo stesso comando dopo un'interruzione i job già chiusi vengono
+# saltati e non spendono altra quota. I job falliti o rimandati per quota
+# restano da fare e ripartono al run successivo.
+#
+# I job girano in ingest_pipeline.IngestPipeline: --workers thread di fetch,
+# un transform e un solo writer che committa a blocchi di --batch-size record.
+#
+# Uso: python batch_runner.py jobs.jsonl [--checkpoint jobs.checkpoint.jsonl]
+#                             [--workers 4] [--batch-size 500] [--db spyads.db] [--no-cache] [--reset]
+
+import os
+import sys
+import json
+import argparse
+import threading
+from pathlib import Path
+
+from youtube_api import YouTubeAds
+from ingest_pipeline import IngestPipeline, BATCH_SIZE
+from quota import plan_jobs
+from transport import Transport, latency_lines
+
+DEFAULT_WORKERS = 4
+DEFAULT_DEPTH = 50
+
+
+def load_jobs(path: str) -> list[dict]:
+    """Legge il file JSONL dei job; righe vuote e commenti (#) vengono ignorati."""
+    jobs = []
+    for n, line in enumerate(Path(path).read_text(encoding="utf-8").splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            raw = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"{path}:{n}: JSON non valido ({e})") from None
+        if not raw.get("keyword"):
+            raise ValueError(f"{path}:{n}: 'keyword' mancante")
+        job = {
+            "keyword": raw["keyword"],
+            "region": (raw.get("region") or "US").upper(),
+            "depth": int(raw.get("depth", DEFAULT_DEPTH)),
+            "priority": raw.get("priority", 0),
+        }
+        job["id"] = str(raw.get("id") or f"{job['keyword']}:{job['region']}:{job['depth']}")
+        jobs.append(job)
+    return jobs
+
+
+class Checkpoint:
+    """Registro append-only dei job completati; una riga scritta = job chiuso."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.done: dict[str, dict] = {}
+        if self.path.exists():
+            for line in self.path.read_text(encoding="utf-8").splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue     # ultima riga troncata da un'interruzione
+                self.done[entry["id"]] = entry
+
+    def mark_done(self, entry: dict):
+        with self._lock:
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.done[entry["id"]] = entry
+
+
+def run_batch(jobs: list[dict], checkpoint: Checkpoint, yt: YouTubeAds,
+              workers: int = DEFAULT_WORKERS, batch_size: int = BATCH_SIZE) -> dict:
+    """
+    Esegue i job non ancora in checkpoint nella pipeline fetch -> transform ->
+    writer, in ordine di priorità finché la quota li copre. Ritorna il riepilogo.
+    """
+    todo = [j for j in jobs if j["id"] not in checkpoint.done]
+    by_key = {(j["keyword"], j["region"], j["priority"], j["depth"], j["id"]): j for j in todo}
+    admitted, deferred = plan_jobs(list(by_key), yt.ledger)
+    quota_before = yt.ledger.used()
+
+    summary = {"jobs": len(jobs), "skipped": len(jobs) - len(todo), "ok": 0, "failed": 0,
+               "deferred": len(deferred), "deferred_ids": [k[4] for k in deferred],
+               "not_started": 0, "records": 0, "errors": [], "interrupted": False}
+
+    def record(job: dict, entry: dict, error: str | None):
+        # chiamata dal writer dopo il commit dei record del job
+        if entry["deferred"]:
+            # quota finita o Retry-After lungo a metà ricerca: niente checkpoint, si riprende più tardi
+            summary["deferred"] += 1
+            summary["deferred_ids"].append(job["id"])
+            summary["records"] += entry["n_records"]
+            print(f"[~] {job['id']}: rimandato dopo {entry['n_records']} record ({error})")
+            return
+        if error:
+            summary["failed"] += 1
+            summary["errors"].append((job["id"], error))
+            print(f"[!] {job['id']}: {error}")
+            return
+        checkpoint.mark_done(entry)
+        summary["ok"] += 1
+        summary["records"] += entry["n_records"]
+        print(f"[OK] {job['id']}: {entry['n_records']} record in {entry['elapsed_s']:.1f}s")
+
+    pipeline = IngestPipeline(yt, workers=workers, batch_size=batch_size)
+    result = pipeline.run([by_key[k] for k in admitted], on_job_done=record)
+    if result["interrupted"]:
+        # niente job nuovi; quelli in corso sono finiti e sono in checkpoint
+        summary["interrupted"] = True
+        print("\n⏹️  Interrotto: rilancia lo stesso comando per riprendere.")
+    if result["writer_error"] is not None:
+        e = result["writer_error"]
+        summary["errors"].append(("writer", f"{type(e).__name__}: {e}"))
+        # job con record o "done" ancora in coda: mai scritti, non in checkpoint
+        for job_id in result["unfinished"]:
+            summary["failed"] += 1
+            summary["errors"].append((job_id, f"non scritto, writer fallito: {type(e).__name__}"))
+    summary["not_started"] = len(result["not_started"])
+
+    summary["elapsed_s"] = result["elapsed_s"]
+    summary["quota_used"] = yt.ledger.used() - quota_before
+    summary["latency"] = latency_lines(yt.transport)
+    summary["unchanged"] = yt.unchanged
+    summary["db"] = {k: result[k] for k in ("inserted", "updated", "ignored", "commits")}
+    summary["stages"] = result["stages"]
+    summary["bottleneck"] = result["bottleneck"]
+    return summary
+
+
+def print_summary(s: dict):
+    elapsed = max(s["elapsed_s"], 1e-9)
+    print("\n📊 Riepilogo batch")
+    print(f"- job: {s['jobs']} totali, {s['skipped']} già completati, {s['ok']} ok, "
+          f"{s['failed']} falliti, {s['deferred']} rimandati, {s['not_started']} non avviati")
+    print(f"- throughput: {s['records']} record in {s['elapsed_s']:.1f}s "
+          f"({s['records'] / elapsed:.1f} record/s, {s['ok'] / elapsed * 60:.1f} job/min)")
+    db = s["db"]
+    print(f"- DB: +{db['inserted']} nuovi, {db['updated']} aggiornati, {s['unchanged']} invariati, "
+          f"{db['ignored']} ignorati in {db['commits']} commit")
+    for name, st in s["stages"].items():
+        mark = "  ← collo di bottiglia" if name == s["bottleneck"] and st["items"] else ""
+        print(f"- stadio {name} ({st['threads']}x): {st['items']} elementi, {st['items_per_s']}/s, "
+              f"occupato {st['utilization']:.0%}, attesa input {st['starved_s']:.1f}s, "
+              f"bloccato a valle {st['blocked_s']:.1f}s{mark}")
+    print(f"- quota spesa: {s['quota_used']} unità")
+    for line in s["latency"]:
+        print(f"- HTTP {line}")
+    for job_id, err in s["errors"]:
+        print(f"  [!] {job_id}: {err}")
+    for job_id in s["deferred_ids"]:
+        print(f"  [~] {job_id}: quota insufficiente o API da riprovare più tardi, da rieseguire")
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(description="Raccolta YouTube batch da file JSONL, con ripresa")
+    ap.add_argument("jobs", help="file JSONL con un job per riga")
+    ap.add_argument("--checkpoint", help="file dei job completati (default: <jobs>.checkpoint.jsonl)")
+    ap.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="thread di fetch")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="record per commit")
+    ap.add_argument("--db", default="spyads.db")
+    ap.add_argument("--no-cache", action="store_true", help="ignora la cache su disco delle risposte API")
+    ap.add_argument("--reset", action="store_true", help="cancella il checkpoint e riesegue tutto")
+    args = ap.parse_args(argv)
+
+    ckpt_path = args.checkpoint or str(Path(args.jobs).with_suffix(".checkpoint.jsonl"))
+    if args.reset and os.path.exists(ckpt_path):
+        os.remove(ckpt_path)
+    jobs = load_jobs(args.jobs)
+    checkpoint = Checkpoint(ckpt_path)
+
+    yt = YouTubeAds(db_path=args.db, transport=Transport(max_per_host=args.workers), use_cache=not args.no_cache)
+    try:
+        summary = run_batch(jobs, checkpoint, yt, workers=args.workers, batch_size=args.batch_size)
+    finally:
+        yt.close()
+    print_summary(summary)
+    return 1 if summary["failed"] or summary["interrupted"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
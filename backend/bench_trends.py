@@ -0,0 +1,132 @@
+# bench_trends.py
+# SpyAds Pro — Benchmark trend: vecchio percorso (apply riga per riga + nth/merge)
+# contro quello vettoriale di analytics_engine, su uno storico sintetico.
+# Uso: python bench_trends.py [--rows 1000000] [--snapshots 10]
+
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from analytics_engine import _pct, _coerce_types, trend_per_video, trend_per_keyword
+from storage import ESTRAZIONE_FMT
+
+
+# ---- implementazioni precedenti (riferimento) -------------------------------
+def legacy_trend_per_video(df: pd.DataFrame) -> pd.DataFrame:
+    if df["estrazione_dt"].isna().all():
+        return pd.DataFrame()
+
+    df = df.drop_duplicates(subset=["video_id","estrazione_dt"], keep="last")
+    df = df.sort_values(["video_id","estrazione_dt"])
+    last = df.groupby("video_id").tail(1).rename(columns={
+        "views":"views_now", "likes":"likes_now", "comments":"comments_now", "engagement_rate":"er_now"
+    })
+    prev = df.groupby("video_id").nth(-2).reset_index().rename(columns={
+        "views":"views_prev", "likes":"likes_prev", "comments":"comments_prev", "engagement_rate":"er_prev"
+    })
+
+    merged = pd.merge(last[["video_id","titolo","canale","keyword","region","views_now","likes_now","comments_now","er_now","estrazione_dt"]],
+                      prev[["video_id","views_prev","likes_prev","comments_prev","er_prev"]],
+                      on="video_id", how="left")
+
+    merged["Δviews_%"] = merged.apply(lambda r: _pct(r["views_now"], r["views_prev"] if pd.notna(r["views_prev"]) else 0), axis=1)
+    merged["Δlikes_%"] = merged.apply(lambda r: _pct(r["likes_now"], r["likes_prev"] if pd.notna(r["likes_prev"]) else 0), axis=1)
+    merged["ΔER_%"]    = merged.apply(lambda r: _pct(r["er_now"],    r["er_prev"]    if pd.notna(r["er_prev"])    else 0), axis=1)
+
+    merged = merged.sort_values("ΔER_%", ascending=False)
+    return merged
+
+def legacy_trend_per_keyword(df: pd.DataFrame) -> pd.DataFrame:
+    if df["estrazione_dt"].isna().all():
+        return pd.DataFrame()
+
+    snaps = sorted(df["estrazione_dt"].dropna().dt.floor("min").unique())
+    if len(snaps) < 2:
+        return pd.DataFrame()
+
+    snap_now  = snaps[-1]
+    snap_prev = snaps[-2]
+
+    cur  = df[df["estrazione_dt"] == snap_now]
+    prev = df[df["estrazione_dt"] == snap_prev]
+
+    g_now  = cur.groupby("keyword", as_index=False).agg(
+        views_now=("views","mean"),
+        likes_now=("likes","mean"),
+        er_now=("engagement_rate","mean"),
+        n_now=("video_id","count")
+    )
+    g_prev = prev.groupby("keyword", as_index=False).agg(
+        views_prev=("views","mean"),
+        likes_prev=("likes","mean"),
+        er_prev=("engagement_rate","mean"),
+        n_prev=("video_id","count")
+    )
+
+    m = pd.merge(g_now, g_prev, on="keyword", how="left")
+    m["Δviews_%"] = m.apply(lambda r: _pct(r["views_now"], r["views_prev"] if pd.notna(r["views_prev"]) else 0), axis=1)
+    m["Δlikes_%"] = m.apply(lambda r: _pct(r["likes_now"], r["likes_prev"] if pd.notna(r["likes_prev"]) else 0), axis=1)
+    m["ΔER_%"]    = m.apply(lambda r: _pct(r["er_now"],    r["er_prev"]    if pd.notna(r["er_prev"])    else 0), axis=1)
+
+    m = m.sort_values("ΔER_%", ascending=False)
+    m["snap_prev"] = snap_prev
+    m["snap_now"]  = snap_now
+    return m
+
+
+# ---- dati sintetici ----------------------------------------------------------
+def synthetic_history(rows: int, snapshots: int, seed: int = 42) -> pd.DataFrame:
+    """Storico di `rows` righe: ogni video è estratto fino a `snapshots` volte (~10% di estrazioni saltate)."""
+    rng = np.random.default_rng(seed)
+    n_videos = max(1, int(rows / (snapshots * 0.9)) + 1)
+    vid = np.repeat(np.arange(n_videos), snapshots)
+    snap = np.tile(np.arange(snapshots), n_videos)
+    base = pd.Timestamp("2025-01-01")
+    views = rng.integers(0, 1_000_000, len(vid))
+    likes = (views * rng.random(len(vid)) * 0.05).astype(int)
+    comments = (likes * rng.random(len(vid)) * 0.1).astype(int)
+    df = pd.DataFrame({
+        "video_id": pd.Series(vid).map("v{:07d}".format),
+        "titolo": "titolo",
+        "canale": pd.Series(vid % 500).map("canale{}".format),
+        "data_pubblicazione": "2024-06-01T00:00:00Z",
+        "views": views,
+        "likes": likes,
+        "comments": comments,
+        "keyword": pd.Series(vid % 200).map("kw{}".format),
+        "region": "US",
+        "estrazione": (base + pd.to_timedelta(snap, unit="h")).strftime(ESTRAZIONE_FMT),
+    })
+    df["engagement_rate"] = np.where(views > 0, (likes + comments) / np.maximum(views, 1) * 100, 0).round(3)
+    # ~10% di righe eliminate: video con un solo snapshot o con buchi
+    df = df[rng.random(len(df)) > 0.1].head(rows).reset_index(drop=True)
+    return _coerce_types(df)
+
+
+def _timed(fn, df):
+    t0 = time.perf_counter()
+    out = fn(df)
+    return out, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark trend vecchio vs vettoriale")
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--snapshots", type=int, default=10)
+    args = ap.parse_args()
+
+    df = synthetic_history(args.rows, args.snapshots)
+    print(f"📦 Storico sintetico: {len(df):,} righe, {df['video_id'].nunique():,} video\n")
+
+    for name, old_fn, new_fn in [("trend_per_video", legacy_trend_per_video, trend_per_video),
+                                 ("trend_per_keyword", legacy_trend_per_keyword, trend_per_keyword)]:
+        old, t_old = _timed(old_fn, df)
+        new, t_new = _timed(new_fn, df)
+        pd.testing.assert_frame_equal(old, new)
+        print(f"- {name:18} vecchio {t_old:8.3f}s   vettoriale {t_new:7.3f}s   "
+              f"x{t_old / max(t_new, 1e-9):.1f}   output identico ✅")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+# check_cdc.py
+# SpyAds Pro — Verifica del change-data-capture di StorageWriter. Gli stessi
+# sweep sintetici (video fermi, video che escono e rientrano, uno sweep scritto
+# in ritardo) vengono scritti con CDC attivo e disattivo:
+#   - con CDC lo storico deve avere esattamente le righe attese (una per
+#     cambio di valori, rientro o keyframe) e meno righe che senza CDC;
+#   - le osservazioni ricostruite, i trend su tutti i percorsi di lettura
+#     (pandas, SQL, incrementale, trending), gli aggregati giornalieri e lo
+#     storico dopo la retention devono essere identici.
+# Uso: python check_cdc.py [--videos 200] [--hours 48] [--step 4]
+#      exit code 1 se un controllo fallisce
+
+import sys
+import random
+import sqlite3
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from storage import StorageWriter, HISTORY_SQL, ESTRAZIONE_FMT, KEYFRAME_HOURS, _elapsed_hours
+from analytics_engine import _coerce_types, trend_per_video, trend_per_keyword
+from analytics_sql import trend_per_video_sql, trend_per_keyword_sql
+from analytics_incremental import update_state, trends
+from retention import run_retention
+from trending import open_engine
+
+KEYWORDS = ("crm", "vpn", "hosting", "corso inglese")
+BASE = datetime(2025, 1, 1)
+
+
+def synthetic_batches(videos: int, hours: int, step: int, seed: int = 7) -> list[list[dict]]:
+    """
+    Un batch per (sweep, keyword), uno sweep ogni `step` ore: ~un video su
+    tre cambia a ogni sweep (gli altri restano fermi fino al keyframe), ~5%
+    manca da uno sweep. Il penultimo sweep di KEYWORDS[0] arriva per ultimo.
+    """
+    rng = random.Random(seed)
+    counters = {f"v{i:05d}": [rng.randint(100, 10_000), rng.randint(0, 500), rng.randint(0, 50)]
+                for i in range(videos)}
+    batches = []
+    for h in range(0, hours, step):
+        est = (BASE + timedelta(hours=h)).strftime(ESTRAZIONE_FMT)
+        by_kw: dict[str, list[dict]] = {kw: [] for kw in KEYWORDS}
+        for i, (vid, c) in enumerate(counters.items()):
+            if h and rng.random() < 0.05:
+                continue
+            if h and rng.random() < 0.3:
+                c[0] += rng.randint(1, 2_000)
+                c[1] += rng.randint(0, 50)
+                c[2] += rng.randint(0, 5)
+            kw = KEYWORDS[i % len(KEYWORDS)]
+            by_kw[kw].append({"video_id": vid, "titolo": f"titolo {vid}", "canale": f"canale{i % 20}",
+                              "data_pubblicazione": "2024-06-01T00:00:00Z",
+                              "views": c[0], "likes": c[1], "comments": c[2],
+                              "engagement_rate": round((c[1] + c[2]) / c[0] * 100, 3),
+                              "keyword": kw, "region": "IT", "estrazione": est})
+        batches.extend(by_kw.values())
+    late = len(batches) - 2 * len(KEYWORDS)
+    batches.append(batches.pop(late))
+    return batches
+
+
+def expected_rows(batches: list[list[dict]]) -> int:
+    """
+    Righe dello storico con CDC e sweep scritti in ordine: per ogni serie una
+    riga nuova al primo sweep, a ogni cambio di valori, al rientro dopo uno
+    sweep mancato e quando la riga corrente ha KEYFRAME_HOURS.
+    """
+    sweeps: dict[tuple[str, str], set[str]] = {}
+    seen: dict[tuple[str, str, str], dict[str, tuple]] = {}
+    for r in (r for b in batches for r in b):
+        sweeps.setdefault((r["keyword"], r["region"]), set()).add(r["estrazione"])
+        values = (r["views"], r["likes"], r["comments"], r["engagement_rate"])
+        seen.setdefault((r["video_id"], r["keyword"], r["region"]), {})[r["estrazione"]] = values
+    rows = 0
+    for (_, kw, reg), obs in seen.items():
+        start = run = None
+        for est in sorted(sweeps[(kw, reg)]):
+            values = obs.get(est)
+            if values is not None and (run != values or _elapsed_hours(start, est) >= KEYFRAME_HOURS):
+                rows += 1
+                start = est
+            run = values
+    return rows
+
+
+def _readers(con: sqlite3.Connection) -> dict[str, pd.DataFrame]:
+    df = _coerce_types(pd.read_sql_query(HISTORY_SQL, con))
+    per_vid_inc, per_kw_inc = trends(con)
+    hot = pd.DataFrame(open_engine(con).hot(n=1_000))
+    return {
+        "video_observations": pd.read_sql_query("""
+            SELECT video_id, keyword, region, estrazione, views, likes, comments, engagement_rate
+            FROM video_observations ORDER BY video_id, keyword, region, estrazione
+        """, con),
+        "daily_rollups": pd.read_sql_query("SELECT * FROM daily_rollups ORDER BY day, keyword, canale, region", con),
+        "trend_per_video (pandas)": trend_per_video(df).sort_values("video_id"),
+        "trend_per_keyword (pandas)": trend_per_keyword(df).sort_values("keyword"),
+        "trend_per_video (sql)": trend_per_video_sql(con).sort_values("video_id"),
+        "trend_per_keyword (sql)": trend_per_keyword_sql(con).sort_values("keyword"),
+        "trend_per_video (incrementale)": per_vid_inc.sort_values("video_id"),
+        "trend_per_keyword (incrementale)": per_kw_inc.sort_values("keyword"),
+        "trending": hot.sort_values(["video_id", "keyword"]) if len(hot) else hot,
+    }
+
+
+def _after_retention(db_path: str, tmp: str, now: datetime) -> dict[str, pd.DataFrame]:
+    run_retention(db_path, raw_days=1, hourly_days=2, daily_days=0, report_days=1,
+                  reports_dir=Path(tmp) / "reports", now=now)
+    con = sqlite3.connect(db_path)
+    try:
+        return {"video_snapshots_all (dopo retention)": pd.read_sql_query("""
+            SELECT video_id, estrazione, keyword, region, views, likes, comments, engagement_rate, granularity
+            FROM video_snapshots_all ORDER BY video_id, keyword, region, estrazione
+        """, con)}
+    finally:
+        con.close()
+
+
+def run(db_path: str, batches: list[list[dict]], cdc: bool) -> tuple[dict[str, pd.DataFrame], int, int]:
+    """Scrive i batch uno alla volta (aggiornando stato incrementale e trending a ogni batch)."""
+    with StorageWriter(db_path, cdc=cdc) as writer:
+        for batch in batches:
+            writer.write(batch)
+            update_state(writer.conn)
+            open_engine(writer.conn)
+        unchanged = writer.unchanged
+        rows = writer.conn.execute("SELECT COUNT(*) FROM video_snapshots").fetchone()[0]
+    con = sqlite3.connect(db_path)
+    try:
+        return _readers(con), unchanged, rows
+    finally:
+        con.close()
+
+
+def _compare(name: str, a: pd.DataFrame, b: pd.DataFrame) -> bool:
+    try:
+        pd.testing.assert_frame_equal(a.reset_index(drop=True), b.reset_index(drop=True))
+    except AssertionError as e:
+        print(f"- {name:38} DIVERSO ❌\n{e}")
+        return False
+    print(f"- {name:38} {len(a):>6} righe   identico ✅")
+    return True
+
+
+def _check(name: str, ok: bool, detail: str) -> bool:
+    print(f"- {name:38} {detail}   {'✅' if ok else '❌'}")
+    return ok
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Storico e trend con CDC attivo e disattivo a confronto")
+    ap.add_argument("--videos", type=int, default=200)
+    ap.add_argument("--hours", type=int, default=48)
+    ap.add_argument("--step", type=int, default=4, help="ore tra uno sweep e il successivo")
+    args = ap.parse_args()
+
+    batches = synthetic_batches(args.videos, args.hours, args.step)
+    records = sum(map(len, batches))
+    # a metà dello storico: il taglio dei grezzi cade su righe ancora aperte
+    now = BASE + timedelta(days=args.hours // 48 + 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        in_order = str(Path(tmp) / "in_order.db")
+        _, _, rows_in_order = run(in_order, sorted(batches, key=lambda b: b[0]["estrazione"]), cdc=True)
+        on, skipped, rows_on = run(str(Path(tmp) / "cdc_on.db"), batches, cdc=True)
+        off, _, rows_off = run(str(Path(tmp) / "cdc_off.db"), batches, cdc=False)
+        on.update(_after_retention(str(Path(tmp) / "cdc_on.db"), tmp, now))
+        off.update(_after_retention(str(Path(tmp) / "cdc_off.db"), tmp, now))
+
+    expected = expected_rows(batches)
+    print(f"📦 {records:,} record in {len(batches)} batch, {skipped:,} riscritture di youtube_ads "
+          f"evitate, {rows_off - rows_on:,} righe di storico evitate dal CDC\n")
+    results = [
+        _check("righe senza CDC = record", rows_off == records, f"{rows_off:>6} / {records}"),
+        _check("righe con CDC, sweep in ordine", rows_in_order == expected, f"{rows_in_order:>6} / {expected} attese"),
+        _check("righe con CDC, sweep in ritardo", expected <= rows_on < rows_off,
+               f"{rows_on:>6} (tra {expected} e {rows_off})"),
+    ]
+    results += [_compare(name, on[name], off[name]) for name in on]
+    results.append(_check("osservazioni = record", len(on["video_observations"]) == records,
+                          f"{len(on['video_observations']):>6} / {records}"))
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -13,4 +13,12 @@ columns = c.fetchall()
 for col in columns:
     print(f"- {col[1]} ({col[2]})")
 
-conn.close()
\ No newline at end of file
+# Migrazioni applicate (storage.ensure_schema)
+if c.execute("SELECT 1 FROM sqlite_master WHERE name='schema_version'").fetchone():
+    print("\n🧬 Migrazioni applicate:\n")
+    for version, name, applied_at in c.execute("SELECT version, name, applied_at FROM schema_version ORDER BY version"):
+        print(f"- v{version} {name} ({applied_at})")
+else:
+    print("\n⚠️  Nessuna migrazione registrata: avvia il backend o main.py per aggiornare lo schema.")
+
+conn.close()
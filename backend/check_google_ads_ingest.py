@@ -0,0 +1,88 @@
+# check_google_ads_ingest.py
+# SpyAds Pro — Verifica dell'ingestion Google Ads con FakeGoogleAdsClient (nessuna
+# credenziale): gli annunci finti arrivano a pagine dallo stream e vengono
+# scritti a batch in un db temporaneo; una seconda ingestion con le stesse
+# righe (metriche e titoli cambiati, qualche annuncio nuovo) deve aggiornare
+# gli annunci esistenti su (piattaforma, external_id) senza duplicarli.
+# Uso: python check_google_ads_ingest.py [--ads 2500] [--page-size 1000] [--batch-size 300]
+#      exit code 1 se un controllo fallisce
+
+import sys
+import math
+import argparse
+import tempfile
+from pathlib import Path
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from db_conn import Annuncio, Base
+from google_ads_ingest import FakeGoogleAdsClient, PIATTAFORMA, fake_row, ingest
+
+
+def _pages(rows: list, size: int) -> list[list]:
+    return [rows[i:i + size] for i in range(0, len(rows), size)]
+
+
+def _check(name: str, ok: bool, detail: str) -> bool:
+    print(f"- {name:44} {detail}   {'✅' if ok else '❌'}")
+    return ok
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Ingestion Google Ads con client finto: batch e upsert")
+    ap.add_argument("--ads", type=int, default=2500)
+    ap.add_argument("--page-size", type=int, default=1000, help="righe per risposta dello stream")
+    ap.add_argument("--batch-size", type=int, default=300)
+    args = ap.parse_args()
+
+    first = [fake_row(i, impressions=1000 + i) for i in range(1, args.ads + 1)]
+    # stessi annunci con metriche e titolo nuovi, più un 10% di annunci nuovi
+    added = max(args.ads // 10, 1)
+    second = [fake_row(i, headline="Offerta aggiornata", impressions=5000 + i, ctr=0.05)
+              for i in range(1, args.ads + added + 1)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'annunci.db'}", future=True)
+        Base.metadata.create_all(bind=engine)
+        sessions = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+        client = FakeGoogleAdsClient(_pages(first, args.page_size))
+        s1 = ingest(client, "0000000000", geo="IT", batch_size=args.batch_size, session_factory=sessions)
+        with sessions() as session:
+            ids_before = dict(session.execute(select(Annuncio.external_id, Annuncio.id)).all())
+        s2 = ingest(FakeGoogleAdsClient(_pages(second, args.page_size)), "0000000000", geo="IT",
+                    batch_size=args.batch_size, session_factory=sessions)
+
+        with sessions() as session:
+            total = session.scalar(select(func.count()).select_from(Annuncio))
+            keys = session.scalar(select(func.count()).select_from(
+                select(Annuncio.piattaforma, Annuncio.external_id).distinct().subquery()))
+            rows = {r.external_id: r for r in session.execute(select(
+                Annuncio.external_id, Annuncio.id, Annuncio.titolo, Annuncio.ctr, Annuncio.piattaforma))}
+        engine.dispose()
+
+    expected = args.ads + added
+    stale = [k for k, a in rows.items() if a.titolo != "Offerta aggiornata" or a.ctr != 5.0]
+    moved = [k for k, pk in ids_before.items() if rows[k].id != pk]
+    print(f"📦 {args.ads:,} annunci in {len(client.queries)} stream da {math.ceil(args.ads / args.page_size)} "
+          f"pagine, poi {expected:,} (stessi + {added} nuovi)\n")
+    results = [
+        _check("prima ingestion: righe e batch", s1["rows"] == args.ads
+               and s1["batches"] == math.ceil(args.ads / args.batch_size),
+               f"{s1['rows']} righe in {s1['batches']} batch"),
+        _check("seconda ingestion: righe e batch", s2["rows"] == expected
+               and s2["batches"] == math.ceil(expected / args.batch_size),
+               f"{s2['rows']} righe in {s2['batches']} batch"),
+        _check("annunci in tabella = annunci distinti", total == expected == keys,
+               f"{total} righe, {keys} chiavi, {expected} attesi"),
+        _check("annunci esistenti aggiornati", not stale, f"{len(stale)} non aggiornati"),
+        _check("id degli annunci esistenti invariati", not moved, f"{len(moved)} cambiati"),
+        _check("piattaforma", {a.piattaforma for a in rows.values()} == {PIATTAFORMA},
+               PIATTAFORMA),
+    ]
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
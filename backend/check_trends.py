@@ -0,0 +1,116 @@
+# check_trends.py
+# SpyAds Pro — Verifica che i tre percorsi dei trend diano lo stesso risultato:
+# pandas (analytics_engine), SQL (analytics_sql) e incrementale
+# (analytics_incremental, aggiornato a più riprese). Lo storico sintetico ha
+# video estratti per più keyword nello stesso istante e sweep scritti in
+# ritardo, i casi in cui l'ordine di applicazione potrebbe contare.
+# Uso: python check_trends.py [--videos 300] [--sweeps 8]
+#      exit code 1 se un percorso dà risultati diversi
+
+import sys
+import random
+import sqlite3
+import argparse
+import tempfile
+from pathlib import Path
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from storage import StorageWriter, HISTORY_SQL, ESTRAZIONE_FMT
+from analytics_engine import _coerce_types, trend_per_video, trend_per_keyword
+from analytics_sql import trend_per_video_sql, trend_per_keyword_sql
+from analytics_incremental import update_state, trends
+
+KEYWORDS = ("crm", "vpn", "hosting", "corso inglese", "gestionale")
+
+# colonne confrontate con il percorso pandas (che tiene estrazione come datetime)
+_VIDEO_COLS = ["video_id", "keyword", "region", "views_now", "likes_now", "comments_now",
+               "views_prev", "likes_prev", "comments_prev"]
+
+
+def synthetic_jobs(videos: int, sweeps: int, seed: int = 11) -> list[list[dict]]:
+    """
+    Un batch per (sweep, keyword). Circa un video su tre compare sotto due o
+    tre keyword; a volte con contatori diversi (job separati nello stesso
+    secondo). L'ultimo sweep di una keyword viene scritto dopo quello successivo.
+    """
+    rng = random.Random(seed)
+    base = datetime(2025, 1, 1)
+    kws = {f"v{i:05d}": rng.sample(KEYWORDS, rng.choice((1, 1, 2, 3))) for i in range(videos)}
+    views = {vid: rng.randint(100, 10_000) for vid in kws}
+    batches = []
+    for s in range(sweeps):
+        est = (base + timedelta(hours=s)).strftime(ESTRAZIONE_FMT)
+        for vid in views:
+            views[vid] += rng.randint(0, 500)
+        for kw in KEYWORDS:
+            batch = []
+            for vid, vkws in kws.items():
+                if kw not in vkws or rng.random() < 0.1:
+                    continue
+                v = views[vid] + (rng.randint(1, 9) if rng.random() < 0.2 else 0)
+                batch.append({"video_id": vid, "titolo": f"titolo {vid}", "canale": "canale",
+                              "data_pubblicazione": "2024-06-01T00:00:00Z",
+                              "views": v, "likes": v // 20, "comments": v // 200,
+                              "engagement_rate": round((v // 20 + v // 200) / v * 100, 3),
+                              "keyword": kw, "region": rng.choice(("IT", "US")), "estrazione": est})
+            batches.append(batch)
+    # sweep in ritardo: il penultimo batch di KEYWORDS[0] arriva per ultimo
+    late = len(batches) - 2 * len(KEYWORDS)
+    batches.append(batches.pop(late))
+    return batches
+
+
+def _sorted(df: pd.DataFrame, key: str) -> pd.DataFrame:
+    return df.sort_values(key, kind="stable").reset_index(drop=True)
+
+
+def _compare(name: str, a: pd.DataFrame, b: pd.DataFrame, **kw) -> bool:
+    try:
+        pd.testing.assert_frame_equal(a, b, **kw)
+    except AssertionError as e:
+        print(f"- {name:38} DIVERSO ❌\n{e}")
+        return False
+    print(f"- {name:38} {len(a):>6} righe   identico ✅")
+    return True
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Trend pandas, SQL e incrementali a confronto")
+    ap.add_argument("--videos", type=int, default=300)
+    ap.add_argument("--sweeps", type=int, default=8)
+    args = ap.parse_args()
+
+    batches = synthetic_jobs(args.videos, args.sweeps)
+    with tempfile.TemporaryDirectory() as tmp:
+        with StorageWriter(str(Path(tmp) / "trends.db")) as writer:
+            for i, batch in enumerate(batches):
+                writer.write(batch)
+                if i % 3 == 0:
+                    update_state(writer.conn)     # incrementale a più riprese
+            update_state(writer.conn)
+            con: sqlite3.Connection = writer.conn
+            per_vid_inc, per_kw_inc = trends(con)
+            per_vid_sql, per_kw_sql = trend_per_video_sql(con), trend_per_keyword_sql(con)
+            df = _coerce_types(pd.read_sql_query(HISTORY_SQL, con))
+            per_vid_pd, per_kw_pd = trend_per_video(df), trend_per_keyword(df)
+
+    print(f"📦 {sum(map(len, batches)):,} record in {len(batches)} batch\n")
+    ok = all([
+        _compare("trend_per_video incrementale vs SQL",
+                 _sorted(per_vid_inc, "video_id"), _sorted(per_vid_sql, "video_id")),
+        _compare("trend_per_keyword incrementale vs SQL",
+                 _sorted(per_kw_inc, "keyword"), _sorted(per_kw_sql, "keyword")),
+        _compare("trend_per_video pandas vs SQL",
+                 _sorted(per_vid_pd, "video_id")[_VIDEO_COLS], _sorted(per_vid_sql, "video_id")[_VIDEO_COLS],
+                 check_dtype=False),
+        _compare("trend_per_keyword pandas vs SQL",
+                 _sorted(per_kw_pd, "keyword")[["keyword", "n_now", "n_prev"]],
+                 _sorted(per_kw_sql, "keyword")[["keyword", "n_now", "n_prev"]], check_dtype=False),
+    ])
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
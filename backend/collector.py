@@ -0,0 +1,163 @@
+# collector.py
+# SpyAds Pro — Raccolta concorrente multi-keyword / multi-region (YouTube)
+# Uso: python collector.py "keyword1:IT" "keyword2:US" ... [--depth 200] [--concurrency 8]
+
+import time
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from youtube_api import YouTubeAds, build_record, MAX_IDS_PER_DETAILS
+from quota import plan_jobs
+from storage import now_estrazione
+from transport import Transport, latency_lines
+
+DEFAULT_CONCURRENCY = 8
+
+
+async def _search_job(yt: YouTubeAds, pool: ThreadPoolExecutor, sem: asyncio.Semaphore,
+                      keyword: str, region: str, max_results: int) -> dict:
+    loop = asyncio.get_running_loop()
+    rep = {"keyword": keyword, "region": region, "ids": [], "records": [], "n_records": 0,
+           "elapsed_s": 0.0, "error": None}
+    async with sem:
+        t0 = time.perf_counter()
+        try:
+            rep["ids"] = await loop.run_in_executor(pool, yt._search_ids, keyword, region, max_results)
+        except Exception as e:
+            rep["error"] = f"{type(e).__name__}: {e}"
+        rep["elapsed_s"] = round(time.perf_counter() - t0, 3)
+    return rep
+
+
+async def _details_batch(yt: YouTubeAds, pool: ThreadPoolExecutor, sem: asyncio.Semaphore,
+                         ids: list[str]) -> tuple[list[str], list[dict], str | None]:
+    loop = asyncio.get_running_loop()
+    async with sem:
+        try:
+            return ids, await loop.run_in_executor(pool, yt._fetch_details, ids), None
+        except Exception as e:
+            return ids, [], f"{type(e).__name__}: {e}"
+
+
+def unique_ids(reports: list[dict]) -> list[str]:
+    """Unione degli id trovati in tutto lo sweep, senza duplicati, in ordine di apparizione."""
+    return list(dict.fromkeys(vid for rep in reports for vid in rep["ids"]))
+
+
+async def enrich_async(yt: YouTubeAds, pool: ThreadPoolExecutor, sem: asyncio.Semaphore,
+                       ids: list[str]) -> tuple[dict[str, dict], dict[str, str]]:
+    """
+    Scarica snippet+statistics per `ids` in blocchi pieni da MAX_IDS_PER_DETAILS.
+    Ritorna (details per id, errore per id dei blocchi falliti).
+    """
+    batches = [ids[i:i + MAX_IDS_PER_DETAILS] for i in range(0, len(ids), MAX_IDS_PER_DETAILS)]
+    results = await asyncio.gather(*[_details_batch(yt, pool, sem, b) for b in batches])
+    details: dict[str, dict] = {}
+    failed: dict[str, str] = {}
+    for batch, items, err in results:
+        if err:
+            failed.update(dict.fromkeys(batch, err))
+        for it in items:
+            details[it.get("id")] = it
+    return details, failed
+
+
+async def collect_async(jobs: list[tuple], yt: YouTubeAds | None = None,
+                        max_results: int = 10,
+                        concurrency: int = DEFAULT_CONCURRENCY) -> tuple[list[dict], list[dict]]:
+    """
+    Esegue la ricerca per ogni coppia (keyword, region) con al massimo
+    `concurrency` richieste in volo, poi arricchisce una sola volta gli id
+    unici dell'intero sweep (videos.list a blocchi da 50) e ridistribuisce
+    i dettagli ai singoli job.
+
+    I job sono (keyword, region) o (keyword, region, priority): vengono
+    eseguiti in ordine di priorità finché la quota residua li copre, gli
+    altri finiscono nei report come rimandati (error="quota insufficiente").
+
+    Ritorna (records, reports): i record sono gli stessi dict accettati da
+    YouTubeAds.save_to_db, i report contengono tempi ed eventuali errori
+    per singolo job.
+    """
+    # un client creato qui è nostro: sessione e cache vanno chiuse alla fine
+    owned = yt is None
+    yt = yt or YouTubeAds(transport=Transport(max_per_host=concurrency))
+    try:
+        jobs, deferred = plan_jobs(jobs, yt.ledger, depth=max_results)
+        sem = asyncio.Semaphore(concurrency)
+        # un solo timestamp per sweep: tutti i record finiscono nella stessa "estrazione"
+        estrazione = now_estrazione()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            reports = list(await asyncio.gather(*[
+                _search_job(yt, pool, sem, job[0], job[1], max_results) for job in jobs
+            ]))
+            details, failed = await enrich_async(yt, pool, sem, unique_ids(reports))
+    finally:
+        if owned:
+            yt.close()
+
+    # fan-out: ogni job riceve i dettagli dei propri id
+    for rep in reports:
+        for vid in rep["ids"]:
+            if vid in details:
+                rep["records"].append(build_record(details[vid], rep["keyword"], rep["region"], estrazione))
+            elif vid in failed and not rep["error"]:
+                rep["error"] = failed[vid]
+        rep["n_records"] = len(rep["records"])
+    records = [r for rep in reports for r in rep["records"]]
+    for job in deferred:
+        reports.append({"keyword": job[0], "region": job[1], "ids": [], "records": [], "n_records": 0,
+                        "elapsed_s": 0.0, "error": "quota insufficiente: job rimandato"})
+    return records, reports
+
+
+def collect(jobs: list[tuple], **kwargs) -> tuple[list[dict], list[dict]]:
+    """Wrapper sincrono di collect_async."""
+    return asyncio.run(collect_async(jobs, **kwargs))
+
+
+def _parse_job(arg: str) -> tuple[str, str]:
+    kw, _, region = arg.rpartition(":")
+    if not kw:
+        return region, "US"
+    return kw, region.upper() or "US"
+
+
+def main(argv: list[str] | None = None):
+    ap = argparse.ArgumentParser(description="Raccolta concorrente YouTube per coppie keyword:REGION")
+    ap.add_argument("jobs", nargs="+", help='coppie "keyword:REGION" (REGION default US)')
+    ap.add_argument("--depth", type=int, default=10,
+                    help="risultati per keyword; oltre 50 segue nextPageToken")
+    ap.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    ap.add_argument("--no-cache", action="store_true", help="ignora la cache su disco delle risposte API")
+    args = ap.parse_args(argv)
+
+    jobs = [_parse_job(a) for a in args.jobs]
+    t0 = time.perf_counter()
+    yt = YouTubeAds(transport=Transport(max_per_host=args.concurrency), use_cache=not args.no_cache)
+    try:
+        records, reports = collect(jobs, yt=yt, max_results=args.depth, concurrency=args.concurrency)
+        added, updated, ignored = yt.save_to_db(records)
+        errors = [r for r in reports if r["error"]]
+        n_ids = sum(len(r["ids"]) for r in reports)
+        n_unique = len(unique_ids(reports))
+        print(f"[INFO] {len(jobs)} job in {time.perf_counter() - t0:.2f}s — "
+              f"{len(records)} record, {len(errors)} errori")
+        print(f"[INFO] Enrichment: {n_ids} id trovati, {n_unique} unici, "
+              f"{-(-n_unique // MAX_IDS_PER_DETAILS)} richieste videos.list")
+        print(f"[INFO] DB: +{added} nuovi, {updated} aggiornati, {yt.unchanged} invariati, {ignored} ignorati")
+        print(f"[INFO] Quota residua oggi: {yt.ledger.remaining()} unità")
+        if yt.cache is not None:
+            c = yt.cache.summary()
+            print(f"[INFO] Cache API: {c['hits']} hit, {c['revalidated']} rivalidate (304), {c['misses']} miss")
+        for line in latency_lines(yt.transport):
+            print(f"[INFO] HTTP {line}")
+        for r in errors:
+            print(f"[!] {r['keyword']} / {r['region']}: {r['error']}")
+
+    finally:
+        yt.close()     # writer, cache, ledger e sessione HTTP
+
+if __name__ == "__main__":
+    main()
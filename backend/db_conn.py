@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float
+from sqlalchemy import create_engine, inspect, text, Column, Integer, String, Float, UniqueConstraint
 from sqlalchemy.orm import declarative_base, sessionmaker
 
 DATABASE_URL = "sqlite:///spyads.db"
@@ -9,8 +9,11 @@ Base = declarative_base()
 
 class Annuncio(Base):
     __tablename__ = "annunci"
+    # id dell'annuncio sulla piattaforma di origine: chiave degli upsert in ingestion
+    __table_args__ = (UniqueConstraint("piattaforma", "external_id", name="uq_annunci_piattaforma_external_id"),)
 
     id = Column(Integer, primary_key=True, index=True)
+    external_id = Column(String)
     titolo = Column(String)
     testo = Column(String)
     competitor = Column(String, index=True)
@@ -29,4 +32,11 @@ class Annuncio(Base):
     cpc = Column(Float, default=0.0)
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
+    # tabella creata prima di external_id: create_all non aggiunge colonne
+    cols = {c["name"] for c in inspect(engine).get_columns("annunci")}
+    if "external_id" not in cols:
+        with engine.begin() as conn:
+            conn.execute(text("ALTER TABLE annunci ADD COLUMN external_id VARCHAR"))
+            conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_annunci_piattaforma_external_id "
+                              "ON annunci (piattaforma, external_id)"))
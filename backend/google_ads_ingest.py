@@ -0,0 +1,183 @@
+# google_ads_ingest.py
+# SpyAds Pro — Ingestion Google Ads -> tabella annunci (db_conn.Annuncio)
+#
+# GoogleAdsService.search_stream restituisce le righe a blocchi: un generatore
+# le legge una alla volta, le converte in dict Annuncio e le scrive a batch
+# di dimensione fissa con INSERT ... ON CONFLICT (piattaforma, external_id)
+# DO UPDATE. In memoria c'è al più un batch, qualunque sia l'account.
+#
+# Il client è iniettabile: FakeGoogleAdsClient restituisce pagine preconfezionate
+# con la stessa forma delle risposte reali (sviluppo, test, demo senza credenziali);
+# check_google_ads_ingest.py lo usa per verificare batch e upsert.
+#
+# Uso: python google_ads_ingest.py --customer-id 1234567890 [--batch-size 500] [--geo IT]
+#      python google_ads_ingest.py --fake 2000      (dati finti, nessuna chiamata API)
+
+import os
+import time
+import argparse
+from itertools import islice
+from types import SimpleNamespace
+from typing import Iterable, Iterator
+from urllib.parse import urlparse
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from db_conn import Annuncio, SessionLocal, init_db
+
+PIATTAFORMA = "google_ads"
+DEFAULT_BATCH_SIZE = 500
+
+ADS_QUERY = """
+SELECT
+  customer.descriptive_name,
+  ad_group.name,
+  ad_group_ad.ad.id,
+  ad_group_ad.ad.name,
+  ad_group_ad.ad.type,
+  ad_group_ad.ad.final_urls,
+  ad_group_ad.ad.responsive_search_ad.headlines,
+  ad_group_ad.ad.responsive_search_ad.descriptions,
+  metrics.impressions,
+  metrics.ctr,
+  metrics.average_cpc,
+  metrics.conversions_from_interactions_rate
+FROM ad_group_ad
+WHERE ad_group_ad.status != 'REMOVED'
+"""
+
+# colonne aggiornate quando l'annuncio è già presente
+_UPDATE_COLUMNS = ("titolo", "testo", "competitor", "parole_chiave", "inserzionista", "dominio",
+                   "tipo_annuncio", "geo", "visualizzazioni", "performance", "ctr", "cpc")
+
+
+def iter_rows(client, customer_id: str, query: str = ADS_QUERY) -> Iterator:
+    """Righe GoogleAdsRow di search_stream, una alla volta, pagina dopo pagina."""
+    service = client.get_service("GoogleAdsService")
+    for batch in service.search_stream(customer_id=customer_id, query=query):
+        yield from batch.results
+
+
+def row_to_annuncio(row, geo: str = "") -> dict:
+    """GoogleAdsRow -> colonne di Annuncio. CTR e conversioni in %, CPC in valuta (non micros)."""
+    ad = row.ad_group_ad.ad
+    headlines = [h.text for h in ad.responsive_search_ad.headlines]
+    descriptions = [d.text for d in ad.responsive_search_ad.descriptions]
+    final_urls = list(ad.final_urls)
+    m = row.metrics
+    return {
+        "external_id": str(ad.id),
+        "piattaforma": PIATTAFORMA,
+        "titolo": headlines[0] if headlines else ad.name,
+        "testo": " | ".join(descriptions),
+        "competitor": row.customer.descriptive_name,
+        "inserzionista": row.customer.descriptive_name,
+        "parole_chiave": row.ad_group.name,
+        "dominio": urlparse(final_urls[0]).netloc if final_urls else "",
+        "tipo_annuncio": getattr(ad.type_, "name", str(ad.type_)),
+        "geo": geo,
+        "visualizzazioni": int(m.impressions),
+        "performance": round(m.conversions_from_interactions_rate * 100, 3),
+        "ctr": round(m.ctr * 100, 3),
+        "cpc": round(m.average_cpc / 1_000_000, 4),
+    }
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    it = iter(items)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+def _upsert_stmt(dialect_name: str):
+    insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    stmt = insert(Annuncio)
+    return stmt.on_conflict_do_update(
+        index_elements=["piattaforma", "external_id"],
+        set_={c: stmt.excluded[c] for c in _UPDATE_COLUMNS},
+    )
+
+
+def ingest(client, customer_id: str, geo: str = "", batch_size: int = DEFAULT_BATCH_SIZE,
+           session_factory=SessionLocal, query: str = ADS_QUERY) -> dict:
+    """
+    Scarica gli annunci dell'account e li scrive in `annunci` (upsert a batch,
+    un commit per batch). Ritorna righe, batch e tempo impiegato.
+    """
+    t0 = time.perf_counter()
+    rows = batches = 0
+    records = (row_to_annuncio(r, geo) for r in iter_rows(client, customer_id, query))
+    with session_factory() as session:
+        stmt = _upsert_stmt(session.get_bind().dialect.name)
+        for batch in batched(records, batch_size):
+            session.execute(stmt, batch)
+            session.commit()
+            rows += len(batch)
+            batches += 1
+    return {"rows": rows, "batches": batches, "elapsed_s": round(time.perf_counter() - t0, 3)}
+
+
+# ---- Client finto ------------------------------------------------------------
+def fake_row(ad_id: int, headline: str = "Offerta", description: str = "Spedizione gratuita",
+             customer: str = "Demo Srl", ad_group: str = "scarpe running",
+             url: str = "https://www.example.com/offerta", impressions: int = 1000,
+             ctr: float = 0.02, average_cpc: float = 350_000, conv_rate: float = 0.01):
+    """Oggetto con gli stessi attributi di GoogleAdsRow letti da row_to_annuncio."""
+    ns = SimpleNamespace
+    return ns(
+        customer=ns(descriptive_name=customer),
+        ad_group=ns(name=ad_group),
+        ad_group_ad=ns(ad=ns(
+            id=ad_id, name=f"ad {ad_id}", type_=ns(name="RESPONSIVE_SEARCH_AD"), final_urls=[url],
+            responsive_search_ad=ns(headlines=[ns(text=headline)], descriptions=[ns(text=description)]),
+        )),
+        metrics=ns(impressions=impressions, ctr=ctr, average_cpc=average_cpc,
+                   conversions_from_interactions_rate=conv_rate),
+    )
+
+
+class FakeGoogleAdsClient:
+    """
+    Sostituto di GoogleAdsClient: get_service("GoogleAdsService").search_stream
+    restituisce `pages` (liste di righe) come risposte dello stream.
+    """
+
+    def __init__(self, pages: list[list]):
+        self.pages = pages
+        self.queries: list[tuple[str, str]] = []
+
+    def get_service(self, name: str):
+        assert name == "GoogleAdsService", name
+        return self
+
+    def search_stream(self, customer_id: str, query: str):
+        self.queries.append((customer_id, query))
+        for page in self.pages:
+            yield SimpleNamespace(results=page)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Importa gli annunci Google Ads nella tabella annunci")
+    ap.add_argument("--customer-id", default=os.getenv("GOOGLE_ADS_CUSTOMER_ID"),
+                    help="id account senza trattini (default: $GOOGLE_ADS_CUSTOMER_ID)")
+    ap.add_argument("--geo", default="", help="area da assegnare agli annunci (es. IT)")
+    ap.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    ap.add_argument("--fake", type=int, metavar="N", help="usa N annunci finti invece dell'API")
+    args = ap.parse_args()
+
+    init_db()
+    if args.fake:
+        rows = [fake_row(i) for i in range(1, args.fake + 1)]
+        client = FakeGoogleAdsClient([rows[i:i + 1000] for i in range(0, len(rows), 1000)])
+        customer_id = "0000000000"
+    else:
+        if not args.customer_id:
+            ap.error("--customer-id mancante")
+        from google_ads_connector import connect_google_ads
+        client = connect_google_ads()
+        if client is None:
+            raise SystemExit(1)
+        customer_id = args.customer_id.replace("-", "")
+
+    stats = ingest(client, customer_id, geo=args.geo.upper(), batch_size=args.batch_size)
+    print(f"✅ {stats['rows']} annunci scritti in {stats['batches']} batch ({stats['elapsed_s']}s)")
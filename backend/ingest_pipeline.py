@@ -0,0 +1,296 @@
+# ingest_pipeline.py
+# SpyAds Pro — Pipeline di ingestion: fetch -> transform -> writer, a stadi separati
+#
+#   fetch (N thread)  : search.list paginata + videos.list, risposte grezze
+#   transform (1)     : build_record (engagement, estrazione) sugli item grezzi
+#   writer (1)        : unico writer SQLite; commit ogni `batch_size` record
+#                       o dopo `flush_s` secondi dal primo record in attesa
+#
+# Gli stadi comunicano con code limitate: se il disco rallenta, la coda del
+# writer si riempie, il transform si blocca e i fetch smettono di chiamare
+# l'API invece di accumulare pagine in memoria. Per ogni stadio si misurano
+# elementi, tempo di lavoro, attesa in ingresso (a vuoto) e in uscita
+# (bloccato a valle): lo stadio più occupato è il collo di bottiglia.
+#
+# Un job è completato solo quando tutti i suoi record sono stati committati.
+# Se la quota finisce durante la ricerca, o l'API chiede di riprovare più tardi
+# di quanto il trasporto aspetti (RetryLater), il job è rimandato
+# (entry["deferred"]): le pagine già lette vengono scritte, ma il job va rieseguito.
+#
+# Uso: from ingest_pipeline import IngestPipeline   (vedi batch_runner.py)
+
+import time
+import queue
+import threading
+from typing import Callable
+
+from youtube_api import YouTubeAds, build_record
+from storage import now_estrazione
+from quota import QuotaExhausted
+from transport import RetryLater
+
+BATCH_SIZE = 500
+FLUSH_S = 2.0
+QUEUE_PAGES = 16     # pagine (<= 50 video) in attesa tra due stadi
+
+_STOP = ("stop",)
+
+
+class _Aborted(Exception):
+    """Il writer è fallito: gli stadi a monte si fermano."""
+
+
+class StageStats:
+    def __init__(self, name: str, threads: int = 1):
+        self.name = name
+        self.threads = threads
+        self.items = 0
+        self.busy_s = 0.0
+        self.starved_s = 0.0     # in attesa di input
+        self.blocked_s = 0.0     # in attesa che lo stadio successivo liberi la coda
+        self._lock = threading.Lock()
+
+    def add(self, items: int = 0, busy: float = 0.0, starved: float = 0.0, blocked: float = 0.0):
+        with self._lock:
+            self.items += items
+            self.busy_s += busy
+            self.starved_s += starved
+            self.blocked_s += blocked
+
+    def summary(self, wall_s: float) -> dict:
+        return {
+            "threads": self.threads, "items": self.items,
+            "busy_s": round(self.busy_s, 3), "starved_s": round(self.starved_s, 3),
+            "blocked_s": round(self.blocked_s, 3),
+            "items_per_s": round(self.items / self.busy_s, 1) if self.busy_s else 0.0,
+            "utilization": round(self.busy_s / (max(wall_s, 1e-9) * self.threads), 3),
+        }
+
+
+class IngestPipeline:
+    """
+    Esegue i job {"id", "keyword", "region", "depth"} con `workers` fetch in
+    parallelo. `on_job_done(job, entry, error)` viene chiamata dal writer
+    dopo il commit dell'ultimo record del job (error è None se riuscito;
+    entry["deferred"] è True se la quota è finita, o l'API ha chiesto di
+    riprovare più tardi, prima della fine del job).
+    """
+
+    def __init__(self, yt: YouTubeAds, workers: int = 4, batch_size: int = BATCH_SIZE,
+                 flush_s: float = FLUSH_S, queue_size: int = QUEUE_PAGES):
+        self.yt = yt
+        self.workers = workers
+        self.batch_size = batch_size
+        self.flush_s = flush_s
+        self._raw_q: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._rec_q: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._jobs: queue.Queue = queue.Queue()
+        self._draining = threading.Event()
+        self._abort = threading.Event()
+        self.writer_error: BaseException | None = None
+        # job presi da un fetch e non ancora chiusi da on_job_done
+        self._pending: dict[str, dict] = {}
+        self._pending_lock = threading.Lock()
+        self.stats = {"fetch": StageStats("fetch", workers), "transform": StageStats("transform"),
+                      "writer": StageStats("writer")}
+        self.totals = {"inserted": 0, "updated": 0, "ignored": 0, "commits": 0}
+
+    # ---- code ---------------------------------------------------------------------
+    def _put(self, q: queue.Queue, item, stage: StageStats):
+        t0 = time.perf_counter()
+        while True:
+            if self._abort.is_set():
+                raise _Aborted()
+            try:
+                q.put(item, timeout=0.2)
+                break
+            except queue.Full:
+                continue
+        stage.add(blocked=time.perf_counter() - t0)
+
+    def _get(self, q: queue.Queue, stage: StageStats, timeout: float | None = None):
+        """Con timeout=None attende finché arriva un elemento o il writer fallisce."""
+        t0 = time.perf_counter()
+        try:
+            if timeout is not None:
+                return q.get(timeout=timeout)
+            while True:
+                if self._abort.is_set():
+                    raise _Aborted()
+                try:
+                    return q.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+        finally:
+            stage.add(starved=time.perf_counter() - t0)
+
+    # ---- stadi ----------------------------------------------------------------------
+    def _fetch_worker(self):
+        st = self.stats["fetch"]
+        while not self._draining.is_set() and not self._abort.is_set():
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                return
+            with self._pending_lock:
+                self._pending[job["id"]] = job
+            estrazione = now_estrazione()
+            started = time.perf_counter()
+            error = None
+            deferred = False
+            try:
+                t0 = started
+                for ids in self.yt.iter_search_pages(job["keyword"], job["region"], job["depth"]):
+                    items = self.yt._fetch_details(ids)
+                    st.add(items=len(items), busy=time.perf_counter() - t0)
+                    self._put(self._raw_q, ("items", job, estrazione, items), st)
+                    t0 = time.perf_counter()
+            except _Aborted:
+                return
+            except (QuotaExhausted, RetryLater) as e:
+                error, deferred = f"{type(e).__name__}: {e}", True
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+            try:
+                self._put(self._raw_q, ("done", job, error, started, deferred), st)
+            except _Aborted:
+                return
+
+    def _transform(self):
+        st = self.stats["transform"]
+        try:
+            while True:
+                msg = self._get(self._raw_q, st)
+                if msg is _STOP:
+                    self._put(self._rec_q, _STOP, st)
+                    return
+                if msg[0] == "items":
+                    _, job, estrazione, items = msg
+                    t0 = time.perf_counter()
+                    records = [build_record(it, job["keyword"], job["region"], estrazione) for it in items]
+                    st.add(items=len(records), busy=time.perf_counter() - t0)
+                    msg = ("records", job, records)
+                self._put(self._rec_q, msg, st)
+        except _Aborted:
+            return
+
+    def _writer(self, on_job_done: Callable | None):
+        st = self.stats["writer"]
+        buffer: list[dict] = []
+        done: list[tuple[dict, str | None, float, bool]] = []
+        n_records: dict[str, int] = {}
+        deadline = None
+
+        def flush():
+            nonlocal deadline
+            if buffer and self.writer_error is None:
+                t0 = time.perf_counter()
+                try:
+                    for key, n in zip(("inserted", "updated", "ignored"), self.yt.save_to_db(buffer)):
+                        self.totals[key] += n
+                    self.totals["commits"] += 1
+                except Exception as e:
+                    self.writer_error = e
+                    self._abort.set()
+                st.add(items=len(buffer), busy=time.perf_counter() - t0)
+            buffer.clear()
+            deadline = None
+            for job, error, started, deferred in done:
+                if error is None and self.writer_error is not None:
+                    error = f"{type(self.writer_error).__name__}: {self.writer_error}"
+                entry = {
+                    "id": job["id"], "keyword": job["keyword"], "region": job["region"], "depth": job["depth"],
+                    "n_records": n_records.pop(job["id"], 0),
+                    "elapsed_s": round(time.perf_counter() - started, 3),
+                    "finished_at": now_estrazione(), "deferred": deferred,
+                }
+                if on_job_done is not None:
+                    on_job_done(job, entry, error)
+                with self._pending_lock:
+                    self._pending.pop(job["id"], None)
+            done.clear()
+
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0.0)
+            try:
+                msg = self._get(self._rec_q, st, timeout)
+            except queue.Empty:
+                flush()
+                continue
+            except _Aborted:
+                return
+            if msg is _STOP:
+                flush()
+                return
+            job = msg[1]
+            if msg[0] == "records":
+                buffer.extend(msg[2])
+                n_records[job["id"]] = n_records.get(job["id"], 0) + len(msg[2])
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_s
+                if len(buffer) >= self.batch_size:
+                    flush()
+            else:
+                done.append((job, *msg[2:]))
+                if not buffer:
+                    flush()
+            if self._abort.is_set():
+                return     # errore di scrittura: i job rimasti restano da fare
+
+    # ---- esecuzione -------------------------------------------------------------------
+    def drain(self):
+        """Nessun job nuovo: quelli in corso finiscono e vengono scritti."""
+        self._draining.set()
+
+    @staticmethod
+    def _join(threads: list[threading.Thread], on_interrupt: Callable):
+        for t in threads:
+            while t.is_alive():
+                try:
+                    t.join(0.2)
+                except KeyboardInterrupt:
+                    on_interrupt()
+
+    def run(self, jobs: list[dict], on_job_done: Callable | None = None) -> dict:
+        """
+        Esegue i job fino in fondo (o fino a drain()); ritorna statistiche per stadio
+        e gli id dei job da rifare: not_started (mai presi) e unfinished (presi ma
+        non chiusi perché il writer è fallito).
+        """
+        interrupted = False
+
+        def interrupt():
+            nonlocal interrupted
+            interrupted = True
+            self.drain()
+
+        for job in jobs:
+            self._jobs.put(job)
+        t0 = time.perf_counter()
+        fetchers = [threading.Thread(target=self._fetch_worker, name=f"fetch-{i}", daemon=True)
+                    for i in range(max(1, min(self.workers, len(jobs))))]
+        transform = threading.Thread(target=self._transform, name="transform", daemon=True)
+        writer = threading.Thread(target=self._writer, args=(on_job_done,), name="writer", daemon=True)
+        for t in (*fetchers, transform, writer):
+            t.start()
+
+        self._join(fetchers, interrupt)
+        try:
+            self._put(self._raw_q, _STOP, self.stats["fetch"])
+        except _Aborted:
+            pass     # writer fermo: la coda piena non si svuoterà più
+        self._join([transform, writer], interrupt)
+
+        # job mai partiti (drain o errore del writer): restano da fare
+        not_started = []
+        while not self._jobs.empty():
+            not_started.append(self._jobs.get_nowait()["id"])
+        # job partiti ma non chiusi (record o "done" ancora in coda quando il writer è fallito)
+        unfinished = list(self._pending)
+        wall = time.perf_counter() - t0
+        stages = {name: s.summary(wall) for name, s in self.stats.items()}
+        return {
+            "elapsed_s": wall, "interrupted": interrupted, "not_started": not_started, "unfinished": unfinished,
+            "writer_error": self.writer_error, **self.totals, "stages": stages,
+            "bottleneck": max(stages, key=lambda n: stages[n]["utilization"]),
+        }
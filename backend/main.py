@@ -1,111 +1,71 @@
 import os
 import sqlite3
-import requests
-from datetime import datetime
 from dotenv import load_dotenv
-from google_ads_connector import connect_google_ads
+from storage import StorageWriter, ensure_schema, connect as storage_connect
+from quota import QuotaExhausted
 
 load_dotenv()
 API_KEY = os.getenv("YOUTUBE_API_KEY")
 
-google_client = connect_google_ads()
+DB_PATH = "spyads.db"
 
-BASE_URL = "https://www.googleapis.com/youtube/v3/search"
-VIDEO_DETAILS_URL = "https://www.googleapis.com/youtube/v3/videos"
+_google_client = None
+_youtube_client = None
+
+
+def get_google_client():
+    """Client Google Ads, creato alla prima richiesta (legge google-ads.yaml)."""
+    global _google_client
+    if _google_client is None:
+        from google_ads_connector import connect_google_ads
+        _google_client = connect_google_ads()
+    return _google_client
 
-DB_PATH = "spyads.db"
+
+def get_youtube_client():
+    """
+    Client YouTube (transport, ledger della quota, cache delle risposte),
+    creato alla prima richiesta: importare main non apre file né sessioni.
+    """
+    global _youtube_client
+    if _youtube_client is None:
+        from youtube_api import YouTubeAds
+        _youtube_client = YouTubeAds(api_key=API_KEY, db_path=DB_PATH)
+    return _youtube_client
+
+
+def __getattr__(name):
+    # "uvicorn main:app" (launcher): FastAPI viene importata solo quando serve l'app
+    if name == "app":
+        from api import app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 # ================== DATABASE ==================
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS youtube_ads (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        video_id TEXT,
-        titolo TEXT,
-        canale TEXT,
-        data_pubblicazione TEXT,
-        views INTEGER,
-        likes INTEGER,
-        comments INTEGER,
-        engagement REAL,
-        region TEXT,
-        keyword TEXT,
-        estrazione TEXT
-    )
-    """)
-    conn.commit()
+    """Crea o aggiorna lo schema (migrazioni in storage.MIGRATIONS)."""
+    conn = storage_connect(DB_PATH)
+    ensure_schema(conn)
     conn.close()
 
 
 # ================== FETCH VIDEO ==================
 def fetch_videos(keyword, region="US", max_results=10):
-    params = {
-        "part": "snippet",
-        "q": keyword,
-        "regionCode": region,
-        "maxResults": max_results,
-        "type": "video",
-        "key": API_KEY
-    }
-    res = requests.get(BASE_URL, params=params)
-    res.raise_for_status()
-    data = res.json()
-    video_ids = [item["id"]["videoId"] for item in data.get("items", [])]
-    if not video_ids:
-        return []
-
-    # Otteniamo le metriche
-    details_params = {
-        "part": "snippet,statistics",
-        "id": ",".join(video_ids),
-        "key": API_KEY
-    }
-    res = requests.get(VIDEO_DETAILS_URL, params=details_params)
-    res.raise_for_status()
-    data = res.json()
-
-    videos = []
-    for v in data.get("items", []):
-        stats = v.get("statistics", {})
-        snippet = v.get("snippet", {})
-        views = int(stats.get("viewCount", 0))
-        likes = int(stats.get("likeCount", 0))
-        comments = int(stats.get("commentCount", 0))
-        engagement = round(((likes + comments) / views * 100), 2) if views > 0 else 0
-        videos.append({
-            "video_id": v["id"],
-            "titolo": snippet.get("title", ""),
-            "canale": snippet.get("channelTitle", ""),
-            "data_pubblicazione": snippet.get("publishedAt", ""),
-            "views": views,
-            "likes": likes,
-            "comments": comments,
-            "engagement": engagement,
-            "region": region,
-            "keyword": keyword,
-            "estrazione": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-        })
-    return videos
+    """search.list + videos.list con quota, cache e retry del client YouTube."""
+    return get_youtube_client().fetch_videos(keyword, region, max_results)
 
 
 # ================== SALVATAGGIO ==================
+_writer = None
+
+
 def save_videos(videos):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    for v in videos:
-        c.execute("""
-        INSERT INTO youtube_ads (video_id, titolo, canale, data_pubblicazione, views, likes, comments, engagement, region, keyword, estrazione)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            v["video_id"], v["titolo"], v["canale"], v["data_pubblicazione"],
-            v["views"], v["likes"], v["comments"], v["engagement"],
-            v["region"], v["keyword"], v["estrazione"]
-        ))
-    conn.commit()
-    conn.close()
+    """Upsert dell'ultimo stato + snapshot storico, con un writer persistente (WAL)."""
+    global _writer
+    if _writer is None:
+        _writer = StorageWriter(DB_PATH)
+    return _writer.write(videos)
 
 
 # ================== VALIDAZIONE ==================
@@ -113,8 +73,9 @@ def validate_trends(keyword):
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     c.execute("""
-    SELECT video_id, titolo, canale, views, likes, comments, engagement, estrazione
-    FROM youtube_ads WHERE keyword=? ORDER BY estrazione DESC
+    SELECT s.video_id, v.titolo, v.canale, s.views, s.likes, s.comments, s.engagement_rate, s.estrazione
+    FROM video_observations s LEFT JOIN videos v ON v.video_id = s.video_id
+    WHERE s.keyword=? ORDER BY s.estrazione DESC
     """, (keyword,))
     rows = c.fetchall()
     conn.close()
@@ -155,7 +116,14 @@ if __name__ == "__main__":
     keyword = input("Inserisci una parola chiave per la ricerca: ")
     region = input("Inserisci area (es. IT, US, o lascia vuoto per globale): ") or "US"
 
-    videos = fetch_videos(keyword, region)
+    try:
+        videos = fetch_videos(keyword, region)
+    except QuotaExhausted as e:
+        print(f"[!] {e} — riprova dopo il reset (mezzanotte, ora del Pacifico).")
+        videos = []
+    finally:
+        if _youtube_client is not None:
+            _youtube_client.close()
     print(f"[INFO] {len(videos)} risultati trovati per '{keyword}'")
     save_videos(videos)
     print(f"[INFO] Salvati {len(videos)} video nel database.\n")
@@ -0,0 +1,228 @@
+# quota.py
+# SpyAds Pro — Ledger della quota YouTube Data API + scheduler per budget
+# Uso: python quota.py   (mostra lo stato della quota di oggi)
+
+import os
+import json
+import math
+import threading
+from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from storage import connect
+
+LEDGER_PATH = "quota_ledger.db"
+COUNTER_PATH = "quota_counter.txt"   # mantenuto aggiornato con le unità residue
+DAILY_LIMIT = 10_000
+
+# costo in unità per chiamata (https://developers.google.com/youtube/v3/determine_quota_cost)
+ENDPOINT_COST = {
+    "search.list": 100,
+    "videos.list": 1,
+}
+
+# la quota giornaliera si azzera a mezzanotte, ora del Pacifico; il fuso si
+# carica al primo uso (su Windows il database dei fusi arriva dal pacchetto tzdata)
+QUOTA_TZ_NAME = "America/Los_Angeles"
+_quota_tz = None
+
+
+def quota_tz() -> ZoneInfo:
+    global _quota_tz
+    if _quota_tz is None:
+        try:
+            _quota_tz = ZoneInfo(QUOTA_TZ_NAME)
+        except ZoneInfoNotFoundError as e:
+            raise RuntimeError(f"Fuso orario {QUOTA_TZ_NAME} non disponibile: "
+                               "installa il pacchetto tzdata (pip install -r requirements.txt)") from e
+    return _quota_tz
+
+LEDGER_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS quota_days (
+    day TEXT PRIMARY KEY,
+    used INTEGER NOT NULL DEFAULT 0,
+    exhausted INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS quota_usage (
+    day TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    units INTEGER NOT NULL,
+    PRIMARY KEY (day, endpoint)
+);
+"""
+
+
+class QuotaExhausted(Exception):
+    """Budget giornaliero insufficiente per la richiesta."""
+
+
+def quota_day(now: datetime | None = None) -> str:
+    tz = quota_tz()
+    now = now or datetime.now(tz)
+    return now.astimezone(tz).strftime("%Y-%m-%d")
+
+
+class QuotaLedger:
+    """
+    Contatore persistente (SQLite) delle unità consumate nel giorno (Pacific time).
+    Ogni addebito è un solo UPDATE condizionale sul file: API, collector e
+    batch_runner, anche in processi diversi, scalano lo stesso budget senza
+    sovrascriversi. Thread-safe; il file viene aperto al primo uso.
+    """
+
+    def __init__(self, path: str = LEDGER_PATH, daily_limit: int = DAILY_LIMIT,
+                 counter_path: str | None = COUNTER_PATH):
+        self.path = Path(path)
+        self.counter_path = Path(counter_path) if counter_path else None
+        self.daily_limit = daily_limit
+        self._lock = threading.Lock()
+        self._conn = None
+
+    # ---- persistenza --------------------------------------------------------
+    def _db(self):
+        if self._conn is None:
+            self._conn = connect(str(self.path))
+            self._conn.executescript(LEDGER_SCHEMA_SQL)
+            self._import_legacy()
+        return self._conn
+
+    def _import_legacy(self):
+        """Il ledger JSON delle versioni precedenti (stesso nome, .json) vale ancora per oggi."""
+        try:
+            state = json.loads(self.path.with_suffix(".json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if state.get("day") != quota_day():
+            return
+        with self._conn:
+            if self._conn.execute("INSERT OR IGNORE INTO quota_days (day, used, exhausted) VALUES (?,?,?)",
+                                  (state["day"], state.get("used", 0), int(bool(state.get("exhausted"))))
+                                  ).rowcount:
+                self._conn.executemany("INSERT INTO quota_usage (day, endpoint, units) VALUES (?,?,?)",
+                                       [(state["day"], ep, u) for ep, u in state.get("by_endpoint", {}).items()])
+
+    def _day(self, day: str) -> tuple[int, bool]:
+        row = self._db().execute("SELECT used, exhausted FROM quota_days WHERE day=?", (day,)).fetchone()
+        return (row[0], bool(row[1])) if row else (0, False)
+
+    def _remaining(self, day: str) -> int:
+        used, exhausted = self._day(day)
+        return 0 if exhausted else max(0, self.daily_limit - used)
+
+    def _write_counter(self, remaining: int):
+        if self.counter_path:
+            # file temporaneo + os.replace: chi legge non vede mai un file a metà
+            tmp = self.counter_path.with_name(f"{self.counter_path.name}.{os.getpid()}.tmp")
+            tmp.write_text(str(remaining), encoding="utf-8")
+            os.replace(tmp, self.counter_path)
+
+    # ---- API ----------------------------------------------------------------
+    def remaining(self) -> int:
+        with self._lock:
+            return self._remaining(quota_day())
+
+    def used(self) -> int:
+        with self._lock:
+            return self._day(quota_day())[0]
+
+    def can_spend(self, endpoint: str, calls: int = 1) -> bool:
+        return ENDPOINT_COST[endpoint] * calls <= self.remaining()
+
+    def spend(self, endpoint: str, calls: int = 1):
+        """Registra il costo prima della chiamata; solleva QuotaExhausted se non c'è budget."""
+        cost = ENDPOINT_COST[endpoint] * calls
+        day = quota_day()
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.execute("INSERT OR IGNORE INTO quota_days (day) VALUES (?)", (day,))
+                # controllo e addebito nella stessa istruzione: atomico anche tra processi
+                ok = conn.execute("""
+                    UPDATE quota_days SET used = used + ?
+                    WHERE day = ? AND NOT exhausted AND used + ? <= ?
+                """, (cost, day, cost, self.daily_limit)).rowcount
+                if ok:
+                    conn.execute("""
+                        INSERT INTO quota_usage (day, endpoint, units) VALUES (?,?,?)
+                        ON CONFLICT(day, endpoint) DO UPDATE SET units = units + excluded.units
+                    """, (day, endpoint, cost))
+            remaining = self._remaining(day)
+            self._write_counter(remaining)
+        if not ok:
+            raise QuotaExhausted(f"quota esaurita: {endpoint} costa {cost}, residuo {remaining}")
+
+    def mark_exhausted(self):
+        """L'API ha risposto quotaExceeded: blocca le richieste fino al prossimo reset."""
+        day = quota_day()
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.execute("""
+                    INSERT INTO quota_days (day, exhausted) VALUES (?, 1)
+                    ON CONFLICT(day) DO UPDATE SET exhausted = 1
+                """, (day,))
+            self._write_counter(0)
+
+    def summary(self) -> dict:
+        day = quota_day()
+        with self._lock:
+            used, exhausted = self._day(day)
+            by_endpoint = dict(self._db().execute(
+                "SELECT endpoint, units FROM quota_usage WHERE day=? ORDER BY endpoint", (day,)))
+            return {"day": day, "used": used, "by_endpoint": by_endpoint, "exhausted": exhausted,
+                    "limit": self.daily_limit, "remaining": self._remaining(day)}
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# ---- Scheduler --------------------------------------------------------------
+def estimate_job_cost(depth: int, page_size: int = 50) -> int:
+    """Costo massimo di un job: una search.list per pagina + una videos.list ogni 50 id."""
+    pages = max(1, math.ceil(depth / page_size))
+    return pages * ENDPOINT_COST["search.list"] + pages * ENDPOINT_COST["videos.list"]
+
+
+def plan_jobs(jobs: list[tuple], ledger: QuotaLedger, depth: int = 10) -> tuple[list[tuple], list[tuple]]:
+    """
+    Ordina i job (keyword, region[, priority[, depth]]) per priorità decrescente e li
+    ammette finché il budget residuo li copre. Ritorna (ammessi, rimandati):
+    i rimandati non vengono eseguiti oggi invece di fallire a metà sweep.
+    `depth` vale per i job che non indicano la propria.
+    """
+    budget = ledger.remaining()
+    ranked = sorted(jobs, key=lambda j: j[2] if len(j) > 2 else 0, reverse=True)
+    admitted, deferred = [], []
+    for job in ranked:
+        cost = estimate_job_cost(job[3] if len(job) > 3 else depth)
+        if cost <= budget:
+            admitted.append(job)
+            budget -= cost
+        else:
+            deferred.append(job)
+    return admitted, deferred
+
+
+def is_quota_error(response) -> bool:
+    """True se una risposta 403 dell'API indica quota giornaliera superata."""
+    if getattr(response, "status_code", None) != 403:
+        return False
+    try:
+        errors = response.json().get("error", {}).get("errors", [])
+    except ValueError:
+        return False
+    return any(e.get("reason") in ("quotaExceeded", "dailyLimitExceeded") for e in errors)
+
+
+if __name__ == "__main__":
+    s = QuotaLedger().summary()
+    print(f"📅 Giorno quota (PT): {s['day']}")
+    print(f"- usate: {s['used']} / {s['limit']}  (residue: {s['remaining']})")
+    for ep, units in s["by_endpoint"].items():
+        print(f"  · {ep}: {units}")
+    if s["exhausted"]:
+        print("⚠️  Quota segnalata come esaurita dall'API.")
@@ -0,0 +1,144 @@
+# report_store.py
+# SpyAds Pro — Archivio report colonnare (Parquet) partizionato per data run e keyword
+#
+# reports/store/<kind>/run_date=YYYY-MM-DD/keyword=<kw>/part-<run_ts>-<n>.parquet
+#
+# Uso: python report_store.py [--compact] [--retention-days 180]
+
+import shutil
+import argparse
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from storage import ESTRAZIONE_FMT
+
+STORE_DIR = Path("reports") / "store"
+KINDS = ("trend_per_video", "trend_per_keyword")
+RETENTION_DAYS = 180
+
+PARTITIONING = ds.partitioning(
+    pa.schema([("run_date", pa.string()), ("keyword", pa.string())]), flavor="hive"
+)
+
+# colonne testuali e temporali: salvate come stringa per avere lo stesso schema
+# tra run prodotti dal percorso pandas, SQL o incrementale. Gli istanti arrivano
+# come Timestamp (pandas) o come testo ISO, anche troncato al minuto (SQL):
+# si scrivono tutti in ESTRAZIONE_FMT, così i run restano confrontabili
+_TEXT_COLS = {"video_id", "titolo", "canale", "region"}
+_TIME_COLS = {"estrazione_dt", "snap_prev", "snap_now"}
+
+
+def _normalize(df: pd.DataFrame, run_ts: datetime) -> pd.DataFrame:
+    out = df.copy()
+    for c in out.columns:
+        if c in _TIME_COLS:
+            ts = pd.to_datetime(out[c], utc=True, format="ISO8601", errors="coerce")
+            out[c] = ts.dt.strftime(ESTRAZIONE_FMT).astype("string")
+        elif c == "keyword" or c in _TEXT_COLS:
+            out[c] = out[c].astype("string")
+        else:
+            out[c] = pd.to_numeric(out[c], errors="coerce").astype("float64")
+    out["keyword"] = out["keyword"].fillna("_")
+    out["run_ts"] = run_ts.strftime("%Y-%m-%dT%H:%M:%S")
+    out["run_date"] = run_ts.strftime("%Y-%m-%d")
+    return out
+
+
+def write_run(reports: dict[str, pd.DataFrame], run_ts: datetime | None = None,
+              store_dir: Path = STORE_DIR) -> dict[str, int]:
+    """
+    Aggiunge i report di un run allo store (un file per partizione keyword).
+    `reports` mappa kind -> DataFrame; ritorna le righe scritte per kind.
+    """
+    run_ts = run_ts or datetime.now()
+    written = {}
+    for kind, df in reports.items():
+        if df is None or df.empty:
+            written[kind] = 0
+            continue
+        table = pa.Table.from_pandas(_normalize(df, run_ts), preserve_index=False)
+        ds.write_dataset(
+            table, store_dir / kind, format="parquet", partitioning=PARTITIONING,
+            basename_template=f"part-{run_ts.strftime('%Y%m%d_%H%M%S_%f')}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        written[kind] = table.num_rows
+    return written
+
+
+def load_reports(kind: str, keywords: list[str] | None = None,
+                 since: str | None = None, until: str | None = None,
+                 columns: list[str] | None = None, store_dir: Path = STORE_DIR) -> pd.DataFrame:
+    """
+    Legge solo le partizioni (run_date tra since/until inclusi, keyword in
+    `keywords`) e le colonne richieste. Le date sono stringhe 'YYYY-MM-DD'.
+    """
+    path = store_dir / kind
+    if not path.exists():
+        return pd.DataFrame(columns=columns or [])
+    dataset = ds.dataset(path, format="parquet", partitioning=PARTITIONING)
+    flt = None
+    for cond in (
+        ds.field("keyword").isin(keywords) if keywords else None,
+        ds.field("run_date") >= since if since else None,
+        ds.field("run_date") <= until if until else None,
+    ):
+        if cond is not None:
+            flt = cond if flt is None else flt & cond
+    return dataset.to_table(columns=columns, filter=flt).to_pandas()
+
+
+def _partition_dirs(store_dir: Path):
+    for kind in KINDS:
+        for day_dir in sorted((store_dir / kind).glob("run_date=*")):
+            yield kind, day_dir
+
+
+def apply_retention(days: int = RETENTION_DAYS, store_dir: Path = STORE_DIR) -> int:
+    """Elimina le partizioni run_date più vecchie di `days` giorni; ritorna quante."""
+    cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d")
+    removed = 0
+    for _, day_dir in _partition_dirs(store_dir):
+        if day_dir.name.split("=", 1)[1] < cutoff:
+            shutil.rmtree(day_dir)
+            removed += 1
+    return removed
+
+
+def compact(store_dir: Path = STORE_DIR) -> int:
+    """
+    Unisce in un solo file i part-*.parquet di ogni partizione dei giorni
+    precedenti (quello corrente riceve ancora scritture). Ritorna i file rimossi.
+    """
+    today = datetime.now().strftime("%Y-%m-%d")
+    removed = 0
+    for _, day_dir in _partition_dirs(store_dir):
+        if day_dir.name.split("=", 1)[1] >= today:
+            continue
+        for kw_dir in day_dir.iterdir():
+            parts = sorted(kw_dir.glob("*.parquet"))
+            if len(parts) < 2:
+                continue
+            table = ds.dataset(parts, format="parquet").to_table()
+            tmp = kw_dir / "part-compacted.parquet.tmp"
+            pq.write_table(table, tmp)
+            for p in parts:
+                p.unlink()
+            tmp.replace(kw_dir / "part-compacted.parquet")
+            removed += len(parts) - 1
+    return removed
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Manutenzione dello store report Parquet")
+    ap.add_argument("--compact", action="store_true", help="unisce i file dei giorni precedenti")
+    ap.add_argument("--retention-days", type=int, default=RETENTION_DAYS)
+    args = ap.parse_args()
+    if args.compact:
+        print(f"🗜️  Compattazione: {compact()} file rimossi")
+    print(f"🧹 Retention ({args.retention_days} gg): {apply_retention(args.retention_days)} partizioni eliminate")
@@ -0,0 +1,196 @@
+# retention.py
+# SpyAds Pro — Retention dello storico: rollup orari/giornalieri, pruning, compattazione
+#
+# Politica (giorni, configurabili da riga di comando):
+#   video_snapshots         grezzi per RAW_DAYS, poi un punto per ora (il rollup
+#                           legge video_observations: una riga per sweep)
+#   video_snapshots_hourly  per HOURLY_DAYS, poi un punto per giorno
+#   video_snapshots_daily   per DAILY_DAYS (0 = per sempre)
+#   daily_members           per RAW_DAYS (servono solo per aggiornare gli
+#                           aggregati del giorno; daily_rollups resta)
+#   reports/                cartelle e partizioni più vecchie di REPORT_DAYS
+#
+# I contatori sono cumulativi: il rollup tiene l'ultimo snapshot del bucket
+# (più views_first e il numero di campioni). I tagli cadono a mezzanotte UTC,
+# così un bucket non viene mai diviso tra due run.
+#
+# Il primo run passa il db ad auto_vacuum=INCREMENTAL (un VACUUM completo, poi
+# ricostruzione di videos_fts: VACUUM può rinumerare i rowid di videos); dai run
+# successivi basta PRAGMA incremental_vacuum.
+#
+# Uso: python retention.py [--raw-days 14] [--hourly-days 90] [--daily-days 730]
+#                          [--report-days 180] [--db spyads.db] [--reports-dir reports]
+
+import time
+import shutil
+import sqlite3
+import argparse
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from storage import connect, ensure_schema, trim_snapshots, ESTRAZIONE_FMT
+
+RAW_DAYS = 14
+HOURLY_DAYS = 90
+DAILY_DAYS = 730
+REPORT_DAYS = 180
+REPORTS_DIR = Path("reports")
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+# (sorgente, destinazione, bucket, espressioni per views_first e samples della sorgente)
+_TIERS = (
+    ("video_observations", "video_snapshots_hourly",
+     "substr(estrazione, 1, 13) || ':00:00Z'", "views", "1", "estrazione"),
+    ("video_snapshots_hourly", "video_snapshots_daily",
+     "substr(estrazione, 1, 10) || 'T00:00:00Z'", "views_first", "samples", "last_estrazione"),
+)
+
+_ROLLUP_SQL = """
+INSERT INTO {dst} (video_id, estrazione, keyword, region, views, likes, comments,
+                   engagement_rate, views_first, samples, last_estrazione)
+SELECT video_id, bucket, keyword, region, views, likes, comments,
+       engagement_rate, views_first, samples, last_estrazione
+FROM (
+    SELECT video_id, keyword, region, {bucket} AS bucket, {last} AS last_estrazione,
+           views, likes, comments, engagement_rate,
+           FIRST_VALUE({first}) OVER (PARTITION BY video_id, keyword, region, {bucket}
+                                      ORDER BY estrazione) AS views_first,
+           SUM({samples}) OVER (PARTITION BY video_id, keyword, region, {bucket}) AS samples,
+           ROW_NUMBER() OVER (PARTITION BY video_id, keyword, region, {bucket}
+                              ORDER BY estrazione DESC) AS rn
+    FROM {src} WHERE estrazione < ?
+)
+WHERE rn = 1
+ON CONFLICT (video_id, estrazione, keyword, region) DO UPDATE SET
+    views = CASE WHEN excluded.last_estrazione > last_estrazione THEN excluded.views ELSE views END,
+    likes = CASE WHEN excluded.last_estrazione > last_estrazione THEN excluded.likes ELSE likes END,
+    comments = CASE WHEN excluded.last_estrazione > last_estrazione THEN excluded.comments ELSE comments END,
+    engagement_rate = CASE WHEN excluded.last_estrazione > last_estrazione
+                           THEN excluded.engagement_rate ELSE engagement_rate END,
+    views_first = MIN(views_first, excluded.views_first),
+    samples = samples + excluded.samples,
+    last_estrazione = MAX(last_estrazione, excluded.last_estrazione)
+"""
+
+
+def cutoff(days: int, now: datetime | None = None) -> str:
+    """Mezzanotte UTC di `days` giorni fa, in ESTRAZIONE_FMT."""
+    now = now or datetime.now(timezone.utc)
+    day = (now - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return day.strftime(ESTRAZIONE_FMT)
+
+
+def rollup(conn: sqlite3.Connection, src: str, dst: str, bucket: str,
+           first: str, samples: str, last: str, before: str) -> tuple[int, int]:
+    """Riassume in `dst` le righe di `src` precedenti a `before` e le elimina; ritorna (bucket, righe)."""
+    with conn:
+        cur = conn.execute(_ROLLUP_SQL.format(src=src, dst=dst, bucket=bucket, first=first,
+                                              samples=samples, last=last), (before,))
+        buckets = cur.rowcount
+        if src == "video_observations":
+            # i grezzi sono righe a intervalli: si accorciano o si eliminano
+            deleted = trim_snapshots(conn, before)
+        else:
+            deleted = conn.execute(f"DELETE FROM {src} WHERE estrazione < ?", (before,)).rowcount
+    return buckets, deleted
+
+
+def prune(conn: sqlite3.Connection, table: str, before: str) -> int:
+    with conn:
+        return conn.execute(f"DELETE FROM {table} WHERE estrazione < ?", (before,)).rowcount
+
+
+def compact(conn: sqlite3.Connection) -> dict:
+    """Restituisce al filesystem le pagine libere e aggiorna le statistiche del planner."""
+    freed_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    full = conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL
+    if full:
+        # auto_vacuum si cambia solo con un VACUUM completo (una volta sola)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        with conn:
+            conn.execute("INSERT INTO videos_fts (videos_fts) VALUES ('rebuild')")
+    else:
+        conn.execute("PRAGMA incremental_vacuum")
+    conn.execute("PRAGMA analysis_limit=1000")
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return {"full_vacuum": full, "pages_freed": freed_before}
+
+
+def _legacy_report_date(path: Path) -> datetime | None:
+    # reports/analytics_YYYYMMDD_HHMMSS (run precedenti allo store Parquet)
+    try:
+        return datetime.strptime(path.name, "analytics_%Y%m%d_%H%M%S")
+    except ValueError:
+        return None
+
+
+def expire_reports(days: int = REPORT_DAYS, reports_dir: Path = REPORTS_DIR) -> int:
+    """Elimina le cartelle di report e le partizioni dello store più vecchie di `days`."""
+    limit = datetime.now() - timedelta(days=days)
+    removed = 0
+    if reports_dir.exists():
+        for path in reports_dir.glob("analytics_*"):
+            ts = _legacy_report_date(path)
+            if path.is_dir() and ts is not None and ts < limit:
+                shutil.rmtree(path)
+                removed += 1
+    if (reports_dir / "store").exists():
+        from report_store import apply_retention
+        removed += apply_retention(days, store_dir=reports_dir / "store")
+    return removed
+
+
+def run_retention(db_path: str = "spyads.db", raw_days: int = RAW_DAYS, hourly_days: int = HOURLY_DAYS,
+                  daily_days: int = DAILY_DAYS, report_days: int = REPORT_DAYS,
+                  reports_dir: Path = REPORTS_DIR, now: datetime | None = None) -> dict:
+    """Applica la politica di retention; ritorna un riepilogo per fase."""
+    if not 0 < raw_days <= hourly_days:
+        raise ValueError("serve 0 < raw_days <= hourly_days")
+    if daily_days and daily_days < hourly_days:
+        raise ValueError("daily_days deve essere 0 (per sempre) o >= hourly_days")
+    t0 = time.perf_counter()
+    summary = {}
+    conn = connect(db_path)
+    try:
+        ensure_schema(conn)
+        for (src, dst, bucket, first, samples, last), days in zip(_TIERS, (raw_days, hourly_days)):
+            summary[dst] = rollup(conn, src, dst, bucket, first, samples, last, cutoff(days, now))
+        summary["members_pruned"] = prune(conn, "daily_members", cutoff(raw_days, now))
+        if daily_days:
+            summary["daily_pruned"] = prune(conn, "video_snapshots_daily", cutoff(daily_days, now))
+        summary["compact"] = compact(conn)
+    finally:
+        conn.close()
+    summary["reports_removed"] = expire_reports(report_days, Path(reports_dir))
+    summary["elapsed_s"] = round(time.perf_counter() - t0, 3)
+    return summary
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Rollup, pruning e compattazione dello storico")
+    ap.add_argument("--raw-days", type=int, default=RAW_DAYS, help="giorni di snapshot grezzi")
+    ap.add_argument("--hourly-days", type=int, default=HOURLY_DAYS, help="giorni di rollup orari")
+    ap.add_argument("--daily-days", type=int, default=DAILY_DAYS, help="giorni di rollup giornalieri (0 = sempre)")
+    ap.add_argument("--report-days", type=int, default=REPORT_DAYS)
+    ap.add_argument("--db", default="spyads.db")
+    ap.add_argument("--reports-dir", default=str(REPORTS_DIR))
+    args = ap.parse_args()
+
+    db = Path(args.db)
+    size_before = db.stat().st_size if db.exists() else 0
+    s = run_retention(args.db, args.raw_days, args.hourly_days, args.daily_days,
+                      args.report_days, Path(args.reports_dir))
+    size_after = db.stat().st_size if db.exists() else 0
+
+    print("🧹 Retention completata")
+    print(f"- grezzi -> orari: {s['video_snapshots_hourly'][1]} righe in {s['video_snapshots_hourly'][0]} bucket")
+    print(f"- orari -> giornalieri: {s['video_snapshots_daily'][1]} righe in {s['video_snapshots_daily'][0]} bucket")
+    print(f"- membri degli aggregati giornalieri eliminati: {s['members_pruned']}")
+    if "daily_pruned" in s:
+        print(f"- giornalieri eliminati: {s['daily_pruned']}")
+    print(f"- report eliminati: {s['reports_removed']}")
+    vacuum = "VACUUM completo (auto_vacuum=INCREMENTAL)" if s["compact"]["full_vacuum"] else "incremental_vacuum"
+    print(f"- {vacuum}: {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB in {s['elapsed_s']}s")
@@ -0,0 +1,97 @@
+# startup_profile.py
+# SpyAds Pro — Profilo di avvio: tempo di import per modulo ed effetti collaterali
+#
+# Ogni modulo viene importato in un processo Python pulito (-X importtime)
+# con una cartella di lavoro vuota: se l'import crea file o cartelle
+# (db, reports/, ledger...) viene segnalato come effetto collaterale.
+#
+# Uso: python startup_profile.py [--max-ms 1500] [--top 5] [moduli...]
+#      exit code 1 se un modulo supera --max-ms o scrive su disco (per la CI)
+
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+MODULES = (
+    "storage", "quota", "api_cache", "transport", "youtube_api", "collector", "main", "api",
+    "validate_data", "analytics_sql", "analytics_incremental", "report_store", "analytics_engine",
+    "trending", "retention", "ingest_pipeline",
+)
+MAX_MS = 1500
+
+
+def _run_importtime(code: str, cwd: str) -> subprocess.CompletedProcess:
+    env = {**os.environ, "PYTHONPATH": str(BACKEND_DIR), "PYTHONDONTWRITEBYTECODE": "1"}
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=cwd, env=env, capture_output=True, text=True)
+
+
+def _top_level_imports(stderr: str) -> dict[str, int]:
+    """Righe di -X importtime dei soli moduli di primo livello: nome -> µs cumulativi."""
+    out = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = (p.strip(" ") for p in line[len("import time:"):].split("|"))
+            out[name] = int(cumulative)
+        except ValueError:
+            continue     # riga di intestazione
+    return {n: us for n, us in out.items() if "." not in n}
+
+
+def profile_import(module: str, baseline: set[str] = frozenset()) -> dict:
+    """
+    Importa `module` in un sottoprocesso; ritorna tempo (ms), dipendenze più
+    pesanti (esclusi i moduli caricati dall'interprete, `baseline`) e file creati.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        proc = _run_importtime(f"import {module}", tmp)
+        created = sorted(p.name for p in Path(tmp).iterdir())
+
+    imports = _top_level_imports(proc.stderr)
+    total_us = imports.pop(module, 0)
+    deps = sorted(((us, n) for n, us in imports.items() if n not in baseline), reverse=True)
+    return {
+        "module": module,
+        "ok": proc.returncode == 0,
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode else None,
+        "ms": total_us / 1000,
+        "deps": [(name, us / 1000) for us, name in deps],
+        "created": created,
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Tempo di import e effetti collaterali dei moduli backend")
+    ap.add_argument("modules", nargs="*", default=list(MODULES))
+    ap.add_argument("--max-ms", type=float, default=MAX_MS, help="budget di import per modulo")
+    ap.add_argument("--top", type=int, default=3, help="dipendenze più lente da mostrare")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline = set(_top_level_imports(_run_importtime("pass", tmp).stderr))
+
+    failed = False
+    print(f"{'modulo':24} {'import ms':>10}  dipendenze più lente")
+    print("-" * 80)
+    for mod in args.modules:
+        r = profile_import(mod, baseline)
+        if not r["ok"]:
+            print(f"{mod:24} {'ERRORE':>10}  {r['error']}")
+            failed = True
+            continue
+        top = ", ".join(f"{n} {ms:.0f}" for n, ms in r["deps"][:args.top])
+        flag = "⚠️ " if r["ms"] > args.max_ms else ""
+        print(f"{mod:24} {r['ms']:>10.1f}  {flag}{top}")
+        if r["created"]:
+            print(f"{'':24} {'':>10}  ❌ l'import ha creato: {', '.join(r['created'])}")
+        failed |= r["ms"] > args.max_ms or bool(r["created"])
+
+    print("\n❌ Profilo di avvio fuori budget" if failed else "\n✅ Avvio entro il budget, nessun effetto collaterale")
+    sys.exit(1 if failed else 0)
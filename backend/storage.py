@@ -0,0 +1,992 @@
+# storage.py
+# SpyAds Pro — Storage time-series per le statistiche YouTube
+#
+# youtube_ads      : stato più recente per video (usato da dashboard/API);
+#                    estrazione è quella dell'ultima variazione
+# videos           : dimensione "slim" (titolo, canale, pubblicazione)
+# video_snapshots  : storico delle metriche a intervalli: una riga vale da
+#                    estrazione a seen_until finché i valori non cambiano
+# snapshot_sweeps  : estrazioni eseguite per (keyword, region)
+# video_observations: vista con una riga per serie e sweep (quella da leggere)
+# video_snapshots_hourly / _daily : rollup dello storico vecchio (retention.py)
+# daily_rollups / daily_er_hist    : aggregati per giorno, keyword, canale, region
+# *_trend_state, trend_velocity_state: stato di analytics incrementale e trending
+# videos_fts       : indice full-text (FTS5) su titolo e canale di videos
+# schema_version   : migrazioni applicate (vedi MIGRATIONS, ensure_schema)
+#
+# estrazione è sempre UTC in formato ESTRAZIONE_FMT ("2024-05-01T08:30:00Z"):
+# l'ordinamento per stringa coincide con quello temporale.
+
+import sqlite3
+from datetime import datetime, timezone
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS youtube_ads (
+    video_id TEXT PRIMARY KEY,
+    titolo TEXT,
+    canale TEXT,
+    data_pubblicazione TEXT,
+    views INTEGER,
+    likes INTEGER,
+    comments INTEGER,
+    region TEXT,
+    keyword TEXT,
+    estrazione TEXT,
+    engagement_rate REAL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# WAL: la dashboard legge mentre il collector scrive; synchronous=NORMAL è
+# sicuro in WAL (al più si perde l'ultima transazione in caso di crash dell'OS)
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    "PRAGMA cache_size=-65536;",        # 64 MiB di page cache
+    "PRAGMA mmap_size=268435456;",      # 256 MiB mappati in memoria
+    "PRAGMA temp_store=MEMORY;",
+    "PRAGMA busy_timeout=5000;",
+)
+
+SNAPSHOT_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS videos (
+    video_id TEXT PRIMARY KEY,
+    titolo TEXT,
+    canale TEXT,
+    data_pubblicazione TEXT
+);
+
+-- la PK (video_id, estrazione, ...) su tabella WITHOUT ROWID fa da indice
+-- coprente per lo storico di un video: lo scan per video è un range sulla PK
+CREATE TABLE IF NOT EXISTS video_snapshots (
+    video_id TEXT NOT NULL,
+    estrazione TEXT NOT NULL,
+    keyword TEXT NOT NULL DEFAULT '',
+    region TEXT NOT NULL DEFAULT '',
+    views INTEGER,
+    likes INTEGER,
+    comments INTEGER,
+    engagement_rate REAL,
+    PRIMARY KEY (video_id, estrazione, keyword, region)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_snapshots_keyword_estrazione
+    ON video_snapshots (keyword, estrazione, video_id, views, likes, comments, engagement_rate);
+
+-- letture incrementali "tutto ciò che è arrivato dopo il watermark"
+CREATE INDEX IF NOT EXISTS idx_snapshots_estrazione
+    ON video_snapshots (estrazione);
+"""
+
+SNAPSHOT_COLUMNS = ("video_id", "estrazione", "keyword", "region",
+                    "views", "likes", "comments", "engagement_rate")
+
+
+def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                        (name,)).fetchone() is not None
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> list[str]:
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table});")]
+
+
+def duplicate_counts(con: sqlite3.Connection, table: str = "youtube_ads",
+                     keys: tuple[str, ...] = ("video_id",)) -> int:
+    """Righe che condividono le stesse chiavi con almeno un'altra (come df.duplicated(keep=False))."""
+    k = ", ".join(keys)
+    row = con.execute(f"""
+        SELECT COALESCE(SUM(n), 0) FROM (
+            SELECT COUNT(*) AS n FROM {table} GROUP BY {k} HAVING COUNT(*) > 1
+        )
+    """).fetchone()
+    return int(row[0])
+
+
+# ---- Timestamp ---------------------------------------------------------------
+ESTRAZIONE_FMT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def now_estrazione() -> str:
+    """Istante corrente nel formato di `estrazione`."""
+    return datetime.now(timezone.utc).strftime(ESTRAZIONE_FMT)
+
+
+def normalize_estrazione(value: str | None) -> str:
+    """
+    Porta un timestamp ISO qualsiasi ("2024-05-01 08:30:00", "...T08:30:00.123+02:00")
+    a ESTRAZIONE_FMT in UTC; senza fuso viene considerato UTC. I valori non
+    interpretabili restano invariati (li segnala validate_data).
+    """
+    if not value:
+        return ""
+    if len(value) == 20 and value[10] == "T" and value[19] == "Z":
+        return value
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return value
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime(ESTRAZIONE_FMT)
+
+
+# una serie ferma riparte comunque con una riga nuova ogni KEYFRAME_HOURS
+KEYFRAME_HOURS = 24
+
+
+def _elapsed_hours(start: str, end: str) -> float:
+    try:
+        elapsed = datetime.strptime(end, ESTRAZIONE_FMT) - datetime.strptime(start, ESTRAZIONE_FMT)
+    except ValueError:
+        return float("inf")
+    return elapsed.total_seconds() / 3600
+
+
+def _split_runs(conn: sqlite3.Connection, keyword: str, region: str, estrazione: str,
+                prev: str, seq: int) -> int:
+    """
+    Sweep arrivato dopo uno più recente: le righe che lo scavalcano (la serie
+    non vi è stata osservata) si spezzano in [.., prev] e [sweep successivo, ..].
+    """
+    nxt = conn.execute("""
+        SELECT MIN(estrazione) FROM snapshot_sweeps WHERE keyword=? AND region=? AND estrazione > ?
+    """, (keyword, region, estrazione)).fetchone()[0]
+    spanning = conn.execute(f"""
+        SELECT {", ".join(SNAPSHOT_COLUMNS)}, seen_until FROM video_snapshots
+        WHERE keyword=? AND region=? AND seen_until > ? AND estrazione < ?
+    """, (keyword, region, estrazione, estrazione)).fetchall()
+    conn.executemany("""
+        UPDATE video_snapshots SET seen_until=? WHERE video_id=? AND estrazione=? AND keyword=? AND region=?
+    """, [(prev, *r[:4]) for r in spanning])
+    conn.executemany(f"""
+        INSERT INTO video_snapshots ({", ".join(SNAPSHOT_COLUMNS)}, seen_until, seq)
+        VALUES (?,?,?,?,?,?,?,?,?,?)
+    """, [(r[0], nxt, *r[2:], seq) for r in spanning])
+    return len(spanning)
+
+
+def _append_sweep(conn: sqlite3.Connection, keyword: str, region: str, estrazione: str,
+                  rows: list[dict], seq: int, extend: bool) -> int:
+    """Registra i record di uno sweep (keyword, region, estrazione); ritorna le righe nuove."""
+    prev, late, known = conn.execute("""
+        SELECT (SELECT MAX(estrazione) FROM snapshot_sweeps WHERE keyword=?1 AND region=?2 AND estrazione < ?3),
+               EXISTS (SELECT 1 FROM snapshot_sweeps WHERE keyword=?1 AND region=?2 AND estrazione > ?3),
+               EXISTS (SELECT 1 FROM snapshot_sweeps WHERE keyword=?1 AND region=?2 AND estrazione = ?3)
+    """, (keyword, region, estrazione)).fetchone()
+    conn.execute("""
+        INSERT INTO snapshot_sweeps (keyword, region, estrazione, seq) VALUES (?,?,?,?)
+        ON CONFLICT (keyword, region, estrazione) DO UPDATE SET seq=excluded.seq
+    """, (keyword, region, estrazione, seq))
+    written = 0
+    if late and not known:
+        written += _split_runs(conn, keyword, region, estrazione, prev, seq)
+
+    # righe ferme allo sweep precedente (estendibili) o già a questo; uno sweep
+    # in ritardo non estende nulla: le sue righe valgono per lui solo
+    alive = {} if late else {r[0]: r[1:] for r in conn.execute("""
+        SELECT video_id, estrazione, seen_until, views, likes, comments, engagement_rate
+        FROM video_snapshots WHERE keyword=? AND region=? AND seen_until IN (?, ?)
+    """, (keyword, region, prev, estrazione))}
+    inserts, updates = [], []
+    for r in rows:
+        vid = r["video_id"]
+        values = (r.get("views"), r.get("likes"), r.get("comments"), r.get("engagement_rate", r.get("engagement")))
+        run = alive.get(vid)
+        if run and run[1] == estrazione:
+            continue    # serie già osservata in questo sweep: resta la prima riga
+        if (extend and run and run[1] == prev and run[2:] == values
+                and _elapsed_hours(run[0], estrazione) < KEYFRAME_HOURS):
+            updates.append((estrazione, seq, vid, run[0], keyword, region))
+            alive[vid] = (run[0], estrazione, *values)
+        else:
+            inserts.append((vid, estrazione, keyword, region, *values, estrazione, seq))
+            alive[vid] = (estrazione, estrazione, *values)
+    conn.executemany("""
+        UPDATE video_snapshots SET seen_until=?, seq=? WHERE video_id=? AND estrazione=? AND keyword=? AND region=?
+    """, updates)
+    before = conn.total_changes
+    conn.executemany(f"""
+        INSERT OR IGNORE INTO video_snapshots ({", ".join(SNAPSHOT_COLUMNS)}, seen_until, seq)
+        VALUES (?,?,?,?,?,?,?,?,?,?)
+    """, inserts)
+    return written + conn.total_changes - before
+
+
+def append_snapshots(conn: sqlite3.Connection, items: list[dict], extend: bool = True) -> int:
+    """
+    Registra i record nello storico e aggiorna la dimensione video solo se
+    titolo, canale o data cambiano. Una serie (video, keyword, region)
+    osservata allo sweep precedente con gli stessi valori allunga la propria
+    riga (seen_until) invece di aggiungerne una, finché la riga ha meno di
+    KEYFRAME_HOURS; con extend=False ogni record è una riga nuova. Le righe
+    toccate prendono un nuovo seq (vedi SNAPSHOT_SEQ).
+    Non fa commit: resta nella transazione del chiamante, che va aperta con
+    BEGIN IMMEDIATE perché le righe da estendere si leggono dal db. Ritorna
+    il numero di righe inserite.
+    """
+    rows = [r for r in items if r.get("video_id")]
+    if not rows:
+        return 0
+    seq = next_version(conn, SNAPSHOT_SEQ)
+    conn.executemany("""
+        INSERT INTO videos (video_id, titolo, canale, data_pubblicazione) VALUES (?,?,?,?)
+        ON CONFLICT(video_id) DO UPDATE SET
+            titolo=excluded.titolo,
+            canale=excluded.canale,
+            data_pubblicazione=excluded.data_pubblicazione
+        WHERE titolo IS NOT excluded.titolo
+           OR canale IS NOT excluded.canale
+           OR data_pubblicazione IS NOT excluded.data_pubblicazione
+    """, [(r["video_id"], r.get("titolo"), r.get("canale"), r.get("data_pubblicazione")) for r in rows])
+    sweeps: dict[tuple[str, str, str], list[dict]] = {}
+    for r in rows:
+        key = (normalize_estrazione(r.get("estrazione")), r.get("keyword") or "", r.get("region") or "")
+        sweeps.setdefault(key, []).append(r)
+    # in ordine di estrazione: lo sweep successivo dello stesso batch estende il precedente
+    return sum(_append_sweep(conn, kw, reg, est, sweeps[(est, kw, reg)], seq, extend)
+               for est, kw, reg in sorted(sweeps))
+
+
+def trim_snapshots(conn: sqlite3.Connection, before: str) -> int:
+    """
+    Elimina lo storico grezzo precedente a `before`: una riga a cavallo del
+    taglio riparte dal primo sweep successivo. Nessun commit; ritorna le
+    righe eliminate.
+    """
+    conn.execute("""
+        UPDATE video_snapshots SET estrazione = (
+            SELECT MIN(w.estrazione) FROM snapshot_sweeps w
+            WHERE w.keyword = video_snapshots.keyword AND w.region = video_snapshots.region
+              AND w.estrazione >= ?1)
+        WHERE estrazione < ?1 AND seen_until >= ?1
+    """, (before,))
+    deleted = conn.execute("DELETE FROM video_snapshots WHERE seen_until < ?", (before,)).rowcount
+    conn.execute("DELETE FROM snapshot_sweeps WHERE estrazione < ?", (before,))
+    return deleted
+
+
+# una riga per serie e sweep (video_observations espande le righe sugli sweep)
+HISTORY_SQL = """
+SELECT s.video_id, v.titolo, v.canale, v.data_pubblicazione,
+       s.views, s.likes, s.comments, s.engagement_rate,
+       s.keyword, s.region, s.estrazione
+FROM video_observations s
+LEFT JOIN videos v ON v.video_id = s.video_id
+"""
+
+
+def video_history(conn: sqlite3.Connection, video_id: str) -> list[tuple]:
+    """
+    Storico di un video in ordine di estrazione (range scan sulla PK), rollup
+    orari e giornalieri compresi: lì estrazione è l'inizio del bucket.
+    """
+    sql = HISTORY_SQL.replace("FROM video_observations s", "FROM video_snapshots_all s")
+    return conn.execute(sql + " WHERE s.video_id = ? ORDER BY s.estrazione", (video_id,)).fetchall()
+
+
+def keyword_history(conn: sqlite3.Connection, keyword: str, since: str = "") -> list[tuple]:
+    """Snapshot di una keyword dopo `since` (idx_snapshots_series_until, poi PK di snapshot_sweeps)."""
+    return conn.execute(HISTORY_SQL + " WHERE s.keyword = ? AND s.estrazione > ? ORDER BY s.estrazione",
+                        (keyword, since)).fetchall()
+
+
+# ---- Delta sync -------------------------------------------------------------
+# Ogni batch scritto riceve un numero di versione crescente, salvato su ogni
+# riga di youtube_ads toccata: i client chiedono "tutto ciò che ha version > N".
+SYNC_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_youtube_ads_version ON youtube_ads (version, video_id);
+"""
+
+
+# Stesso contatore, con nome 'video_snapshots', per gli snapshot: seq cresce in
+# ordine di commit (i writer SQLite sono serializzati), quindi "seq > watermark"
+# non perde righe committate dopo, anche se hanno un'estrazione già letta o più
+# vecchia (pagine di uno sweep scritte in più batch, job paralleli).
+SNAPSHOT_SEQ = "video_snapshots"
+
+
+def current_version(conn: sqlite3.Connection, name: str = "youtube_ads") -> int:
+    row = conn.execute("SELECT version FROM sync_state WHERE name=?", (name,)).fetchone()
+    return row[0] if row else 0
+
+
+def next_version(conn: sqlite3.Connection, name: str = "youtube_ads") -> int:
+    """Incrementa e ritorna la versione; va chiamata dentro la transazione di scrittura."""
+    conn.execute("""
+        INSERT INTO sync_state (name, version) VALUES (?, 1)
+        ON CONFLICT(name) DO UPDATE SET version = version + 1
+    """, (name,))
+    return current_version(conn, name)
+
+
+# ---- Ricerca full-text -------------------------------------------------------
+# Indice FTS5 "external content" sopra la dimensione videos: i trigger lo
+# aggiornano a ogni upsert di append_snapshots, solo se titolo/canale cambiano.
+# prefix='2 3' precalcola i prefissi corti, così "tok*" resta un lookup.
+FTS_SCHEMA_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS videos_fts USING fts5(
+    titolo, canale,
+    content='videos', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+
+CREATE TRIGGER IF NOT EXISTS videos_fts_ai AFTER INSERT ON videos BEGIN
+    INSERT INTO videos_fts (rowid, titolo, canale) VALUES (new.rowid, new.titolo, new.canale);
+END;
+
+CREATE TRIGGER IF NOT EXISTS videos_fts_ad AFTER DELETE ON videos BEGIN
+    INSERT INTO videos_fts (videos_fts, rowid, titolo, canale) VALUES ('delete', old.rowid, old.titolo, old.canale);
+END;
+
+CREATE TRIGGER IF NOT EXISTS videos_fts_au AFTER UPDATE OF titolo, canale ON videos
+WHEN old.titolo IS NOT new.titolo OR old.canale IS NOT new.canale BEGIN
+    INSERT INTO videos_fts (videos_fts, rowid, titolo, canale) VALUES ('delete', old.rowid, old.titolo, old.canale);
+    INSERT INTO videos_fts (rowid, titolo, canale) VALUES (new.rowid, new.titolo, new.canale);
+END;
+"""
+
+# il titolo pesa il doppio del canale nel ranking bm25 (più basso = più rilevante)
+FTS_RANK = "bm25(videos_fts, 2.0, 1.0)"
+
+
+def fts_query(text: str) -> str | None:
+    """
+    Converte il testo libero in una query FTS5: ogni parola diventa un
+    prefisso quotato ("lamp"* trova "lampada"), tutte in AND.
+    None se non resta nessuna parola cercabile.
+    """
+    terms = [t.replace('"', '""') for t in text.split() if any(ch.isalnum() for ch in t)]
+    return " ".join(f'"{t}"*' for t in terms) or None
+
+
+# ---- Aggregati per la dashboard ----------------------------------------------
+# daily_members ha una riga per video osservato in (giorno, keyword, region),
+# con l'ultimo valore del giorno. I suoi trigger spostano il contributo del
+# video in daily_rollups (conteggio, somme) e daily_er_hist (istogramma
+# dell'engagement a bucket da 1/ER_BUCKETS_PER_POINT punti %): i grafici
+# leggono solo gli aggregati, il costo non dipende dal numero di snapshot.
+ER_BUCKETS_PER_POINT = 10
+ER_MAX_BUCKET = 500     # engagement >= 50% finisce nell'ultimo bucket
+
+
+def _er_bucket(ref: str) -> str:
+    return f"MIN(CAST(MAX(COALESCE({ref}.er, 0), 0) * {ER_BUCKETS_PER_POINT} + 1e-9 AS INTEGER), {ER_MAX_BUCKET})"
+
+
+_GROUP_OLD = "day = old.day AND keyword = old.keyword AND canale = old.canale AND region = old.region"
+
+_ADD_NEW = f"""
+    INSERT INTO daily_rollups (day, keyword, canale, region, videos, views_sum, er_sum)
+    VALUES (new.day, new.keyword, new.canale, new.region, 1, COALESCE(new.views, 0), COALESCE(new.er, 0))
+    ON CONFLICT (day, keyword, canale, region) DO UPDATE SET
+        videos = videos + 1,
+        views_sum = views_sum + excluded.views_sum,
+        er_sum = er_sum + excluded.er_sum;
+    INSERT INTO daily_er_hist (day, keyword, canale, region, bucket, n)
+    VALUES (new.day, new.keyword, new.canale, new.region, {_er_bucket("new")}, 1)
+    ON CONFLICT (day, keyword, canale, region, bucket) DO UPDATE SET n = n + 1;"""
+
+_SUB_OLD = f"""
+    UPDATE daily_rollups SET videos = videos - 1,
+        views_sum = views_sum - COALESCE(old.views, 0),
+        er_sum = er_sum - COALESCE(old.er, 0)
+    WHERE {_GROUP_OLD};
+    UPDATE daily_er_hist SET n = n - 1 WHERE {_GROUP_OLD} AND bucket = {_er_bucket("old")};
+    DELETE FROM daily_rollups WHERE {_GROUP_OLD} AND videos <= 0;
+    DELETE FROM daily_er_hist WHERE {_GROUP_OLD} AND n <= 0;"""
+
+# niente trigger sul DELETE: retention.py elimina i membri dei giorni chiusi
+# senza toccare gli aggregati
+DAILY_ROLLUP_SCHEMA_SQL = f"""
+CREATE TABLE IF NOT EXISTS daily_members (
+    day TEXT NOT NULL,
+    keyword TEXT NOT NULL DEFAULT '',
+    region TEXT NOT NULL DEFAULT '',
+    video_id TEXT NOT NULL,
+    canale TEXT NOT NULL DEFAULT '',
+    views INTEGER,
+    er REAL,
+    estrazione TEXT NOT NULL,
+    PRIMARY KEY (day, keyword, region, video_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS daily_rollups (
+    day TEXT NOT NULL,
+    keyword TEXT NOT NULL,
+    canale TEXT NOT NULL,
+    region TEXT NOT NULL,
+    videos INTEGER NOT NULL,
+    views_sum INTEGER NOT NULL,
+    er_sum REAL NOT NULL,
+    PRIMARY KEY (day, keyword, canale, region)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS daily_er_hist (
+    day TEXT NOT NULL,
+    keyword TEXT NOT NULL,
+    canale TEXT NOT NULL,
+    region TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    PRIMARY KEY (day, keyword, canale, region, bucket)
+) WITHOUT ROWID;
+
+CREATE TRIGGER IF NOT EXISTS daily_members_ai AFTER INSERT ON daily_members BEGIN{_ADD_NEW}
+END;
+
+CREATE TRIGGER IF NOT EXISTS daily_members_au AFTER UPDATE ON daily_members BEGIN{_SUB_OLD}{_ADD_NEW}
+END;
+"""
+
+# un video già contato nel giorno si aggiorna solo con un'estrazione più
+# recente e valori diversi (altrimenti nessuna scrittura, nessun trigger)
+MEMBER_UPSERT_SQL = """
+INSERT INTO daily_members (day, keyword, region, video_id, canale, views, er, estrazione)
+VALUES (?,?,?,?,?,?,?,?)
+ON CONFLICT (day, keyword, region, video_id) DO UPDATE SET
+    canale=excluded.canale,
+    views=excluded.views,
+    er=excluded.er,
+    estrazione=excluded.estrazione
+WHERE excluded.estrazione >= estrazione
+  AND (views IS NOT excluded.views OR er IS NOT excluded.er OR canale IS NOT excluded.canale)
+"""
+
+
+def member_key(r: dict) -> tuple[str, str, str, str]:
+    return r["estrazione"][:10], r.get("keyword") or "", r.get("region") or "", r["video_id"]
+
+
+def update_daily_rollups(conn: sqlite3.Connection, items: list[dict]) -> None:
+    """Aggiorna daily_members (e, dai trigger, gli aggregati). Nessun commit."""
+    conn.executemany(MEMBER_UPSERT_SQL, [
+        member_key(r) + (r.get("canale") or "", r.get("views"),
+                         r.get("engagement_rate", r.get("engagement")), r["estrazione"])
+        for r in items if r.get("video_id") and r.get("estrazione")])
+
+
+# ---- Stato dei trend ---------------------------------------------------------
+# Stato materializzato dell'analytics incrementale (analytics_incremental.py)
+# e del trend online (trending.py); analytics_watermark tiene, per nome, fin
+# dove ciascuno ha già letto gli snapshot (dalla migrazione 10 è un seq).
+TREND_STATE_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS analytics_watermark (
+    name TEXT PRIMARY KEY,
+    estrazione TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS video_trend_state (
+    video_id TEXT PRIMARY KEY,
+    keyword TEXT,
+    region TEXT,
+    estrazione_now TEXT,
+    views_now INTEGER,
+    likes_now INTEGER,
+    comments_now INTEGER,
+    er_now REAL,
+    estrazione_prev TEXT,
+    views_prev INTEGER,
+    likes_prev INTEGER,
+    comments_prev INTEGER,
+    er_prev REAL
+);
+
+CREATE TABLE IF NOT EXISTS keyword_trend_state (
+    keyword TEXT PRIMARY KEY,
+    snap_now TEXT,
+    views_now REAL,
+    likes_now REAL,
+    er_now REAL,
+    n_now INTEGER,
+    snap_prev TEXT,
+    views_prev REAL,
+    likes_prev REAL,
+    er_prev REAL,
+    n_prev INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS trend_velocity_state (
+    keyword TEXT NOT NULL,
+    region TEXT NOT NULL,
+    video_id TEXT NOT NULL,
+    last_estrazione TEXT NOT NULL,
+    last_views INTEGER,
+    last_velocity REAL,
+    ewma_velocity REAL,
+    ewma_accel REAL,
+    PRIMARY KEY (keyword, region, video_id)
+) WITHOUT ROWID;
+"""
+
+
+# letture incrementali "tutto ciò che è stato committato dopo il watermark"
+SNAPSHOT_SEQ_SCHEMA_SQL = """
+CREATE INDEX IF NOT EXISTS idx_snapshots_seq ON video_snapshots (seq);
+
+DROP TABLE IF EXISTS analytics_watermark;
+CREATE TABLE analytics_watermark (
+    name TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL
+);
+"""
+
+
+# chiave (keyword, region) anche per lo snapshot precedente: stesso spareggio
+# di analytics_sql quando un video compare per più keyword nello stesso istante
+VIDEO_TREND_PREV_KEY_SQL = """
+ALTER TABLE video_trend_state ADD COLUMN keyword_prev TEXT;
+ALTER TABLE video_trend_state ADD COLUMN region_prev TEXT;
+"""
+
+
+# Storico a intervalli: ogni riga di video_snapshots vale per tutti gli sweep
+# della sua (keyword, region) tra estrazione e seen_until. snapshot_sweeps ha
+# un seq per sweep (l'ultimo batch che l'ha toccato); video_observations
+# ricostruisce una riga per serie e sweep, con seq della riga e dello sweep.
+SNAPSHOT_RUNS_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS snapshot_sweeps (
+    keyword TEXT NOT NULL,
+    region TEXT NOT NULL,
+    estrazione TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (keyword, region, estrazione)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_sweeps_seq ON snapshot_sweeps (seq);
+CREATE INDEX IF NOT EXISTS idx_sweeps_estrazione ON snapshot_sweeps (estrazione);
+-- righe da estendere allo sweep successivo
+CREATE INDEX IF NOT EXISTS idx_snapshots_series_until ON video_snapshots (keyword, region, seen_until);
+
+CREATE VIEW IF NOT EXISTS video_observations AS
+SELECT s.video_id, w.estrazione, s.keyword, s.region, s.views, s.likes, s.comments,
+       s.engagement_rate, s.seq, w.seq AS sweep_seq
+FROM video_snapshots s
+JOIN snapshot_sweeps w ON w.keyword = s.keyword AND w.region = s.region
+ AND w.estrazione BETWEEN s.estrazione AND s.seen_until;
+
+DROP VIEW IF EXISTS video_snapshots_all;
+CREATE VIEW video_snapshots_all AS
+SELECT video_id, estrazione, keyword, region, views, likes, comments, engagement_rate, 'raw' AS granularity
+FROM video_observations
+UNION ALL
+SELECT video_id, estrazione, keyword, region, views, likes, comments, engagement_rate, 'hour'
+FROM video_snapshots_hourly
+UNION ALL
+SELECT video_id, estrazione, keyword, region, views, likes, comments, engagement_rate, 'day'
+FROM video_snapshots_daily;
+"""
+
+
+# ---- Migrazioni --------------------------------------------------------------
+# Ogni migrazione gira una sola volta, in ordine, nella propria transazione
+# (BEGIN IMMEDIATE: due processi che partono insieme non la applicano due volte).
+SCHEMA_VERSION_SQL = """
+CREATE TABLE IF NOT EXISTS schema_version (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    applied_at TEXT NOT NULL
+);
+"""
+
+# colonne di youtube_ads (SCHEMA_SQL) senza la PK, per aggiornare tabelle parziali
+_LATEST_COLUMNS = (
+    ("titolo", "TEXT"), ("canale", "TEXT"), ("data_pubblicazione", "TEXT"),
+    ("views", "INTEGER"), ("likes", "INTEGER"), ("comments", "INTEGER"),
+    ("region", "TEXT"), ("keyword", "TEXT"), ("estrazione", "TEXT"), ("engagement_rate", "REAL"),
+)
+
+HOT_INDEXES_SQL = """
+-- /get_youtube_data: filtro keyword e ordinamento di default (views)
+CREATE INDEX IF NOT EXISTS idx_youtube_ads_keyword ON youtube_ads (keyword, estrazione);
+CREATE INDEX IF NOT EXISTS idx_youtube_ads_views ON youtube_ads (COALESCE(views, 0), video_id);
+-- filtro canale e /channels (DISTINCT canale)
+CREATE INDEX IF NOT EXISTS idx_youtube_ads_canale ON youtube_ads (canale);
+"""
+
+
+# rollup dello storico: stesse colonne degli snapshot, estrazione = inizio del
+# bucket; valori dell'ultimo snapshot del bucket, views_first del primo
+ROLLUP_SCHEMA_SQL = "".join(f"""
+CREATE TABLE IF NOT EXISTS {table} (
+    video_id TEXT NOT NULL,
+    estrazione TEXT NOT NULL,
+    keyword TEXT NOT NULL DEFAULT '',
+    region TEXT NOT NULL DEFAULT '',
+    views INTEGER,
+    likes INTEGER,
+    comments INTEGER,
+    engagement_rate REAL,
+    views_first INTEGER,
+    samples INTEGER NOT NULL,
+    last_estrazione TEXT NOT NULL,
+    PRIMARY KEY (video_id, estrazione, keyword, region)
+) WITHOUT ROWID;
+""" for table in ("video_snapshots_hourly", "video_snapshots_daily")) + """
+CREATE VIEW IF NOT EXISTS video_snapshots_all AS
+SELECT video_id, estrazione, keyword, region, views, likes, comments, engagement_rate, 'raw' AS granularity
+FROM video_snapshots
+UNION ALL
+SELECT video_id, estrazione, keyword, region, views, likes, comments, engagement_rate, 'hour'
+FROM video_snapshots_hourly
+UNION ALL
+SELECT video_id, estrazione, keyword, region, views, likes, comments, engagement_rate, 'day'
+FROM video_snapshots_daily;
+"""
+
+
+def _run_script(conn: sqlite3.Connection, script: str):
+    """
+    Esegue uno script istruzione per istruzione dentro la transazione aperta
+    (executescript farebbe COMMIT). complete_statement gestisce i trigger.
+    """
+    stmt = ""
+    for line in script.splitlines(keepends=True):
+        stmt += line
+        if sqlite3.complete_statement(stmt):
+            conn.execute(stmt)
+            stmt = ""
+
+
+def _m_snapshots(conn: sqlite3.Connection):
+    """Tabelle time-series; la prima volta importa lo storico presente in youtube_ads."""
+    first_time = not _table_exists(conn, "video_snapshots")
+    _run_script(conn, SNAPSHOT_SCHEMA_SQL)
+    if first_time and _table_exists(conn, "youtube_ads"):
+        cols = _columns(conn, "youtube_ads")
+        c = {col: col if col in cols else "NULL" for col, _ in _LATEST_COLUMNS}
+        er = "engagement_rate" if "engagement_rate" in cols else "engagement" if "engagement" in cols else "NULL"
+        # in ordine di inserimento: per ogni video resta il titolo più recente
+        conn.execute(f"""
+            INSERT OR REPLACE INTO videos (video_id, titolo, canale, data_pubblicazione)
+            SELECT video_id, {c["titolo"]}, {c["canale"]}, {c["data_pubblicazione"]}
+            FROM youtube_ads WHERE video_id IS NOT NULL ORDER BY rowid
+        """)
+        conn.execute(f"""
+            INSERT OR IGNORE INTO video_snapshots ({", ".join(SNAPSHOT_COLUMNS)})
+            SELECT video_id, COALESCE({c["estrazione"]}, ''), COALESCE({c["keyword"]}, ''),
+                   COALESCE({c["region"]}, ''), {c["views"]}, {c["likes"]}, {c["comments"]}, {er}
+            FROM youtube_ads WHERE video_id IS NOT NULL
+        """)
+
+
+def _m_unify_youtube_ads(conn: sqlite3.Connection):
+    """
+    Un solo schema per youtube_ads (video_id PK, engagement_rate). La tabella
+    di main.init_db (id autoincrement, una riga per estrazione, `engagement`)
+    viene ricostruita tenendo l'ultima riga di ogni video: lo storico è già
+    in video_snapshots.
+    """
+    if not _table_exists(conn, "youtube_ads"):
+        _run_script(conn, SCHEMA_SQL)
+        return
+    info = conn.execute("PRAGMA table_info(youtube_ads);").fetchall()
+    cols = [r[1] for r in info]
+    pk = [r[1] for r in info if r[5]]
+    er = ("COALESCE(engagement_rate, engagement)" if {"engagement", "engagement_rate"} <= set(cols)
+          else "engagement" if "engagement" in cols else "engagement_rate")
+    if pk == ["video_id"]:
+        # schema di youtube_api con colonne aggiunte negli anni: completa quelle mancanti
+        for col, typ in _LATEST_COLUMNS:
+            if col not in cols:
+                conn.execute(f"ALTER TABLE youtube_ads ADD COLUMN {col} {typ};")
+        if "engagement" in cols:
+            conn.execute(f"UPDATE youtube_ads SET engagement_rate = {er}")
+            conn.execute("ALTER TABLE youtube_ads DROP COLUMN engagement")
+        return
+
+    order = "id" if "id" in cols else "rowid"
+    conn.execute("ALTER TABLE youtube_ads RENAME TO youtube_ads_legacy")
+    _run_script(conn, SCHEMA_SQL)
+    copy = [c for c, _ in _LATEST_COLUMNS if c in cols and c != "engagement_rate"]
+    conn.execute(f"""
+        INSERT INTO youtube_ads (video_id, {", ".join(copy)}, engagement_rate)
+        SELECT video_id, {", ".join(copy)}, {er} FROM youtube_ads_legacy
+        WHERE {order} IN (SELECT MAX({order}) FROM youtube_ads_legacy
+                          WHERE video_id IS NOT NULL GROUP BY video_id)
+    """)
+    conn.execute("DROP TABLE youtube_ads_legacy")
+
+
+def _m_sync(conn: sqlite3.Connection):
+    if "version" not in _columns(conn, "youtube_ads"):
+        conn.execute("ALTER TABLE youtube_ads ADD COLUMN version INTEGER NOT NULL DEFAULT 0;")
+    _run_script(conn, SYNC_SCHEMA_SQL)
+
+
+def _m_fts(conn: sqlite3.Connection):
+    _run_script(conn, FTS_SCHEMA_SQL)
+    conn.execute("INSERT INTO videos_fts (videos_fts) VALUES ('rebuild')")
+
+
+def _m_normalize_estrazione(conn: sqlite3.Connection):
+    """
+    Riscrive estrazione in ESTRAZIONE_FMT. Negli snapshot due formati dello
+    stesso istante collidono sulla PK: resta la riga già normalizzata.
+    Lo stato dell'analytics incrementale viene azzerato e ricostruito al
+    prossimo run, perché il watermark era nel vecchio formato.
+    """
+    conn.create_function("normalize_estrazione", 1, normalize_estrazione, deterministic=True)
+    conn.execute("UPDATE youtube_ads SET estrazione = normalize_estrazione(estrazione) "
+                 "WHERE estrazione != normalize_estrazione(estrazione)")
+    conn.execute("UPDATE OR IGNORE video_snapshots SET estrazione = normalize_estrazione(estrazione) "
+                 "WHERE estrazione != normalize_estrazione(estrazione)")
+    conn.execute("DELETE FROM video_snapshots WHERE estrazione != normalize_estrazione(estrazione)")
+    for table in ("video_trend_state", "keyword_trend_state", "analytics_watermark"):
+        if _table_exists(conn, table):
+            conn.execute(f"DELETE FROM {table}")
+
+
+def _m_hot_indexes(conn: sqlite3.Connection):
+    _run_script(conn, HOT_INDEXES_SQL)
+    conn.execute("ANALYZE")
+
+
+def _m_rollups(conn: sqlite3.Connection):
+    _run_script(conn, ROLLUP_SCHEMA_SQL)
+
+
+def _m_daily_rollups(conn: sqlite3.Connection):
+    """Crea gli aggregati e li popola dall'ultimo valore di ogni giorno dello storico."""
+    _run_script(conn, DAILY_ROLLUP_SCHEMA_SQL)
+    conn.execute("""
+        INSERT INTO daily_members (day, keyword, region, video_id, canale, views, er, estrazione)
+        SELECT day, keyword, region, video_id, canale, views, engagement_rate, estrazione
+        FROM (
+            SELECT substr(s.estrazione, 1, 10) AS day, s.keyword, s.region, s.video_id,
+                   COALESCE(v.canale, '') AS canale, s.views, s.engagement_rate, s.estrazione,
+                   ROW_NUMBER() OVER (PARTITION BY substr(s.estrazione, 1, 10), s.keyword, s.region, s.video_id
+                                      ORDER BY s.estrazione DESC) AS rn
+            FROM video_snapshots_all s
+            LEFT JOIN videos v ON v.video_id = s.video_id
+        )
+        WHERE rn = 1
+    """)
+
+
+def _m_trend_state(conn: sqlite3.Connection):
+    """Tabelle di stato dei trend; sui db dove i moduli le avevano già create non cambia nulla."""
+    _run_script(conn, TREND_STATE_SCHEMA_SQL)
+
+
+def _m_snapshot_seq(conn: sqlite3.Connection):
+    """
+    seq in ordine di commit sugli snapshot; i watermark passano da estrazione
+    a seq. Le righe esistenti valgono seq 1 (DEFAULT, nessuna riscrittura) e
+    lo stato dei trend viene azzerato: il prossimo run lo ricostruisce.
+    """
+    conn.execute("ALTER TABLE video_snapshots ADD COLUMN seq INTEGER NOT NULL DEFAULT 1")
+    _run_script(conn, SNAPSHOT_SEQ_SCHEMA_SQL)
+    conn.execute("INSERT OR IGNORE INTO sync_state (name, version) VALUES (?, 1)", (SNAPSHOT_SEQ,))
+    for table in ("video_trend_state", "keyword_trend_state", "trend_velocity_state"):
+        conn.execute(f"DELETE FROM {table}")
+
+
+def _m_video_trend_prev_key(conn: sqlite3.Connection):
+    """Keyword e region dello snapshot precedente; lo stato viene ricostruito al prossimo run."""
+    _run_script(conn, VIDEO_TREND_PREV_KEY_SQL)
+    for table in ("video_trend_state", "keyword_trend_state"):
+        conn.execute(f"DELETE FROM {table}")
+    conn.execute("DELETE FROM analytics_watermark WHERE name='trend_state'")
+
+
+def _m_snapshot_runs(conn: sqlite3.Connection):
+    """
+    Storico a intervalli (seen_until) e registro degli sweep. Le righe
+    esistenti valgono per la propria estrazione: le letture non cambiano e
+    i watermark restano validi (ogni sweep prende il seq più alto delle sue righe).
+    """
+    conn.execute("ALTER TABLE video_snapshots ADD COLUMN seen_until TEXT NOT NULL DEFAULT ''")
+    conn.execute("UPDATE video_snapshots SET seen_until = estrazione")
+    _run_script(conn, SNAPSHOT_RUNS_SCHEMA_SQL)
+    conn.execute("""
+        INSERT INTO snapshot_sweeps (keyword, region, estrazione, seq)
+        SELECT keyword, region, estrazione, MAX(seq) FROM video_snapshots GROUP BY keyword, region, estrazione
+    """)
+
+
+def _m_backfill_version(conn: sqlite3.Connection):
+    """
+    Righe di youtube_ads ferme a version 0 (scritte prima del delta sync):
+    /changes restituisce solo version > since, quindi prendono una versione
+    nuova e arrivano anche ai client che partono da since=0.
+    """
+    if conn.execute("SELECT 1 FROM youtube_ads WHERE version = 0 LIMIT 1").fetchone():
+        conn.execute("UPDATE youtube_ads SET version = ? WHERE version = 0", (next_version(conn),))
+
+
+# (versione, descrizione, funzione): si aggiungono solo in coda
+MIGRATIONS = (
+    (1, "tabelle time-series videos/video_snapshots", _m_snapshots),
+    (2, "youtube_ads unificata (video_id PK, engagement_rate)", _m_unify_youtube_ads),
+    (3, "versione per il delta sync", _m_sync),
+    (4, "indice full-text videos_fts", _m_fts),
+    (5, "estrazione in formato ISO UTC", _m_normalize_estrazione),
+    (6, "indici per le query frequenti", _m_hot_indexes),
+    (7, "rollup orari e giornalieri dello storico", _m_rollups),
+    (8, "aggregati giornalieri per keyword/canale/region", _m_daily_rollups),
+    (9, "stato di analytics incrementale e trending", _m_trend_state),
+    (10, "seq di commit sugli snapshot per i watermark", _m_snapshot_seq),
+    (11, "keyword dello snapshot precedente nello stato dei trend", _m_video_trend_prev_key),
+    (12, "storico a intervalli con registro degli sweep", _m_snapshot_runs),
+    (13, "versione del delta sync per le righe precedenti", _m_backfill_version),
+)
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def ensure_schema(conn: sqlite3.Connection) -> list[int]:
+    """
+    Porta il db all'ultima versione dello schema applicando le migrazioni
+    mancanti. Con il db aggiornato costa una sola SELECT. Ritorna le versioni
+    applicate ora.
+    """
+    conn.execute(SCHEMA_VERSION_SQL)
+    if schema_version(conn) >= SCHEMA_VERSION:
+        return []
+    applied = []
+    for version, name, migration in MIGRATIONS:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            migration(conn)
+            conn.execute("INSERT INTO schema_version (version, name, applied_at) VALUES (?,?,?)",
+                         (version, name, now_estrazione()))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+# ---- Writer -----------------------------------------------------------------
+UPSERT_LATEST_SQL = """
+INSERT INTO youtube_ads (
+    video_id, titolo, canale, data_pubblicazione, views, likes, comments,
+    region, keyword, estrazione, engagement_rate, version
+) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
+ON CONFLICT(video_id) DO UPDATE SET
+    titolo=excluded.titolo,
+    canale=excluded.canale,
+    data_pubblicazione=excluded.data_pubblicazione,
+    views=excluded.views,
+    likes=excluded.likes,
+    comments=excluded.comments,
+    region=excluded.region,
+    keyword=excluded.keyword,
+    estrazione=excluded.estrazione,
+    engagement_rate=excluded.engagement_rate,
+    version=excluded.version;
+"""
+
+REQUIRED_FIELDS = ("video_id", "titolo", "canale", "data_pubblicazione", "views", "likes",
+                   "comments", "region", "keyword", "estrazione", "engagement_rate")
+
+# limite prudente di parametri per una singola IN (...) su SQLite
+_IN_CHUNK = 900
+
+def connect(db_path: str = "spyads.db") -> sqlite3.Connection:
+    """Connessione con i PRAGMA di produzione (WAL, cache, mmap)."""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    for p in PRAGMAS:
+        conn.execute(p)
+    return conn
+
+
+# colonne di youtube_ads confrontate dal change-data-capture
+_CDC_FIELDS = ("titolo", "canale", "views", "likes", "comments")
+
+
+class StorageWriter:
+    """
+    Writer con una connessione persistente: ogni batch è una sola transazione
+    con executemany su youtube_ads (ultimo stato) e video_snapshots (storico).
+
+    Change-data-capture: un record con titolo, canale, views, likes e
+    comments uguali alla riga attuale di youtube_ads non la riscrive, e la
+    versione del delta sync non avanza (/changes e gli ETag della dashboard
+    restano fermi). Nello storico una serie invariata allunga la riga
+    esistente invece di aggiungerne una (append_snapshots); video_observations
+    ne ricostruisce ogni estrazione. Il confronto legge il db nella stessa
+    transazione del batch (BEGIN IMMEDIATE), niente cache: vale anche con
+    più processi che scrivono. Con cdc=False ogni record riscrive youtube_ads
+    e aggiunge una riga di storico (check_cdc.py).
+    Gli aggregati giornalieri (update_daily_rollups) si aggiornano nella
+    stessa transazione.
+    """
+
+    def __init__(self, db_path: str = "spyads.db", cdc: bool = True):
+        self.db_path = db_path
+        self.cdc = cdc
+        self.conn = connect(db_path)
+        ensure_schema(self.conn)
+        self.unchanged = 0
+
+    def _latest(self, ids: list[str]) -> dict[str, tuple]:
+        """Valori attuali di youtube_ads (_CDC_FIELDS) per i video dati."""
+        found: dict[str, tuple] = {}
+        for i in range(0, len(ids), _IN_CHUNK):
+            chunk = ids[i:i + _IN_CHUNK]
+            marks = ",".join("?" * len(chunk))
+            found.update((r[0], r[1:]) for r in self.conn.execute(
+                f"SELECT video_id, {', '.join(_CDC_FIELDS)} FROM youtube_ads WHERE video_id IN ({marks})", chunk))
+        return found
+
+    def write(self, items: list[dict]) -> tuple[int, int, int]:
+        """
+        Scrive un batch; ritorna (inserted, updated, ignored) esatti:
+        inserted = video non presenti prima, updated = video già presenti
+        (anche se ripetuti nel batch), ignored = record incompleti. I record
+        senza variazioni non toccano youtube_ads e si sommano a
+        self.unchanged.
+        """
+        valid = [dict(r, estrazione=normalize_estrazione(r["estrazione"])) for r in items
+                 if r.get("video_id") and all(k in r for k in REQUIRED_FIELDS)]
+        ignored = len(items) - len(valid)
+        if not valid:
+            return 0, 0, ignored
+
+        inserted = updated = 0
+        with self.conn:
+            self.conn.execute("BEGIN IMMEDIATE")
+            latest = self._latest(list({r["video_id"] for r in valid}))
+            changed = []
+            for r in valid:
+                values = tuple(r[k] for k in _CDC_FIELDS)
+                current = latest.get(r["video_id"])
+                if self.cdc and current == values:
+                    continue
+                changed.append(r)
+                if current is None:
+                    inserted += 1
+                else:
+                    updated += 1
+                latest[r["video_id"]] = values
+            if changed:
+                version = next_version(self.conn)
+                self.conn.executemany(UPSERT_LATEST_SQL, [
+                    tuple(r[k] for k in REQUIRED_FIELDS) + (version,) for r in changed])
+            append_snapshots(self.conn, valid, extend=self.cdc)
+            # un membro già contato con gli stessi valori non viene riscritto (MEMBER_UPSERT_SQL)
+            update_daily_rollups(self.conn, valid)
+        self.unchanged += len(valid) - len(changed)
+        return inserted, updated, ignored
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,222 @@
+# transport.py
+# SpyAds Pro — Trasporto HTTP condiviso per le chiamate YouTube Data API
+#
+# - una sola requests.Session keep-alive, con al più `max_per_host` connessioni
+#   per host (pool_block: i thread in eccesso aspettano una connessione libera)
+# - retry su errori di rete, 429, 5xx e 403 rateLimitExceeded, con backoff
+#   esponenziale e jitter; se l'API manda Retry-After si aspetta almeno quello,
+#   e se chiede più di `backoff_max` non si ritenta: RetryLater, con i secondi
+#   indicati, lascia al chiamante rimandare il lavoro
+# - circuit breaker per host: dopo `breaker_threshold` errori consecutivi le
+#   richieste falliscono subito (CircuitOpen) per `breaker_cooldown` secondi,
+#   poi passa una sola richiesta di prova
+# - latenze per endpoint (p50/p95/p99) su una finestra degli ultimi tentativi
+#
+# quotaExceeded non viene ritentato: la risposta torna al chiamante.
+#
+# Uso: from transport import Transport
+#      t = Transport(); r = t.get(url, params, endpoint="search.list")
+
+import math
+import time
+import random
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Callable
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = 15
+MAX_PER_HOST = 8
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5      # secondi, raddoppia a ogni tentativo
+BACKOFF_MAX = 30.0
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN = 60.0
+LATENCY_WINDOW = 2048
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# 403 transitori dell'API (limite per secondo, non la quota giornaliera)
+RETRY_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "backendError"}
+
+
+class CircuitOpen(requests.ConnectionError):
+    """Host temporaneamente escluso dopo troppi errori consecutivi."""
+
+
+class RetryLater(requests.RequestException):
+    """L'API chiede di riprovare tra `retry_after` secondi, oltre il backoff massimo."""
+
+    def __init__(self, message: str, retry_after: float, response: requests.Response | None = None):
+        super().__init__(message, response=response)
+        self.retry_after = retry_after
+
+
+def _is_retryable(r: requests.Response) -> bool:
+    if r.status_code in RETRY_STATUS:
+        return True
+    if r.status_code != 403:
+        return False
+    try:
+        errors = r.json().get("error", {}).get("errors", [])
+    except ValueError:
+        return False
+    return any(e.get("reason") in RETRY_REASONS for e in errors)
+
+
+def retry_after(r: requests.Response | None) -> float | None:
+    """Secondi indicati da Retry-After (intero o data HTTP), se presente."""
+    value = r.headers.get("Retry-After") if r is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _percentile(sorted_values: list[float], p: float) -> float:
+    i = min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[i]
+
+
+class _Breaker:
+    def __init__(self):
+        self.failures = 0
+        self.open_until = 0.0
+        self.trial = False      # richiesta di prova in corso (half-open)
+
+
+class Transport:
+    """Sessione HTTP condivisa tra thread; get() ritorna la risposta finale."""
+
+    def __init__(self, max_per_host: int = MAX_PER_HOST, timeout: float = DEFAULT_TIMEOUT,
+                 max_retries: int = MAX_RETRIES, backoff_base: float = BACKOFF_BASE,
+                 backoff_max: float = BACKOFF_MAX, breaker_threshold: int = BREAKER_THRESHOLD,
+                 breaker_cooldown: float = BREAKER_COOLDOWN, session: requests.Session | None = None):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.sleep = time.sleep
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_per_host, pool_block=True)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
+        self._lock = threading.Lock()
+        self._breakers: dict[str, _Breaker] = {}
+        self._latency: dict[str, deque] = {}
+        self._counts: dict[str, dict] = {}
+
+    # ---- circuit breaker ------------------------------------------------------
+    def _acquire(self, host: str):
+        with self._lock:
+            b = self._breakers.setdefault(host, _Breaker())
+            if b.failures < self.breaker_threshold:
+                return
+            wait = b.open_until - time.monotonic()
+            if wait > 0 or b.trial:
+                raise CircuitOpen(f"{host}: circuito aperto dopo {b.failures} errori consecutivi"
+                                  + (f", riprova tra {wait:.0f}s" if wait > 0 else ""))
+            b.trial = True
+
+    def _release(self, host: str, ok: bool | None):
+        """ok=None: nessuna richiesta partita, libera solo l'eventuale prova."""
+        with self._lock:
+            b = self._breakers[host]
+            b.trial = False
+            if ok is None:
+                return
+            if ok:
+                b.failures = 0
+                return
+            b.failures += 1
+            if b.failures >= self.breaker_threshold:
+                b.open_until = time.monotonic() + self.breaker_cooldown
+
+    # ---- metriche ---------------------------------------------------------------
+    def _record(self, endpoint: str, elapsed: float, outcome: str):
+        with self._lock:
+            self._latency.setdefault(endpoint, deque(maxlen=LATENCY_WINDOW)).append(elapsed)
+            counts = self._counts.setdefault(endpoint, {"ok": 0, "retries": 0, "errors": 0})
+            counts[outcome] += 1
+
+    def latency_summary(self) -> dict[str, dict]:
+        """Per endpoint: tentativi ok, retry, errori e latenze p50/p95/p99 in ms."""
+        with self._lock:
+            snapshot = {ep: (sorted(v), dict(self._counts[ep])) for ep, v in self._latency.items()}
+        out = {}
+        for ep, (values, counts) in snapshot.items():
+            out[ep] = {**counts, "samples": len(values),
+                       **{f"p{p}_ms": round(_percentile(values, p) * 1000, 1) for p in (50, 95, 99)}}
+        return out
+
+    # ---- richieste --------------------------------------------------------------
+    def _backoff(self, attempt: int, response: requests.Response | None) -> float:
+        """Attesa prima del prossimo tentativo: mai meno di Retry-After."""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        hint = retry_after(response)
+        return delay if hint is None else max(delay, hint)
+
+    def get(self, url: str, params: dict | None = None, headers: dict | None = None,
+            endpoint: str | None = None, before_send: Callable[[], None] | None = None) -> requests.Response:
+        """
+        GET con retry. `before_send` viene chiamata prima di ogni tentativo (es.
+        addebito quota). Esauriti i tentativi torna l'ultima risposta, oppure
+        rilancia l'ultimo errore di rete; nessun raise_for_status qui. Se
+        Retry-After supera backoff_max solleva RetryLater senza attendere.
+        """
+        host = urlsplit(url).netloc
+        endpoint = endpoint or host + urlsplit(url).path
+        attempt = 0
+        while True:
+            self._acquire(host)
+            if before_send is not None:
+                try:
+                    before_send()
+                except BaseException:
+                    self._release(host, None)
+                    raise
+            t0 = time.perf_counter()
+            response = error = None
+            try:
+                response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+                failed = _is_retryable(response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error, failed = e, True
+            self._release(host, not failed)
+            delay = self._backoff(attempt, response) if failed else 0.0
+            last = attempt >= self.max_retries or delay > self.backoff_max
+            self._record(endpoint, time.perf_counter() - t0,
+                         "ok" if not failed else ("errors" if last else "retries"))
+            if not failed or attempt >= self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+            if delay > self.backoff_max:
+                raise RetryLater(f"{endpoint}: HTTP {response.status_code}, "
+                                 f"Retry-After {delay:.0f}s oltre il massimo di {self.backoff_max:.0f}s",
+                                 delay, response)
+            self.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self.session.close()
+
+
+def latency_lines(transport: Transport) -> list[str]:
+    """Una riga leggibile per endpoint (per i riepiloghi dei runner)."""
+    return [f"{ep}: {s['ok']} ok, {s['retries']} retry, {s['errors']} errori | "
+            f"p50 {s['p50_ms']} ms · p95 {s['p95_ms']} ms · p99 {s['p99_ms']} ms"
+            for ep, s in transport.latency_summary().items()]
@@ -0,0 +1,238 @@
+# trending.py
+# SpyAds Pro — Trend online: velocità delle views (views/ora) con EWMA e top-K
+#
+# Per ogni (keyword, region, video) resta uno stato di poche colonne: ultime
+# views, velocità istantanea, EWMA di velocità e accelerazione. Ogni nuovo
+# snapshot lo aggiorna in O(1), pesando il tempo trascorso (α dipende da Δt,
+# con emivita HALF_LIFE_H). Per ogni (keyword, region) un min-heap limitato a
+# K elementi tiene i video più caldi: "cosa sale adesso" non rilegge lo storico.
+#
+# Lo stato è salvato in trend_velocity_state (tabella creata dalle migrazioni
+# di storage); i nuovi snapshot si leggono dal watermark, un seq in ordine di
+# commit (range scan su idx_snapshots_seq).
+#
+# Uso: python trending.py [--keyword kw] [--region IT] [-n 10] [--rebuild]
+
+import heapq
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from storage import ensure_schema, current_version, ESTRAZIONE_FMT, SNAPSHOT_SEQ
+
+HALF_LIFE_H = 6.0       # emivita dell'EWMA, in ore
+ACCEL_HORIZON_H = 1.0   # score = velocità prevista tra ACCEL_HORIZON_H ore
+TOP_K = 50
+
+WATERMARK = "trending"
+
+_STATE_COLUMNS = ("keyword", "region", "video_id", "last_estrazione", "last_views",
+                  "last_velocity", "ewma_velocity", "ewma_accel")
+
+
+@lru_cache(maxsize=4096)
+def _hours(estrazione: str) -> float:
+    """estrazione -> ore dall'epoch (uno sweep condivide lo stesso timestamp: cache)."""
+    dt = datetime.strptime(estrazione, ESTRAZIONE_FMT).replace(tzinfo=timezone.utc)
+    return dt.timestamp() / 3600.0
+
+
+class TopK:
+    """
+    Min-heap con al più `k` video vivi. Un video rivalutato viene reinserito
+    con il nuovo score; la voce vecchia resta nell'heap come "stale" e viene
+    scartata quando arriva in cima (o alla compattazione periodica).
+    """
+
+    def __init__(self, k: int = TOP_K):
+        self.k = k
+        self._heap: list[tuple[float, str]] = []
+        self.scores: dict[str, float] = {}
+
+    def push(self, video_id: str, score: float):
+        if self.scores.get(video_id) == score:
+            return
+        if len(self.scores) >= self.k and video_id not in self.scores and score <= self._heap[0][0]:
+            return     # non entra: più freddo del K-esimo
+        self.scores[video_id] = score
+        heapq.heappush(self._heap, (score, video_id))
+        while self._heap:
+            s, vid = self._heap[0]
+            stale = self.scores.get(vid) != s
+            if not stale and len(self.scores) <= self.k:
+                break
+            heapq.heappop(self._heap)
+            if not stale:
+                del self.scores[vid]
+        if len(self._heap) > 2 * self.k + 16:
+            self._heap = [(s, v) for v, s in self.scores.items()]
+            heapq.heapify(self._heap)
+
+    def top(self, n: int | None = None) -> list[tuple[str, float]]:
+        return sorted(self.scores.items(), key=lambda kv: (-kv[1], kv[0]))[:n]
+
+
+class TrendEngine:
+    """Stato per video + top-K per (keyword, region); thread-safe."""
+
+    def __init__(self, k: int = TOP_K, half_life_h: float = HALF_LIFE_H):
+        self.k = k
+        self.half_life_h = half_life_h
+        self.state: dict[tuple[str, str, str], list] = {}
+        self.tops: dict[tuple[str, str], TopK] = {}
+        self.watermark = 0
+        self._dirty: set[tuple[str, str, str]] = set()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def score(st: list) -> float:
+        """Velocità EWMA proiettata di ACCEL_HORIZON_H ore (solo accelerazione positiva)."""
+        return st[3] + ACCEL_HORIZON_H * max(st[4], 0.0)
+
+    def _rank(self, key: tuple[str, str, str], st: list):
+        if st[3] is None:
+            return     # un solo snapshot: velocità ancora ignota
+        top = self.tops.get(key[:2])
+        if top is None:
+            top = self.tops[key[:2]] = TopK(self.k)
+        top.push(key[2], self.score(st))
+
+    def update(self, keyword: str, region: str, video_id: str, estrazione: str, views) -> bool:
+        """
+        Applica uno snapshot in O(1) (+ O(log K) per l'heap). Snapshot non più
+        recenti dell'ultimo visto per la stessa chiave vengono ignorati.
+        """
+        key = (keyword, region, video_id)
+        views = int(views or 0)
+        st = self.state.get(key)
+        if st is None:
+            # [last_estrazione, last_views, last_velocity, ewma_velocity, ewma_accel]
+            self.state[key] = [estrazione, views, None, None, 0.0]
+            self._dirty.add(key)
+            return True
+        if estrazione <= st[0]:
+            return False
+        dt = _hours(estrazione) - _hours(st[0])
+        velocity = (views - st[1]) / dt
+        alpha = 1.0 - 0.5 ** (dt / self.half_life_h)
+        if st[3] is None:
+            st[3] = velocity
+        else:
+            accel = (velocity - st[2]) / dt
+            st[3] += alpha * (velocity - st[3])
+            st[4] += alpha * (accel - st[4])
+        st[0], st[1], st[2] = estrazione, views, velocity
+        self._dirty.add(key)
+        self._rank(key, st)
+        return True
+
+    # ---- persistenza ----------------------------------------------------------
+    def load(self, con: sqlite3.Connection):
+        """Ricarica lo stato salvato e ricostruisce gli heap (una volta per processo)."""
+        with self._lock:
+            self.state.clear()
+            self.tops.clear()
+            for kw, reg, vid, est, views, vel, ev, ea in con.execute(
+                    f"SELECT {', '.join(_STATE_COLUMNS)} FROM trend_velocity_state"):
+                st = [est, views or 0, vel, ev, ea or 0.0]
+                self.state[(kw, reg, vid)] = st
+                self._rank((kw, reg, vid), st)
+            row = con.execute("SELECT seq FROM analytics_watermark WHERE name=?", (WATERMARK,)).fetchone()
+            self.watermark = row[0] if row else 0
+
+    def refresh(self, con: sqlite3.Connection) -> int:
+        """
+        Applica le osservazioni committate dopo il watermark (seq, come
+        analytics_incremental.update_state) e salva gli stati toccati. Uno
+        snapshot arrivato in ritardo, non più recente dell'ultimo applicato
+        alla sua serie, viene scartato da update(). Senza snapshot nuovi né
+        stati da salvare non scrive nulla: /trending la chiama a ogni GET.
+        """
+        with self._lock:
+            con.execute("BEGIN")    # limite e righe dalla stessa istantanea
+            try:
+                hi = current_version(con, SNAPSHOT_SEQ)
+                rows = [] if hi <= self.watermark else con.execute("""
+                    SELECT keyword, region, video_id, estrazione, views FROM video_observations
+                    WHERE seq > ?1 AND seq <= ?2 AND sweep_seq > ?1 ORDER BY estrazione
+                """, (self.watermark, hi)).fetchall()
+            finally:
+                con.commit()
+            if hi <= self.watermark and not self._dirty:
+                return 0
+            applied = sum(self.update(*r) for r in rows)
+            self.watermark = max(self.watermark, hi)
+            dirty = [k + tuple(self.state[k]) for k in self._dirty]
+            with con:
+                con.executemany(f"""
+                    INSERT OR REPLACE INTO trend_velocity_state ({', '.join(_STATE_COLUMNS)})
+                    VALUES (?,?,?,?,?,?,?,?)
+                """, dirty)
+                con.execute("""
+                    INSERT INTO analytics_watermark (name, seq) VALUES (?, ?)
+                    ON CONFLICT(name) DO UPDATE SET seq=excluded.seq
+                """, (WATERMARK, self.watermark))
+            self._dirty.clear()
+            return applied
+
+    # ---- query ------------------------------------------------------------------
+    def hot(self, keyword: str | None = None, region: str | None = None, n: int = 10) -> list[dict]:
+        """I video più caldi: per (keyword, region) o fondendo gli heap che corrispondono."""
+        with self._lock:
+            ranked = []
+            for (kw, reg), top in self.tops.items():
+                if (keyword is None or kw == keyword) and (region is None or reg == region):
+                    for vid, score in top.top(n):
+                        st = self.state[(kw, reg, vid)]
+                        ranked.append({"video_id": vid, "keyword": kw, "region": reg,
+                                       "score": round(score, 3), "views": st[1],
+                                       "views_per_hour": round(st[3], 3), "accel": round(st[4], 3),
+                                       "estrazione": st[0]})
+        ranked.sort(key=lambda r: (-r["score"], r["video_id"]))
+        return ranked[:n]
+
+
+def reset_trending(con: sqlite3.Connection):
+    with con:
+        con.execute("DELETE FROM trend_velocity_state")
+        con.execute("DELETE FROM analytics_watermark WHERE name=?", (WATERMARK,))
+
+
+def open_engine(con: sqlite3.Connection, k: int = TOP_K) -> TrendEngine:
+    """Engine caricato dal db e allineato agli ultimi snapshot."""
+    ensure_schema(con)
+    engine = TrendEngine(k)
+    engine.load(con)
+    engine.refresh(con)
+    return engine
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Video più caldi per velocità delle views")
+    ap.add_argument("--keyword")
+    ap.add_argument("--region")
+    ap.add_argument("-n", type=int, default=10)
+    ap.add_argument("--rebuild", action="store_true", help="ricalcola lo stato da tutto lo storico")
+    ap.add_argument("--db", default="spyads.db")
+    args = ap.parse_args()
+
+    con = sqlite3.connect(args.db)
+    try:
+        if args.rebuild:
+            ensure_schema(con)
+            reset_trending(con)
+        engine = open_engine(con)
+        hot = engine.hot(args.keyword, args.region.upper() if args.region else None, args.n)
+        titles = dict(con.execute(
+            f"SELECT video_id, titolo FROM videos WHERE video_id IN ({','.join('?' * len(hot))})",
+            [h["video_id"] for h in hot]).fetchall()) if hot else {}
+    finally:
+        con.close()
+
+    if not hot:
+        print("⚠️  Servono almeno due estrazioni per stimare la velocità.")
+    for i, h in enumerate(hot, 1):
+        print(f"{i:>2}. {(titles.get(h['video_id']) or h['video_id'])[:55]:<55} "
+              f"{h['views_per_hour']:>10.1f} views/h  acc {h['accel']:>+8.1f}  [{h['keyword']}/{h['region']}]")
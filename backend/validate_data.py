@@ -1,51 +1,184 @@
+import re
 import sqlite3
-import pandas as pd
+from datetime import datetime
+
+from storage import duplicate_counts
 
 DB_PATH = "spyads.db"
+CHUNK_SIZE = 5000
+
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}")
+
+# Regole per colonna:
+#   required   -> conta NULL/stringhe vuote
+#   min / max  -> valori numerici fuori intervallo
+#   date       -> deve iniziare con YYYY-MM-DD ed essere una data ISO valida
+#   unique     -> duplicati contati in SQL (GROUP BY), vedi anche UNIQUE_KEYS
+#   allowed    -> insieme di valori ammessi
+DEFAULT_RULES = {
+    "video_id":           {"required": True},
+    "titolo":             {"required": True},
+    "canale":             {"required": True},
+    "data_pubblicazione": {"required": True, "date": True},
+    "views":              {"required": True, "min": 0},
+    "likes":              {"min": 0},
+    "comments":           {"min": 0},
+    "engagement_rate":    {"min": 0, "max": 100},
+    "estrazione":         {"required": True, "date": True},
+}
+
+SNAPSHOT_RULES = {
+    "video_id":           {"required": True},
+    "views":              {"required": True, "min": 0},
+    "likes":              {"min": 0},
+    "comments":           {"min": 0},
+    "engagement_rate":    {"min": 0, "max": 100},
+    "estrazione":         {"required": True, "date": True},
+}
+
+# Chiavi (anche composte, anche espressioni SQL) che devono restare uniche.
+# Le chiavi primarie le garantisce già SQLite: qui si cercano i duplicati
+# logici, come la stessa serie estratta due volte nello stesso minuto (i trend
+# per keyword raggruppano per minuto).
+UNIQUE_KEYS = {
+    "video_observations": [("video_id", "keyword", "region", "substr(estrazione, 1, 16)")],
+}
+
+
+def _valid_date(value) -> bool:
+    if not isinstance(value, str) or not _DATE_RE.match(value):
+        return False
+    try:
+        datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return False
+    return True
+
+
+class StreamingValidator:
+    """
+    Validatore a memoria costante: riceve le righe a blocchi e aggiorna
+    contatori per colonna. I duplicati (`unique`) non si contano qui: li
+    calcola validate_table in SQL, senza tenere i valori in memoria.
+    """
+
+    def __init__(self, rules: dict | None = None):
+        self.rules = rules or DEFAULT_RULES
+        self.rows_total = 0
+        self.counters = {col: {"nulls": 0, "below_min": 0, "above_max": 0, "invalid_dates": 0,
+                               "not_allowed": 0, "non_numeric": 0}
+                         for col in self.rules}
+        # chiave ("video_id, keyword, ...") -> righe duplicate
+        self.duplicates: dict[str, int] = {}
+        self.missing_columns: list[str] = []
+
+    def feed(self, rows: list[tuple], columns: list[str]):
+        """Aggiorna i contatori con un blocco di righe (tuple nell'ordine di `columns`)."""
+        idx = {c: i for i, c in enumerate(columns)}
+        self.missing_columns = [c for c in self.rules if c not in idx]
+        checks = [(col, idx[col], rule, self.counters[col]) for col, rule in self.rules.items() if col in idx]
+        for row in rows:
+            self.rows_total += 1
+            for col, i, rule, cnt in checks:
+                v = row[i]
+                if v is None or v == "":
+                    if rule.get("required"):
+                        cnt["nulls"] += 1
+                    continue
+                if "min" in rule or "max" in rule:
+                    try:
+                        num = float(v)
+                    except (TypeError, ValueError):
+                        cnt["non_numeric"] += 1
+                        continue
+                    if "min" in rule and num < rule["min"]:
+                        cnt["below_min"] += 1
+                    if "max" in rule and num > rule["max"]:
+                        cnt["above_max"] += 1
+                if rule.get("date") and not _valid_date(v):
+                    cnt["invalid_dates"] += 1
+                if "allowed" in rule and v not in rule["allowed"]:
+                    cnt["not_allowed"] += 1
+
+    def report(self) -> dict:
+        columns = {col: {k: n for k, n in cnt.items() if n} for col, cnt in self.counters.items()}
+        duplicates = {k: n for k, n in self.duplicates.items() if n}
+        issues = sum(sum(c.values()) for c in columns.values()) + sum(duplicates.values())
+        return {
+            "rows_total": self.rows_total,
+            "issues": issues,
+            "ok": issues == 0 and not self.missing_columns,
+            "missing_columns": self.missing_columns,
+            "columns": {col: c for col, c in columns.items() if c},
+            "duplicates": duplicates,
+        }
+
+
+def validate_table(conn: sqlite3.Connection, table: str = "youtube_ads", rules: dict | None = None,
+                   unique: list[tuple[str, ...]] | None = None, chunk_size: int = CHUNK_SIZE) -> dict:
+    """
+    Valida `table` leggendola a blocchi di `chunk_size` righe; ritorna il report strutturato.
+    I duplicati si contano in SQL sulle chiavi `unique` (default UNIQUE_KEYS[table])
+    e sulle colonne con regola `unique`.
+    """
+    validator = StreamingValidator(rules)
+    cols = [r[1] for r in conn.execute(f"PRAGMA table_info({table});")]
+    validator.missing_columns = [c for c in validator.rules if c not in cols]
+    if not cols:
+        rep = validator.report()
+        rep.update(table=table, ok=False, missing_table=True)
+        return rep
+
+    wanted = [c for c in validator.rules if c in cols]
+    if wanted:
+        cur = conn.execute(f"SELECT {', '.join(wanted)} FROM {table}")
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            validator.feed(rows, wanted)
+        validator.missing_columns = [c for c in validator.rules if c not in cols]
+    else:
+        validator.rows_total = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    keys = list(UNIQUE_KEYS.get(table, []) if unique is None else unique)
+    keys += [(c,) for c in wanted if validator.rules[c].get("unique")]
+    for key in keys:
+        try:
+            validator.duplicates[", ".join(key)] = duplicate_counts(conn, table, key)
+        except sqlite3.OperationalError:
+            validator.missing_columns.append(", ".join(key))     # chiave su colonne assenti
+    rep = validator.report()
+    rep["table"] = table
+    return rep
+
 
 def validate_data():
     conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
 
     print("🔍 Inizio validazione dati...")
+    reports = [validate_table(conn), validate_table(conn, "video_observations", SNAPSHOT_RULES)]
+    conn.close()
 
-    # 1. Controllo duplicati
-    df = pd.read_sql_query("SELECT * FROM youtube_ads", conn)
-    duplicated = df[df.duplicated(subset=['video_id'], keep=False)]
-    if not duplicated.empty:
-        print(f"⚠️  Duplicati trovati: {len(duplicated)}")
-    else:
-        print("✅ Nessun duplicato trovato")
+    for rep in reports:
+        print(f"\n📋 {rep['table']}")
+        if rep.get("missing_table"):
+            print("⚠️  Tabella mancante")
+            continue
+        print(f"- righe analizzate: {rep['rows_total']}")
+        for col in rep["missing_columns"]:
+            print(f"⚠️  Colonna '{col}' mancante")
+        if not rep["columns"] and not rep["duplicates"]:
+            print("✅ Nessuna anomalia trovata")
+        for col, counts in rep["columns"].items():
+            for kind, n in counts.items():
+                print(f"⚠️  {col}: {n} {kind}")
+        for key, n in rep["duplicates"].items():
+            print(f"⚠️  ({key}): {n} righe duplicate")
 
-    # 2. Controllo valori nulli
-    null_counts = df.isnull().sum()
-    if null_counts.any():
-        print("⚠️  Valori nulli trovati:")
-        print(null_counts[null_counts > 0])
-    else:
-        print("✅ Nessun valore nullo trovato")
-
-    # 3. Controllo timestamp e date
-    if 'published_at' in df.columns:
-        invalid_dates = df[~df['published_at'].str.match(r'^\d{4}-\d{2}-\d{2}')].shape[0]
-        if invalid_dates > 0:
-            print(f"⚠️  Date non valide trovate: {invalid_dates}")
-        else:
-            print("✅ Tutte le date valide")
-    else:
-        print("⚠️  Colonna 'published_at' mancante")
-
-    # 4. Controllo numeri negativi (views, likes, ecc.)
-    numeric_cols = [col for col in ['views', 'likes', 'comments'] if col in df.columns]
-    for col in numeric_cols:
-        negatives = (df[col] < 0).sum()
-        if negatives > 0:
-            print(f"⚠️  {negatives} valori negativi trovati in '{col}'")
-        else:
-            print(f"✅ Nessun valore negativo in '{col}'")
-
-    print("\n🎯 Validazione completata con successo!")
-    conn.close()
+    ok = all(rep["ok"] for rep in reports)
+    print("\n🎯 Validazione completata con successo!" if ok else "\n⚠️  Validazione completata con anomalie.")
+    return reports
 
 if __name__ == "__main__":
-    validate_data()
\ No newline at end of file
+    validate_data()
@@ -1,8 +1,11 @@
 import os
-import sqlite3
 import requests
-from datetime import datetime, timezone
+from typing import Iterator
 from dotenv import load_dotenv
+from storage import StorageWriter, now_estrazione
+from quota import QuotaLedger, QuotaExhausted, is_quota_error
+from api_cache import ResponseCache
+from transport import Transport
 
 # Carica variabili da .env (stesso folder del backend)
 load_dotenv()
@@ -11,98 +14,90 @@ YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY") or os.getenv("YOUTUBE_API_KEY".up
 
 SEARCH_URL = "https://www.googleapis.com/youtube/v3/search"
 DETAILS_URL = "https://www.googleapis.com/youtube/v3/videos"
+# videos.list accetta al massimo 50 id per richiesta (costo: 1 unità di quota)
+MAX_IDS_PER_DETAILS = 50
+# search.list restituisce al massimo 50 risultati per pagina
+MAX_RESULTS_PER_PAGE = 50
 
-SCHEMA_SQL = """
-CREATE TABLE IF NOT EXISTS youtube_ads (
-    video_id TEXT PRIMARY KEY,
-    titolo TEXT,
-    canale TEXT,
-    data_pubblicazione TEXT,
-    views INTEGER,
-    likes INTEGER,
-    comments INTEGER,
-    region TEXT,
-    keyword TEXT,
-    estrazione TEXT,
-    engagement_rate REAL
-);
-"""
+def build_record(item: dict, keyword: str, region: str, estrazione: str) -> dict:
+    """Converte un item di videos.list nel record atteso da save_to_db."""
+    stats = item.get("statistics", {}) or {}
+    snip = item.get("snippet", {}) or {}
+    views = int(stats.get("viewCount", 0) or 0)
+    likes = int(stats.get("likeCount", 0) or 0)
+    comments = int(stats.get("commentCount", 0) or 0)
+    eng = ((likes + comments) / views * 100.0) if views > 0 else 0.0
+    return {
+        "video_id": item.get("id"),
+        "titolo": snip.get("title", ""),
+        "canale": (snip.get("channelTitle") or "").strip(),
+        "data_pubblicazione": snip.get("publishedAt", ""),
+        "views": views,
+        "likes": likes,
+        "comments": comments,
+        "region": region,
+        "keyword": keyword,
+        "estrazione": estrazione,
+        "engagement_rate": round(eng, 3),
+    }
 
 class YouTubeAds:
-    def __init__(self, api_key: str | None = None, db_path: str = "spyads.db"):
+    def __init__(self, api_key: str | None = None, db_path: str = "spyads.db",
+                 transport: Transport | None = None, ledger: QuotaLedger | None = None,
+                 cache: ResponseCache | None = None, use_cache: bool = True):
         self.api_key = api_key or YOUTUBE_API_KEY
         if not self.api_key:
             raise ValueError("⚠️ API Key di YouTube mancante! Imposta YOUTUBE_API_KEY nel file .env")
         self.db_path = db_path
-        self._ensure_schema()
+        # sessione keep-alive condivisa, con retry/backoff e circuit breaker
+        self.transport = transport or Transport()
+        # ogni chiamata viene addebitata sul ledger della quota giornaliera
+        self.ledger = ledger or QuotaLedger()
+        # risposte già viste servite da disco: un hit non consuma quota
+        self.cache = (cache or ResponseCache()) if use_cache else None
+        # connessione di scrittura persistente, aperta al primo salvataggio
+        self._writer: StorageWriter | None = None
 
     # ---- DB helpers ---------------------------------------------------------
-    def _ensure_schema(self):
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        cur.execute(SCHEMA_SQL)
-        # forza presenza delle colonne chiave anche se tabella esiste già
-        cols = {r[1] for r in cur.execute("PRAGMA table_info(youtube_ads);").fetchall()}
-        needed = {"engagement_rate","estrazione","keyword","region","likes","comments","views",
-                  "video_id","titolo","canale","data_pubblicazione"}
-        if not needed.issubset(cols):
-            # ricrea tabella “morbida”: aggiunge colonne mancanti
-            for col, typ in [
-                ("engagement_rate","REAL"),("estrazione","TEXT"),("keyword","TEXT"),
-                ("region","TEXT"),("likes","INTEGER"),("comments","INTEGER"),
-                ("views","INTEGER"),("titolo","TEXT"),("canale","TEXT"),
-                ("data_pubblicazione","TEXT")
-            ]:
-                if col not in cols:
-                    try:
-                        cur.execute(f"ALTER TABLE youtube_ads ADD COLUMN {col} {typ};")
-                    except sqlite3.OperationalError:
-                        pass
-        conn.commit()
-        conn.close()
-
     def save_to_db(self, items: list[dict]) -> tuple[int,int,int]:
         """Inserisce/aggiorna; ritorna (added, updated, ignored)."""
-        added = updated = ignored = 0
-        conn = sqlite3.connect(self.db_path)
-        cur = conn.cursor()
-        sql = """
-        INSERT INTO youtube_ads (
-            video_id, titolo, canale, data_pubblicazione, views, likes, comments,
-            region, keyword, estrazione, engagement_rate
-        ) VALUES (?,?,?,?,?,?,?,?,?,?,?)
-        ON CONFLICT(video_id) DO UPDATE SET
-            titolo=excluded.titolo,
-            canale=excluded.canale,
-            data_pubblicazione=excluded.data_pubblicazione,
-            views=excluded.views,
-            likes=excluded.likes,
-            comments=excluded.comments,
-            region=excluded.region,
-            keyword=excluded.keyword,
-            estrazione=excluded.estrazione,
-            engagement_rate=excluded.engagement_rate;
-        """
-        for row in items:
-            try:
-                cur.execute(sql, (
-                    row["video_id"], row["titolo"], row["canale"], row["data_pubblicazione"],
-                    row["views"], row["likes"], row["comments"], row["region"], row["keyword"],
-                    row["estrazione"], row["engagement_rate"]
-                ))
-                # se il video esisteva, count come updated
-                updated += 1 if cur.rowcount == 0 else 0
-                added += 1 if cur.rowcount == 1 else 0
-            except sqlite3.IntegrityError:
-                ignored += 1
-            except Exception:
-                ignored += 1
-        conn.commit()
-        conn.close()
-        return added, updated, ignored
+        if self._writer is None:
+            self._writer = StorageWriter(self.db_path)
+        return self._writer.write(items)
+
+    @property
+    def unchanged(self) -> int:
+        """Record identici all'ultimo stato: youtube_ads non riscritta, storico al più allungato."""
+        return self._writer.unchanged if self._writer is not None else 0
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self.cache is not None:
+            self.cache.close()
+        self.ledger.close()
+        self.transport.close()
 
     # ---- YouTube API --------------------------------------------------------
-    def _search_ids(self, keyword: str, region: str, max_results: int = 10) -> list[str]:
+    def _send(self, url: str, params: dict, endpoint: str, headers: dict | None = None) -> requests.Response:
+        # ogni tentativo (retry e richieste condizionali 304 inclusi) va sul ledger
+        r = self.transport.get(url, params, headers, endpoint=endpoint,
+                               before_send=lambda: self.ledger.spend(endpoint))
+        if is_quota_error(r):
+            self.ledger.mark_exhausted()
+            raise QuotaExhausted(f"{endpoint}: quotaExceeded dall'API")
+        r.raise_for_status()
+        return r
+
+    def _get(self, url: str, params: dict, endpoint: str) -> dict:
+        if self.cache is None:
+            return self._send(url, params, endpoint).json()
+        return self.cache.get(endpoint, params, lambda headers: self._send(url, params, endpoint, headers))
+
+    def _search_page(self, keyword: str, region: str, max_results: int = 10,
+                     page_token: str | None = None) -> tuple[list[str], str | None]:
+        """Una pagina di search.list: ritorna (video id, nextPageToken)."""
         params = {
             "part": "snippet",
             "q": keyword,
@@ -111,10 +106,34 @@ class YouTubeAds:
             "maxResults": max_results,
             "key": self.api_key
         }
-        r = requests.get(SEARCH_URL, params=params, timeout=15)
-        r.raise_for_status()
-        data = r.json()
-        return [it["id"]["videoId"] for it in data.get("items", []) if "id" in it and "videoId" in it["id"]]
+        if page_token:
+            params["pageToken"] = page_token
+        data = self._get(SEARCH_URL, params, "search.list")
+        ids = [it["id"]["videoId"] for it in data.get("items", []) if "id" in it and "videoId" in it["id"]]
+        return ids, data.get("nextPageToken")
+
+    def iter_search_pages(self, keyword: str, region: str, depth: int = 500) -> Iterator[list[str]]:
+        """
+        Ricerca paginata: segue nextPageToken e produce gli id pagina per pagina
+        (max MAX_RESULTS_PER_PAGE ciascuna) fino a `depth` risultati o fine dei risultati.
+        In memoria resta solo la pagina corrente. Se la quota finisce a metà
+        solleva QuotaExhausted: le pagine già prodotte restano valide, ma la
+        ricerca è incompleta e va ripetuta dopo il reset.
+        """
+        remaining = depth
+        token = None
+        while remaining > 0:
+            ids, token = self._search_page(keyword, region, min(remaining, MAX_RESULTS_PER_PAGE), token)
+            if ids:
+                yield ids[:remaining]
+                remaining -= len(ids)
+            if not token or not ids:
+                break
+
+    def _search_ids(self, keyword: str, region: str, max_results: int = 10) -> list[str]:
+        if max_results <= MAX_RESULTS_PER_PAGE:
+            return self._search_page(keyword, region, max_results)[0]
+        return [vid for page in self.iter_search_pages(keyword, region, max_results) for vid in page]
 
     def _fetch_details(self, ids: list[str]) -> list[dict]:
         if not ids:
@@ -124,38 +143,35 @@ class YouTubeAds:
             "id": ",".join(ids),
             "key": self.api_key
         }
-        r = requests.get(DETAILS_URL, params=params, timeout=15)
-        r.raise_for_status()
-        return r.json().get("items", [])
+        return self._get(DETAILS_URL, params, "videos.list").get("items", [])
 
     def fetch_videos(self, keyword: str, region: str = "US", max_results: int = 10) -> list[dict]:
         """Ritorna record completi + engagement_rate, pronti per il DB."""
         ids = self._search_ids(keyword, region, max_results=max_results)
         details = self._fetch_details(ids)
-        now_iso = datetime.now(timezone.utc).isoformat()
-        out: list[dict] = []
-        for it in details:
-            stats = it.get("statistics", {}) or {}
-            snip = it.get("snippet", {}) or {}
-            vid = it.get("id")
-            views = int(stats.get("viewCount", 0) or 0)
-            likes = int(stats.get("likeCount", 0) or 0)
-            comments = int(stats.get("commentCount", 0) or 0)
-            eng = ((likes + comments) / views * 100.0) if views > 0 else 0.0
-            out.append({
-                "video_id": vid,
-                "titolo": snip.get("title", ""),
-                "canale": (snip.get("channelTitle") or "").strip(),
-                "data_pubblicazione": snip.get("publishedAt", ""),
-                "views": views,
-                "likes": likes,
-                "comments": comments,
-                "region": region,
-                "keyword": keyword,
-                "estrazione": now_iso,
-                "engagement_rate": round(eng, 3),
-            })
-        return out
+        estrazione = now_estrazione()
+        return [build_record(it, keyword, region, estrazione) for it in details]
+
+    def iter_videos(self, keyword: str, region: str = "US", depth: int = 500) -> Iterator[list[dict]]:
+        """
+        Versione in streaming di fetch_videos per ricerche profonde: ogni pagina
+        di search.list viene subito arricchita (una sola videos.list da <= 50 id)
+        e restituita, così il chiamante può salvarla prima che la ricerca finisca.
+        """
+        estrazione = now_estrazione()
+        for ids in self.iter_search_pages(keyword, region, depth):
+            yield [build_record(it, keyword, region, estrazione) for it in self._fetch_details(ids)]
+
+    def fetch_deep_to_db(self, keyword: str, region: str = "US", depth: int = 500) -> tuple[int,int,int]:
+        """
+        Ricerca profonda con salvataggio pagina per pagina; ritorna (added, updated, ignored).
+        Con la quota esaurita a metà le pagine già salvate restano e QuotaExhausted risale.
+        """
+        totals = [0, 0, 0]
+        for page in self.iter_videos(keyword, region, depth):
+            for i, n in enumerate(self.save_to_db(page)):
+                totals[i] += n
+        return tuple(totals)
 
     # Alias per evitare futuri errori di naming
     def search_videos(self, *args, **kwargs):
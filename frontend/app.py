@@ -1,53 +1,220 @@
+import re
+from datetime import date, timedelta
+
 import streamlit as st
 import pandas as pd
+import plotly.express as px
 import requests
 
 st.set_page_config(page_title="SpyAds Pro – Dashboard", layout="wide")
 
-BACKEND_URL = "http://127.0.0.1:8000/get_youtube_data"
+API_URL = "http://127.0.0.1:8000"
+BACKEND_URL = f"{API_URL}/get_youtube_data"
+CHANNELS_URL = f"{API_URL}/channels"
+CHANGES_URL = f"{API_URL}/changes"
+SEARCH_URL = f"{API_URL}/search"
+ROLLUPS_URL = f"{API_URL}/rollups"
+PAGE_SIZE = 100
+FIELDS = "video_id,titolo,canale,keyword,region,views,likes,comments,engagement_rate,data_pubblicazione,estrazione"
 
 st.title("🎯 SpyAds Pro — Dashboard Performance Video & Ads")
 
 # --- Carica dati dal backend ---
-@st.cache_data(ttl=60)
-def fetch_data():
+def _get_json(url, params=None):
+    """GET con revalidation ETag: se il backend risponde 304 riusa il payload già scaricato."""
+    cache = st.session_state.setdefault("_etag_cache", {})
+    key = (url, tuple(sorted((params or {}).items())))
+    headers = {}
+    if key in cache:
+        headers["If-None-Match"] = cache[key][0]
+    r = requests.get(url, params=params, headers=headers, timeout=10)
+    if r.status_code == 304:
+        return cache[key][1]
+    r.raise_for_status()
+    payload = r.json()
+    if "ETag" in r.headers:
+        cache[key] = (r.headers["ETag"], payload)
+    return payload
+
+def fetch_page(params, url=BACKEND_URL):
     try:
-        r = requests.get(BACKEND_URL, timeout=10)
-        r.raise_for_status()
-        payload = r.json()
+        payload = _get_json(url, params)
         if payload["status"] == "ok":
-            df = pd.DataFrame(payload["data"])
-            return df
-        else:
-            st.error(f"Errore dal backend: {payload['message']}")
-            return pd.DataFrame()
+            return pd.DataFrame(payload["data"]), payload.get("next_cursor"), payload.get("version", 0)
+        st.error(f"Errore dal backend: {payload['message']}")
     except Exception as e:
         st.error(f"Errore di connessione al backend: {e}")
+    return pd.DataFrame(), None, 0
+
+def fetch_changes(since):
+    """Tutte le righe cambiate dopo `since` (più pagine se serve) e la nuova versione."""
+    rows, cursor = [], None
+    while True:
+        params = {"since": since, "fields": FIELDS}
+        if cursor:
+            params["cursor"] = cursor
+        r = requests.get(CHANGES_URL, params=params, timeout=10)
+        r.raise_for_status()
+        payload = r.json()
+        rows += payload["data"]
+        cursor = payload.get("next_cursor")
+        if not cursor:
+            return pd.DataFrame(rows), payload["version"]
+
+def _matches(delta, params):
+    """Applica ai soli record cambiati gli stessi filtri che il backend applica alla pagina."""
+    mask = pd.Series(True, index=delta.index)
+    if "q" in params:
+        # come la ricerca full-text: ogni parola è prefisso di una parola di titolo o canale
+        text = delta["titolo"].fillna("") + " " + delta["canale"].fillna("")
+        for word in params["q"].split():
+            mask &= text.str.contains(r"\b" + re.escape(word), case=False, regex=True)
+    if "canale" in params:
+        mask &= delta["canale"] == params["canale"]
+    return delta[mask]
+
+def merge_changes(page, delta, params, is_last_page):
+    """
+    Fonde nella pagina in cache le righe cambiate: aggiorna quelle già presenti,
+    toglie quelle che non rientrano più nei filtri o nell'intervallo di
+    ordinamento della pagina e inserisce le nuove che vi rientrano. Ritorna
+    None se la pagina va riscaricata: su una pagina intermedia righe entrate
+    o uscite sposterebbero il cursore della successiva, sull'ultima la
+    pagina supererebbe il limite.
+    """
+    sort = params["sort"]
+    if page.empty:
+        page = pd.DataFrame(columns=delta.columns)
+    fitting = _matches(delta, params)
+    if not page.empty:
+        # le righe sopra il massimo appartengono alle pagine precedenti,
+        # quelle sotto il minimo alle successive (salvo sull'ultima pagina)
+        if "cursor" in params:
+            fitting = fitting[fitting[sort] <= page[sort].max()]
+        if not is_last_page:
+            fitting = fitting[fitting[sort] >= page[sort].min()]
+    leaving = page["video_id"].isin(delta["video_id"]) & ~page["video_id"].isin(fitting["video_id"])
+    entering = ~fitting["video_id"].isin(page["video_id"])
+    if not is_last_page and (leaving.any() or entering.any()):
+        return None
+    merged = pd.concat([page[~leaving], fitting], ignore_index=True)
+    merged = merged.drop_duplicates(subset=["video_id"], keep="last")
+    if len(merged) > params.get("limit", PAGE_SIZE):
+        return None
+    return merged.sort_values([sort, "video_id"], ascending=False).reset_index(drop=True)
+
+def load_page(params):
+    """
+    Prima visita: scarica la pagina. Refresh successivi: chiede a /changes solo
+    le righe cambiate dalla versione della pagina e le fonde nella cache (o
+    riscarica la pagina se cambia composizione, vedi merge_changes).
+    L'ordinamento per rilevanza usa /search e si affida all'ETag.
+    """
+    if params["sort"] == "rilevanza":
+        frame, next_cursor, _ = fetch_page({k: v for k, v in params.items() if k != "sort"}, SEARCH_URL)
+        return frame, next_cursor
+    cache = st.session_state.setdefault("_pages", {})
+    key = tuple(sorted(params.items()))
+    entry = cache.get(key)
+    if entry is not None:
+        try:
+            delta, version = fetch_changes(entry["version"])
+        except Exception as e:
+            st.error(f"Errore di sincronizzazione: {e}")
+            return entry["frame"], entry["next_cursor"]
+        frame = entry["frame"] if delta.empty else merge_changes(entry["frame"], delta, params,
+                                                                 entry["next_cursor"] is None)
+        if frame is not None:
+            entry.update(frame=frame, version=version)
+            return frame, entry["next_cursor"]
+    frame, next_cursor, version = fetch_page(params)
+    cache[key] = {"frame": frame, "next_cursor": next_cursor, "version": version}
+    return frame, next_cursor
+
+def fetch_rollups(params):
+    try:
+        return pd.DataFrame(_get_json(ROLLUPS_URL, params)["data"])
+    except Exception as e:
+        st.error(f"Errore nel caricare gli aggregati: {e}")
         return pd.DataFrame()
 
-df = fetch_data()
+def render_rollups(canale):
+    """Grafici dagli aggregati giornalieri del backend: poche righe, qualunque sia lo storico."""
+    dims = {"Keyword": "keyword", "Canale": "canale", "Region": "region", "Giorno": "day"}
+    col_dim, col_days = st.columns(2)
+    dim = dims[col_dim.selectbox("Raggruppa per", list(dims))]
+    days = col_days.slider("Ultimi giorni", 1, 90, 30)
+    params = {"dimension": dim, "since": (date.today() - timedelta(days=days - 1)).isoformat(), "limit": 30}
+    if canale != "Tutti" and dim != "canale":
+        params["canale"] = canale
+    agg = fetch_rollups(params)
+    if agg.empty:
+        st.info("Nessun aggregato nel periodo selezionato.")
+        return
+    plot = px.line if dim == "day" else px.bar
+    st.plotly_chart(plot(agg, x=dim, y="views_mean", title="Views medie per video",
+                         labels={"views_mean": "views medie", dim: ""}), use_container_width=True)
+    er = agg.melt(id_vars=dim, value_vars=["er_p25", "er_p50", "er_p75", "er_p90"],
+                  var_name="percentile", value_name="engagement %")
+    er["percentile"] = er["percentile"].str.replace("er_", "")
+    st.plotly_chart(plot(er, x=dim, y="engagement %", color="percentile",
+                         title="Engagement rate (percentili)", labels={dim: ""},
+                         **({} if dim == "day" else {"barmode": "group"})), use_container_width=True)
+    st.dataframe(agg, use_container_width=True, hide_index=True)
 
-if df.empty:
-    st.warning("⚠️ Nessun dato disponibile. Assicurati che il backend sia attivo.")
-    st.stop()
+def fetch_channels():
+    try:
+        return _get_json(CHANNELS_URL)["data"]
+    except Exception:
+        return []
 
 # --- Filtri laterali ---
 st.sidebar.header("🎛️ Filtri di ricerca")
 
-keyword = st.sidebar.text_input("🔍 Parola chiave (titolo o canale):")
-canale = st.sidebar.selectbox("📺 Canale", ["Tutti"] + sorted(df["canale"].dropna().unique().tolist()))
-ordinamento = st.sidebar.selectbox("📊 Ordina per", ["views", "likes", "comments", "engagement_rate"])
+keyword = st.sidebar.text_input("🔍 Parola chiave (titolo o canale):").strip()
+canale = st.sidebar.selectbox("📺 Canale", ["Tutti"] + fetch_channels())
+ordinamento = st.sidebar.selectbox("📊 Ordina per", (["rilevanza"] if keyword else []) +
+                                   ["views", "likes", "comments", "engagement_rate"])
+# ogni rerun sincronizza la pagina in cache con /changes
+st.sidebar.button("🔄 Aggiorna")
 
-# --- Applica filtri ---
-filtered = df.copy()
+params = {"sort": ordinamento, "limit": PAGE_SIZE, "fields": FIELDS}
 if keyword:
-    filtered = filtered[filtered["titolo"].str.contains(keyword, case=False, na=False) | 
-                        filtered["canale"].str.contains(keyword, case=False, na=False)]
+    params["q"] = keyword
 if canale != "Tutti":
-    filtered = filtered[filtered["canale"] == canale]
+    params["canale"] = canale
+
+# cambio filtri -> si riparte dalla prima pagina
+filters_key = (keyword, canale, ordinamento)
+if st.session_state.get("_filters") != filters_key:
+    st.session_state["_filters"] = filters_key
+    st.session_state["_cursors"] = [None]
+
+tab_video, tab_agg = st.tabs(["📋 Video", "📊 Aggregati"])
+
+# gli aggregati prima della tabella: st.stop() sotto non deve nasconderli
+with tab_agg:
+    render_rollups(canale)
+
+with tab_video:
+    cursors = st.session_state["_cursors"]
+    if cursors[-1]:
+        params["cursor"] = cursors[-1]
+
+    filtered, next_cursor = load_page(params)
+
+    if filtered.empty and len(cursors) == 1:
+        st.warning("⚠️ Nessun dato disponibile. Assicurati che il backend sia attivo.")
+        st.stop()
 
-filtered = filtered.sort_values(by=ordinamento, ascending=False)
+    # --- Mostra risultati ---
+    st.success(f"Pagina {len(cursors)} — {len(filtered)} risultati")
+    st.dataframe(filtered, use_container_width=True)
 
-# --- Mostra risultati ---
-st.success(f"{len(filtered)} risultati trovati")
-st.dataframe(filtered, use_container_width=True)
\ No newline at end of file
+    col_prev, col_next = st.columns(2)
+    if col_prev.button("⬅️ Pagina precedente", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if col_next.button("Pagina successiva ➡️", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()